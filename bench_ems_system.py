@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+EMS-Core v2.0 - Benchmarks
+Aufruf: python bench_ems_system.py [name ...]
+"""
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from core.controllers.shelly import ShellyController
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+def _timeit(func, repeat: int = 2000) -> float:
+    """Mittlere Laufzeit in Mikrosekunden"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+# ============================================================================
+# Shelly Status-Payloads (Gen1 Plug S / Gen2 Plus Plug S, Firmware 2024)
+# ============================================================================
+
+GEN1_STATUS = {
+    "wifi_sta": {"connected": True, "ssid": "iot", "ip": "10.0.0.26", "rssi": -61},
+    "cloud": {"enabled": False, "connected": False},
+    "mqtt": {"connected": False},
+    "time": "21:30", "unixtime": 1769545841, "serial": 4411, "has_update": False,
+    "mac": "C45BBE6B1A2F",
+    "cfg_changed_cnt": 0,
+    "actions_stats": {"skipped": 0},
+    "relays": [{"ison": True, "has_timer": False, "timer_started": 0, "timer_duration": 0,
+                "timer_remaining": 0, "overpower": False, "source": "http"}],
+    "meters": [{"power": 1843.27, "overpower": 0.0, "is_valid": True, "timestamp": 1769549441,
+                "counters": [1841.112, 1840.871, 1842.904], "total": 4120877}],
+    "temperature": 41.3, "overtemperature": False, "tmp": {"tC": 41.3, "tF": 106.34, "is_valid": True},
+    "update": {"status": "idle", "has_update": False, "new_version": "20230913-113421/v1.14.0-gcb84623",
+               "old_version": "20230913-113421/v1.14.0-gcb84623", "beta_version": "20231107-162425/v1.14.1-rc1-g0617c15"},
+    "ram_total": 52064, "ram_free": 39272, "fs_size": 233681, "fs_free": 166664, "uptime": 1234567
+}
+GEN1_RELAY = {"ison": True, "has_timer": False, "timer_started": 0, "timer_duration": 0,
+              "timer_remaining": 0, "overpower": False, "source": "http"}
+GEN1_METER = {"power": 1843.27, "overpower": 0.0, "is_valid": True, "timestamp": 1769549441,
+              "counters": [1841.112, 1840.871, 1842.904], "total": 4120877}
+
+GEN2_SWITCH = {"id": 0, "source": "HTTP_in", "output": True, "apower": 1843.3, "voltage": 231.4,
+               "current": 8.01, "aenergy": {"total": 68711.406, "by_minute": [30721.4, 30719.9, 30722.8],
+                                            "minute_ts": 1769549441},
+               "temperature": {"tC": 44.2, "tF": 111.6}}
+GEN2_STATUS = {
+    "ble": {}, "cloud": {"connected": False}, "mqtt": {"connected": False},
+    "plugs_ui": {},
+    "switch:0": GEN2_SWITCH,
+    "sys": {"mac": "FCB467A6D9C4", "restart_required": False, "time": "21:30", "unixtime": 1769549441,
+            "uptime": 1234567, "ram_size": 260916, "ram_free": 148276, "fs_size": 393216, "fs_free": 110592,
+            "cfg_rev": 17, "kvs_rev": 0, "schedule_rev": 3, "webhook_rev": 0,
+            "available_updates": {"stable": {"version": "1.4.4"}}, "reset_reason": 3},
+    "wifi": {"sta_ip": "10.0.0.27", "status": "got ip", "ssid": "iot", "rssi": -58},
+    "ws": {"connected": False}
+}
+
+
+def bench_shelly_status():
+    """Payload-Groesse und Parse-Zeit: voller Status vs. minimale Endpoints"""
+    gen1 = ShellyController("10.0.0.26", "shelly_plug")
+    gen2 = ShellyController("10.0.0.27", "shelly_plus_1pm")
+
+    cases = [
+        ("gen1 power", gen1, GEN1_STATUS, ('power',), GEN1_METER),
+        ("gen1 state", gen1, GEN1_STATUS, ('state',), GEN1_RELAY),
+        ("gen2 power", gen2, GEN2_STATUS, ('power',), GEN2_SWITCH),
+        ("gen2 state+power", gen2, GEN2_STATUS, ('state', 'power'), GEN2_SWITCH),
+    ]
+
+    print(f"{'case':<18} {'endpoint':<32} {'bytes':>7} {'parse us':>9}")
+    for name, controller, full_payload, fields, minimal_payload in cases:
+        full_path, full_parser = controller._select_endpoint(None)
+        min_path, min_parser = controller._select_endpoint(set(fields))
+        for path, parser, payload in ((full_path, full_parser, full_payload),
+                                      (min_path, min_parser, minimal_payload)):
+            body = json.dumps(payload)
+            micros = _timeit(lambda: parser(json.loads(body)))
+            print(f"{name:<18} {path:<32} {len(body):>7} {micros:>9.1f}")
+
+
+# ============================================================================
+# Device Store: Bulk-Import entdeckter Geraete
+# ============================================================================
+
+def _discovered(count: int):
+    return [{'type': 'shelly_plus_1pm', 'ip': f"10.{i // 65536}.{i // 256 % 256}.{i % 256}",
+             'name': f"Shelly {i}", 'port': 80} for i in range(count)]
+
+
+def bench_device_import():
+    """Bulk-Import: ein Schreibvorgang pro Geraet vs. eine Transaktion (YAML/SQLite)"""
+    from core.device_manager import DeviceManager
+    from core.device_store import SqliteDeviceStore
+
+    def run(count: int, mode: str) -> tuple:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            store = SqliteDeviceStore(str(tmp / "devices.db")) if mode == 'sqlite' else None
+            manager = DeviceManager(str(tmp / "devices.yaml"), str(tmp / "mapping.json"), store=store)
+            devices = _discovered(count)
+            started = time.perf_counter()
+            if mode == 'per-device':
+                for device in devices:
+                    manager.import_discovered_devices([device])
+            else:
+                manager.import_discovered_devices(devices)
+            return time.perf_counter() - started, manager.store.commits
+
+    print(f"{'devices':>8} {'mode':<12} {'commits':>8} {'ms':>10}")
+    for count in (10, 100, 1000):
+        for mode in ('per-device', 'yaml', 'sqlite'):
+            if mode == 'per-device' and count > 100:
+                print(f"{count:>8} {mode:<12} {'-':>8} {'(O(n^2), skipped)':>10}")
+                continue
+            seconds, commits = run(count, mode)
+            print(f"{count:>8} {mode:<12} {commits:>8} {seconds * 1000:>10.1f}")
+
+
+def bench_device_index():
+    """Filter/Suche/Statistik: Index vs. linearer Scan bei 5000 Geraeten"""
+    from core.device_manager import DeviceConfig
+    from core.device_index import DeviceIndex
+
+    types = ('shelly_plug', 'shelly_plus_1pm', 'shelly_pro_4pm', 'sdm630')
+    devices = [DeviceConfig(id=f"dev_{i}", name=f"Geraet {i} Raum {i % 40}", type=types[i % 4],
+                            ip=f"10.{i // 65536}.{i // 256 % 256}.{i % 256}", power=100 + i % 900,
+                            category='heating' if i % 7 == 0 else '', enabled=i % 3 != 0)
+               for i in range(5000)]
+    index = DeviceIndex()
+    started = time.perf_counter()
+    index.rebuild(devices)
+    print(f"index build: {(time.perf_counter() - started) * 1000:.1f}ms for {len(devices)} devices")
+
+    def linear_search(query):
+        return [d for d in devices if query in d.name.lower() or query in d.ip.lower()
+                or query in d.type.lower() or query in d.id.lower()]
+
+    cases = [
+        ("search 'raum 17'", lambda: linear_search('raum 17'), lambda: index.search('raum 17')),
+        ("search '10.0.3.'", lambda: linear_search('10.0.3.'), lambda: index.search('10.0.3.')),
+        ("filter type+enabled", lambda: [d for d in devices if d.type == 'sdm630' and d.enabled],
+         lambda: index.filter(type='sdm630', enabled=True)),
+        ("filter category", lambda: [d for d in devices if d.category == 'heating'],
+         lambda: index.filter(category='heating')),
+        ("statistics by_type", lambda: {t: sum(1 for d in devices if d.type == t) for t in types},
+         lambda: index.counts('type')),
+    ]
+    print(f"{'case':<22} {'results':>8} {'scan us':>10} {'index us':>10}")
+    for name, linear, indexed in cases:
+        assert len(linear()) == len(indexed())
+        print(f"{name:<22} {len(indexed()):>8} {_timeit(linear, 50):>10.1f} {_timeit(indexed, 50):>10.1f}")
+
+
+def bench_config_load():
+    """devices.yaml mit 1000 Geraeten: Python-Loader vs. C-Loader vs. Snapshot"""
+    import yaml
+    from dataclasses import asdict
+    from core.device_manager import DeviceConfig
+    from core.device_store import parse_devices_yaml
+    from core.utils.config_snapshot import ConfigSnapshot
+
+    devices = [asdict(DeviceConfig(id=f"dev_{i}", name=f"Geraet {i}", type='shelly_plug',
+                                   ip=f"10.0.{i // 256}.{i % 256}")) for i in range(1000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "devices.yaml"
+        path.write_text(yaml.safe_dump({'devices': devices}, sort_keys=False))
+        raw = path.read_bytes()
+        warm = ConfigSnapshot(str(Path(tmp) / "snapshot.pickle"))
+        warm.read(path, parse_devices_yaml)
+        warm.save()
+
+        def snapshot_start():
+            ConfigSnapshot(str(Path(tmp) / "snapshot.pickle")).read(path, parse_devices_yaml)
+
+        print(f"{'loader':<22} {'ms':>8}")
+        for name, func in (("yaml.safe_load", lambda: yaml.safe_load(raw)),
+                           ("CSafeLoader", lambda: parse_devices_yaml(raw)),
+                           ("snapshot (warm)", snapshot_start)):
+            print(f"{name:<22} {_timeit(func, 5) / 1000:>8.2f}")
+
+
+def bench_model_serialization():
+    """10000 Geraete: Speicher und /api/devices-Serialisierung (dict-Dataclass + asdict vs. Slots + Fragmente)"""
+    import dataclasses
+    import tracemalloc
+    from core.device_manager import DeviceConfig
+    from core.models.cached import dumps_envelope
+
+    PlainDeviceConfig = dataclasses.make_dataclass('PlainDeviceConfig', [
+        (f.name, f.type, dataclasses.field(default=f.default)) for f in dataclasses.fields(DeviceConfig)])
+
+    def build(cls):
+        return [cls(id=f"dev_{i}", name=f"Geraet {i}", type='shelly_plug', ip=f"10.0.{i // 256}.{i % 256}",
+                    power=100 + i % 900, room=f"Raum {i % 40}", discovered_at='2026-01-01T00:00:00')
+                for i in range(10000)]
+
+    print(f"{'model':<12} {'build ms':>10} {'memory KiB':>12}")
+    for name, cls in (("dataclass", PlainDeviceConfig), ("slots", DeviceConfig)):
+        tracemalloc.start()
+        started = time.perf_counter()
+        devices = build(cls)
+        elapsed = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{name:<12} {elapsed * 1000:>10.1f} {memory / 1024:>12.0f}")
+
+    plain = build(PlainDeviceConfig)
+    slotted = build(DeviceConfig)
+
+    def legacy():
+        return json.dumps({'success': True, 'devices': [dataclasses.asdict(d) for d in plain], 'count': len(plain)})
+
+    def cold():
+        for device in slotted:
+            device.touch()
+        return dumps_envelope('devices', slotted)
+
+    def one_changed():
+        slotted[42].power += 1
+        return dumps_envelope('devices', slotted)
+
+    assert json.loads(legacy())['devices'] == json.loads(dumps_envelope('devices', slotted))['devices']
+    print(f"{'GET /api/devices':<22} {'ms':>8}")
+    for name, func in (("asdict + dumps", legacy), ("fragments (cold)", cold),
+                       ("fragments (1 changed)", one_changed),
+                       ("fragments (warm)", lambda: dumps_envelope('devices', slotted))):
+        print(f"{name:<22} {_timeit(func, 10) / 1000:>8.2f}")
+
+
+def bench_change_feed():
+    """5000 Geraete: kompletter Abruf vs. Delta nach einer Aenderung (Groesse und Dauer)"""
+    from core.device_manager import DeviceConfig, DeviceManager
+    from core.models.cached import dumps_envelope, dumps_list
+
+    class MemoryStore:
+        backend = 'memory'
+
+        def load(self):
+            return [], {}
+
+        def commit(self, devices, mapping, changed=(), removed=()):
+            pass
+
+    manager = DeviceManager(store=MemoryStore())
+    with manager.transaction():
+        for i in range(5000):
+            manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Geraet {i}", type='shelly_plug',
+                                            ip=f"10.0.{i // 256}.{i % 256}", power=100 + i % 900))
+    since = manager.version
+    manager.update_device('dev_42', {'room': 'Keller'})
+
+    def full():
+        return dumps_envelope('devices', manager.get_all_devices())
+
+    def delta():
+        changes = manager.changes_since(since)
+        return json.dumps({'version': changes.version, 'removed': changes.removed}) + dumps_list(changes.changed)
+
+    print(f"{'sync':<10} {'bytes':>10} {'ms':>8}")
+    for name, func in (("full", full), ("delta", delta)):
+        print(f"{name:<10} {len(func()):>10} {_timeit(func, 50) / 1000:>8.3f}")
+
+
+BENCHMARKS = {
+    'shelly_status': bench_shelly_status,
+    'device_import': bench_device_import,
+    'device_index': bench_device_index,
+    'config_load': bench_config_load,
+    'model_serialization': bench_model_serialization,
+    'change_feed': bench_change_feed,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] or list(BENCHMARKS)
+    for bench_name in selected:
+        print(f"\n=== {bench_name} ===")
+        BENCHMARKS[bench_name]()
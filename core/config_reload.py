@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+EMS-Core v2.0 - Config Reload
+Hot Reload: geaenderte Konfigurationsdateien im laufenden Betrieb uebernehmen
+
+Der FileWatcher meldet geaenderte Dateien, die Manager vergleichen den neuen
+Stand mit dem Live-Modell und uebernehmen nur hinzugefuegte, entfernte und
+geaenderte Eintraege. Unveraenderte Geraete/Quellen behalten ihre Objekte,
+Controller-Verbindungen und Zustaende; der Optimizer-Loop laeuft weiter.
+"""
+import logging
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from core.models.diff import ConfigDiff
+from core.utils.file_watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+
+class ConfigReloader:
+    """Verbindet FileWatcher mit DeviceManager, EnergySourcesManager und Scheduler"""
+
+    def __init__(self,
+                 device_manager=None,
+                 energy_manager=None,
+                 scheduler=None,
+                 on_devices_changed: Optional[Callable[[ConfigDiff], None]] = None,
+                 interval: float = 2.0,
+                 debounce: float = 0.3,
+                 use_inotify: bool = True):
+        """
+        Args:
+            device_manager: Devices aus dessen Store (devices.yaml / SQLite)
+            energy_manager: energy_sources.json
+            scheduler: schedules.json
+            on_devices_changed: Nach einem Device-Reload (z.B. Laufzeit-Zustand entfernter Devices verwerfen)
+            interval: Polling-Intervall, falls inotify nicht verfuegbar ist
+            debounce: Sammelzeit fuer zusammengehoerige Datei-Events
+            use_inotify: False = immer Polling
+        """
+        self.device_manager = device_manager
+        self.on_devices_changed = on_devices_changed
+        if device_manager is not None and on_devices_changed is not None:
+            # Auch Reloads vor eigenen Schreibvorgaengen (DeviceManager._sync_from_disk)
+            device_manager.reload_listeners.append(on_devices_changed)
+        self.handlers: Dict[Path, Tuple[str, Callable[[], ConfigDiff], Path]] = {}
+        if device_manager is not None:
+            files = device_manager.store.watch_files()
+            for path in files:
+                # Nebendateien (Mapping, SQLite-WAL) duerfen fehlen - massgeblich ist die erste
+                self._add(path, 'devices', self._reload_devices, required=files[0])
+        if energy_manager is not None:
+            self._add(energy_manager.config_file, 'energy_sources', energy_manager.reload_sources)
+        if scheduler is not None:
+            self._add(scheduler.config_path, 'schedules', scheduler.reload_schedules)
+
+        self.stats = {'reloads': 0, 'errors': 0}
+        self.last_diffs: Dict[str, ConfigDiff] = {}
+        self.watcher = FileWatcher(self.handlers, self.reload, interval=interval,
+                                   debounce=debounce, use_inotify=use_inotify)
+
+    def _add(self, path, name: str, handler: Callable[[], ConfigDiff], required=None):
+        self.handlers[Path(path).absolute()] = (name, handler, Path(required or path).absolute())
+
+    def _reload_devices(self) -> ConfigDiff:
+        return self.device_manager.reload_devices()
+
+    def reload(self, paths: Iterable) -> Dict[str, ConfigDiff]:
+        """
+        Geaenderte Dateien neu laden (je Bereich einmal)
+
+        Fehlende oder ungueltige Dateien werden ignoriert - der bisherige
+        Stand bleibt aktiv, bis eine gueltige Version vorliegt.
+        """
+        diffs: Dict[str, ConfigDiff] = {}
+        for path in paths:
+            path = Path(path).absolute()
+            if path not in self.handlers:
+                continue
+            name, handler, required = self.handlers[path]
+            if name in diffs:
+                continue
+            if not required.exists():
+                logger.warning(f"Config file {required.name} missing, keeping current {name}")
+                continue
+            try:
+                diffs[name] = handler()
+                self.stats['reloads'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"✗ Reload of {path.name} failed, keeping current {name}: {e}")
+        self.last_diffs.update(diffs)
+        return diffs
+
+    async def run(self):
+        """Dateien beobachten bis stop()"""
+        await self.watcher.run()
+
+    def stop(self):
+        self.watcher.stop()
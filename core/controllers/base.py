@@ -1 +1,81 @@
-# [CONTROLLER CODE FROM ARTIFACT]
+#!/usr/bin/env python3
+"""
+EMS-Core v2.0 - Base Controller
+Gemeinsame Schnittstelle aller Geraete-Controller
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, FrozenSet, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Faehigkeiten (Capabilities) eines Controllers
+CAP_STATE = "state"          # Schaltzustand lesen
+CAP_POWER = "power"          # Leistung messen
+CAP_SWITCH = "switch"        # Ein-/Ausschalten
+CAP_BATCH_READ = "batch_read"  # Mehrere Kanaele mit einem Request lesen
+
+
+class BaseController(ABC):
+    """
+    Basis fuer alle Controller
+
+    Implementierungen melden ueber `capabilities`, was sie koennen; Aufrufer
+    pruefen das mit `supports()` statt den Geraete-Typ zu vergleichen.
+    """
+
+    capabilities: FrozenSet[str] = frozenset()
+
+    def supports(self, capability: str) -> bool:
+        """Unterstuetzt der Controller diese Faehigkeit?"""
+        return capability in self.capabilities
+
+    def hold_remaining(self) -> float:
+        """Sekunden bis der naechste Schaltbefehl erlaubt ist (Rate-Limit)"""
+        return 0.0
+
+    @property
+    def unit_key(self) -> str:
+        """Schluessel des physischen Geraets (Kanaele eines Geraets teilen ihn)"""
+        return str(id(self))
+
+    @property
+    def channel(self) -> int:
+        """Kanal dieses Controllers auf dem physischen Geraet"""
+        return 0
+
+    @abstractmethod
+    async def get_status(self, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """Status (mind. 'online', 'state', 'power') oder None wenn nicht erreichbar"""
+
+    async def get_state(self) -> Optional[str]:
+        """Schaltzustand on/off (None wenn unbekannt)"""
+        status = await self.get_status(fields=('state',))
+        return status.get('state') if status else None
+
+    async def get_power(self) -> Optional[float]:
+        """Aktuelle Leistung in W (None wenn unbekannt)"""
+        status = await self.get_status(fields=('power',))
+        return status.get('power') if status else None
+
+    async def turn_on(self) -> bool:
+        """Schalte ein"""
+        logger.error(f"{type(self).__name__} does not support switching")
+        return False
+
+    async def turn_off(self) -> bool:
+        """Schalte aus"""
+        logger.error(f"{type(self).__name__} does not support switching")
+        return False
+
+    async def read_batch(self, channels: Iterable[int]) -> Optional[Dict[int, Dict]]:
+        """Status mehrerer Kanaele des physischen Geraets"""
+        status = await self.get_status(fields=('state', 'power'))
+        if status is None:
+            return None
+        return {channel: status for channel in channels}
+
+    async def test_connection(self) -> bool:
+        """Ist das Geraet erreichbar?"""
+        status = await self.get_status(fields=('online',))
+        return status is not None and status.get('online', False)
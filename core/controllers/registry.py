@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+EMS-Core v2.0 - Controller Registry
+Typ -> Controller-Factory, plus Cache einer Controller-Instanz pro Device
+"""
+import logging
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from core.controllers.base import BaseController
+from core.controllers.shelly import ShellyController
+
+logger = logging.getLogger(__name__)
+
+ControllerFactory = Callable[[object], BaseController]
+
+
+class ControllerRegistry:
+    """
+    Registry fuer Controller-Implementierungen
+
+    - `register(type, factory)`: exakter Typ ("sg_ready") oder Prefix ("shelly_*")
+    - `get(device)`: gecachte Instanz pro Device, neu erzeugt nur wenn sich
+      Typ/IP/Port/Kanal des Devices geaendert haben
+    - Devices ohne IP bekommen nur Controller virtueller Typen
+      (`requires_ip=False`, z.B. SG-Ready ueber zwei Relais-Devices)
+    """
+
+    def __init__(self):
+        self.factories: Dict[str, ControllerFactory] = {}
+        self.prefix_factories: Dict[str, ControllerFactory] = {}
+        self.instances: Dict[str, Tuple[tuple, BaseController]] = {}
+        self.virtual_types: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def register(self, device_type: str, factory: ControllerFactory, requires_ip: bool = True):
+        """
+        Registriere Factory fuer einen Typ (Suffix '*' = Prefix-Match)
+
+        Args:
+            requires_ip: False fuer virtuelle Typen ohne eigene Adresse
+                (nur exakte Typen)
+        """
+        if not requires_ip:
+            self.virtual_types.add(device_type)
+        if device_type.endswith('*'):
+            self.prefix_factories[device_type[:-1]] = factory
+        else:
+            self.factories[device_type] = factory
+
+    def factory_for(self, device_type: str) -> Optional[ControllerFactory]:
+        """Finde Factory fuer einen Geraete-Typ"""
+        factory = self.factories.get(device_type)
+        if factory is None:
+            for prefix, prefix_factory in self.prefix_factories.items():
+                if device_type.startswith(prefix):
+                    return prefix_factory
+        return factory
+
+    @staticmethod
+    def _fingerprint(device) -> tuple:
+        return (device.type, device.ip, device.port, getattr(device, 'channel', 0))
+
+    def get(self, device) -> Optional[BaseController]:
+        """Hole (gecachten) Controller fuer ein Device, None wenn Typ nicht unterstuetzt"""
+        fingerprint = self._fingerprint(device)
+        cached = self.instances.get(device.id)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        factory = self.factory_for(device.type)
+        if factory is None or (not device.ip and device.type not in self.virtual_types):
+            return None
+
+        # Factory ausserhalb des Locks: sie darf selbst Controller ueber die
+        # Registry holen (z.B. SG-Ready -> Relais)
+        controller = factory(device)
+        if controller is None:
+            return None
+
+        with self._lock:
+            cached = self.instances.get(device.id)
+            if cached and cached[0] == fingerprint:
+                return cached[1]  # parallel erzeugt - erste Instanz gewinnt
+            self.instances[device.id] = (fingerprint, controller)
+        logger.debug(f"Created {type(controller).__name__} for {device.id}")
+        return controller
+
+    def invalidate(self, device_id: Optional[str] = None):
+        """Verwerfe gecachte Instanz(en)"""
+        with self._lock:
+            if device_id is None:
+                self.instances.clear()
+            else:
+                self.instances.pop(device_id, None)
+
+    def supports(self, device, capability: str) -> bool:
+        """Unterstuetzt der Controller des Devices diese Faehigkeit?"""
+        controller = self.get(device)
+        return controller is not None and controller.supports(capability)
+
+
+# Prozessweite Registry mit den eingebauten Controllern
+controller_registry = ControllerRegistry()
+controller_registry.register('shelly_*', lambda d: ShellyController(d.ip, d.type, d.channel))
@@ -5,9 +5,14 @@ Steuerung von SG-Ready Waermepumpen ueber 2 Relais
 """
 import asyncio
 import logging
-from typing import Optional
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from enum import Enum
 
+from core.controllers.base import BaseController, CAP_STATE, CAP_SWITCH
+from core.integrations.state_cache import DeviceStateCache, state_cache
+from core.utils.async_bridge import run_sync
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,88 +24,176 @@ class SGReadyMode(Enum):
     FORCED = "forced"              # Relay1=EIN, Relay2=EIN (Forcierter Betrieb)
 
 
-class SGReadyController:
+# Relais-Zustaende (Relay1, Relay2) je Modus
+MODE_RELAYS: Dict[SGReadyMode, Tuple[bool, bool]] = {
+    SGReadyMode.OFF: (False, False),
+    SGReadyMode.NORMAL: (False, False),
+    SGReadyMode.RECOMMENDED: (True, False),
+    SGReadyMode.FORCED: (True, True),
+}
+
+# Ein Schritt = Relais-Operationen, die gleichzeitig laufen duerfen
+Step = List[Tuple[int, bool]]
+
+
+def _is_valid(relays: Tuple[Optional[bool], Optional[bool]]) -> bool:
+    """
+    Relay1 AUS / Relay2 EIN ist ungueltig und darf nie (auch nicht kurz)
+    anliegen. Gueltig nur, wenn keine moegliche Belegung (None = unbekannt)
+    diesen Zustand ergibt.
+    """
+    r1, r2 = relays
+    return not (r1 in (False, None) and r2 in (True, None))
+
+
+def plan_transition(current: Tuple[Optional[bool], Optional[bool]],
+                    target: Tuple[bool, bool]) -> List[Step]:
+    """
+    Plane den Uebergang zwischen zwei Relais-Zustaenden
+
+    Relais, die schon im Ziel sind, werden nicht geschaltet (unbekannt =
+    schalten). Zwei Operationen laufen parallel, wenn jede Zwischenstufe
+    gueltig ist, sonst nacheinander in der sicheren Reihenfolge.
+
+    Returns:
+        Liste von Schritten [(Relais-Index, Ein?)], nacheinander auszufuehren
+    """
+    ops = [(i, target[i]) for i in (0, 1) if current[i] != target[i]]
+    if len(ops) < 2:
+        return [ops] if ops else []
+
+    def after(index: int):
+        relays = list(current)
+        relays[index] = target[index]
+        return tuple(relays)
+
+    first_valid = [_is_valid(after(i)) for i in (0, 1)]
+    if all(first_valid):
+        return [ops]
+    first = 0 if first_valid[0] else 1
+    return [[ops[first]], [ops[1 - first]]]
+
+
+class SGReadyController(BaseController):
     """
     Controller fuer SG-Ready Waermepumpen
-    
+
     SG-Ready nutzt 2 Eingaenge (gesteuert durch 2 Relais):
     - Eingang 1 (Relay1): Einschaltsignal
     - Eingang 2 (Relay2): Zwangseinschaltung
-    
+
     Modi:
     - OFF:         E1=0, E2=0 (EVU-Sperre, WP aus)
     - NORMAL:      E1=0, E2=0 (Normalbetrieb nach eigenem Regelverhalten)
     - RECOMMENDED: E1=1, E2=0 (Empfohlener Betrieb, z.B. bei PV-Ueberschuss)
     - FORCED:      E1=1, E2=1 (Zwangseinschaltung, WP laeuft definitiv)
+
+    Als Last im Optimizer: EIN = `on_mode` (Standard RECOMMENDED), AUS = NORMAL.
+    Moduswechsel sind auf einen pro `min_mode_interval` Sekunden begrenzt.
     """
-    
-    def __init__(self, relay1_controller, relay2_controller):
+
+    capabilities = frozenset({CAP_STATE, CAP_SWITCH})
+
+    def __init__(self, relay1_controller, relay2_controller,
+                 min_mode_interval: float = 0.0,
+                 on_mode: SGReadyMode = SGReadyMode.RECOMMENDED,
+                 cache: Optional[DeviceStateCache] = None,
+                 cache_max_age: float = 10.0):
         """
         Args:
             relay1_controller: Controller fuer Relais 1 (Einschaltsignal)
             relay2_controller: Controller fuer Relais 2 (Zwangseinschaltung)
+            min_mode_interval: Mindestabstand zwischen Moduswechseln (Sekunden)
+            on_mode: Modus fuer turn_on()
+            cache: State-Cache (frische Relais-Zustaende ersparen den Request)
+            cache_max_age: Max. Alter eines Cache-Eintrags (Sekunden)
         """
         self.relay1 = relay1_controller
         self.relay2 = relay2_controller
         self.current_mode = SGReadyMode.NORMAL
-    
-    async def set_mode(self, mode: SGReadyMode) -> bool:
-        """Setze SG-Ready Modus"""
+        self.min_mode_interval = min_mode_interval
+        self.on_mode = on_mode
+        self.cache = cache or state_cache
+        self.cache_max_age = cache_max_age
+        self.mode_changed_at: Optional[float] = None
+
+    def hold_remaining(self) -> float:
+        """Sekunden bis der naechste Moduswechsel erlaubt ist"""
+        if self.mode_changed_at is None:
+            return 0.0
+        return max(0.0, self.mode_changed_at + self.min_mode_interval - time.monotonic())
+
+    async def _read_relay(self, relay) -> Optional[bool]:
+        """Relais-Zustand aus dem State-Cache, sonst per Request"""
+        ip = getattr(relay, 'ip', None)
+        if ip:
+            cached = self.cache.get(ip, relay.channel, max_age=self.cache_max_age)
+            if cached:
+                return cached['state'] == 'on'
+        state = await relay.get_state()
+        if state is None:
+            return None
+        return state == 'on'
+
+    async def read_relays(self) -> Tuple[Optional[bool], Optional[bool]]:
+        """Beide Relais parallel lesen (None = unbekannt)"""
+        r1, r2 = await asyncio.gather(self._read_relay(self.relay1), self._read_relay(self.relay2))
+        return r1, r2
+
+    async def _switch(self, index: int, on: bool) -> bool:
+        relay = self.relay1 if index == 0 else self.relay2
+        success = await (relay.turn_on() if on else relay.turn_off())
+        if success and getattr(relay, 'ip', None):
+            self.cache.update(relay.ip, relay.channel, state='on' if on else 'off', source='poll')
+        return success
+
+    async def set_mode(self, mode: SGReadyMode, force: bool = False) -> bool:
+        """
+        Setze SG-Ready Modus
+
+        Args:
+            force: Rate-Limit ignorieren (z.B. EVU-Sperre)
+        """
         try:
-            logger.info(f"Setting SG-Ready mode to: {mode.value}")
-            
-            if mode == SGReadyMode.OFF:
-                # EVU-Sperre: Beide AUS
-                success1 = await self.relay1.turn_off()
-                success2 = await self.relay2.turn_off()
-                
-            elif mode == SGReadyMode.NORMAL:
-                # Normalbetrieb: Beide AUS
-                success1 = await self.relay1.turn_off()
-                success2 = await self.relay2.turn_off()
-                
-            elif mode == SGReadyMode.RECOMMENDED:
-                # Empfohlener Betrieb: Relay1 EIN, Relay2 AUS
-                success1 = await self.relay1.turn_on()
-                success2 = await self.relay2.turn_off()
-                
-            elif mode == SGReadyMode.FORCED:
-                # Zwangsbetrieb: Beide EIN
-                success1 = await self.relay1.turn_on()
-                success2 = await self.relay2.turn_on()
-            
-            else:
-                logger.error(f"Unknown SG-Ready mode: {mode}")
-                return False
-            
-            if success1 and success2:
-                self.current_mode = mode
-                logger.info(f"✓ SG-Ready mode set to: {mode.value}")
-                return True
-            else:
-                logger.error(f"✗ Failed to set SG-Ready mode to: {mode.value}")
+            hold = self.hold_remaining()
+            if mode != self.current_mode and hold > 0 and not force:
+                logger.warning(f"SG-Ready mode change to {mode.value} rate limited ({hold:.0f}s left)")
                 return False
-                
+
+            logger.info(f"Setting SG-Ready mode to: {mode.value}")
+            plan = plan_transition(await self.read_relays(), MODE_RELAYS[mode])
+
+            for step in plan:
+                results = await asyncio.gather(*(self._switch(index, on) for index, on in step))
+                if not all(results):
+                    # Abbruch: naechster Schritt koennte einen ungueltigen Zustand erzeugen
+                    logger.error(f"✗ Failed to set SG-Ready mode to: {mode.value}")
+                    return False
+
+            if mode != self.current_mode:
+                self.mode_changed_at = time.monotonic()
+            self.current_mode = mode
+            logger.info(f"✓ SG-Ready mode set to: {mode.value} ({sum(len(s) for s in plan)} relay ops)")
+            return True
+
         except Exception as e:
             logger.error(f"✗ SG-Ready set_mode failed: {e}")
             return False
-    
+
     async def get_current_mode(self) -> SGReadyMode:
-        """Hole aktuellen Modus (liest Relay-Status)"""
+        """Hole aktuellen Modus (liest beide Relais parallel)"""
         try:
-            status1 = await self.relay1.get_status()
-            status2 = await self.relay2.get_status()
-            
-            if not status1 or not status2:
+            relay1_on, relay2_on = await self.read_relays()
+
+            if relay1_on is None or relay2_on is None:
                 logger.warning("Could not read relay status, returning cached mode")
                 return self.current_mode
-            
-            relay1_on = status1.get('state') == 'on'
-            relay2_on = status2.get('state') == 'on'
-            
+
             # Dekodiere Modus basierend auf Relay-Zustaenden
             if not relay1_on and not relay2_on:
-                return SGReadyMode.NORMAL  # oder OFF - sind identisch
+                if self.current_mode == SGReadyMode.OFF:
+                    return SGReadyMode.OFF  # identisch mit NORMAL
+                return SGReadyMode.NORMAL
             elif relay1_on and not relay2_on:
                 return SGReadyMode.RECOMMENDED
             elif relay1_on and relay2_on:
@@ -109,46 +202,87 @@ class SGReadyController:
                 # relay1_off und relay2_on - sollte nicht vorkommen
                 logger.warning("Invalid SG-Ready state detected")
                 return self.current_mode
-                
+
         except Exception as e:
             logger.error(f"✗ SG-Ready get_current_mode failed: {e}")
             return self.current_mode
-    
+
+    async def get_status(self, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """BaseController: EIN = RECOMMENDED/FORCED"""
+        mode = await self.get_current_mode()
+        return {
+            'online': True,
+            'state': 'on' if mode in (SGReadyMode.RECOMMENDED, SGReadyMode.FORCED) else 'off',
+            'mode': mode.value
+        }
+
+    async def turn_on(self) -> bool:
+        """BaseController: Ueberschuss-Betrieb"""
+        return await self.set_mode(self.on_mode)
+
+    async def turn_off(self) -> bool:
+        """BaseController: zurueck in Normalbetrieb"""
+        return await self.set_mode(SGReadyMode.NORMAL)
+
     async def enable_pv_mode(self) -> bool:
         """Aktiviere PV-Ueberschuss-Modus (RECOMMENDED)"""
         return await self.set_mode(SGReadyMode.RECOMMENDED)
-    
+
     async def disable_pv_mode(self) -> bool:
         """Deaktiviere PV-Ueberschuss-Modus (zurueck zu NORMAL)"""
         return await self.set_mode(SGReadyMode.NORMAL)
-    
+
     async def force_on(self) -> bool:
         """Erzwinge Betrieb (FORCED)"""
         return await self.set_mode(SGReadyMode.FORCED)
-    
+
     async def evu_lock(self) -> bool:
-        """Aktiviere EVU-Sperre (OFF)"""
-        return await self.set_mode(SGReadyMode.OFF)
-    
+        """Aktiviere EVU-Sperre (OFF) - nicht rate-limitiert"""
+        return await self.set_mode(SGReadyMode.OFF, force=True)
+
     async def test_connection(self) -> bool:
         """Test ob beide Relais erreichbar sind"""
         try:
-            test1 = await self.relay1.test_connection()
-            test2 = await self.relay2.test_connection()
+            test1, test2 = await asyncio.gather(self.relay1.test_connection(), self.relay2.test_connection())
             return test1 and test2
-            
+
         except Exception as e:
             logger.error(f"✗ SG-Ready connection test failed: {e}")
             return False
 
 
+def register_sg_ready(registry, get_device: Callable[[str], object], config: Dict):
+    """
+    Registriere den Device-Typ 'sg_ready' mit den Relais aus settings.yaml
+
+    Das SG-Ready-Device ist virtuell (keine eigene IP); Zustand und Cache
+    laufen ueber die beiden Relais-Devices.
+
+    Args:
+        registry: ControllerRegistry
+        get_device: device_id -> DeviceConfig
+        config: Abschnitt `sg_ready` (relay1_id, relay2_id, min_mode_interval, on_mode)
+    """
+    def factory(device):
+        relay1 = get_device(config.get('relay1_id'))
+        relay2 = get_device(config.get('relay2_id'))
+        controller1 = registry.get(relay1) if relay1 else None
+        controller2 = registry.get(relay2) if relay2 else None
+        if controller1 is None or controller2 is None:
+            logger.error(f"✗ SG-Ready {device.id}: relay devices not found")
+            return None
+        return SGReadyController(
+            controller1, controller2,
+            min_mode_interval=config.get('min_mode_interval', 600),
+            on_mode=SGReadyMode(config.get('on_mode', 'recommended'))
+        )
+
+    registry.register('sg_ready', factory, requires_ip=False)
+
+
 # Synchrone Wrapper fuer Flask
 def set_mode_sync(relay1_controller, relay2_controller, mode: str) -> bool:
     """Synchrone Version von set_mode"""
     sg = SGReadyController(relay1_controller, relay2_controller)
     mode_enum = SGReadyMode(mode)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(sg.set_mode(mode_enum))
-    loop.close()
-    return result
+    return run_sync(sg.set_mode(mode_enum), timeout=20)
@@ -3,12 +3,18 @@
 EMS-Core v2.0 - Shelly Controller
 Vollstaendige Implementierung fuer Shelly Gen1, Gen2, Plus, Pro
 """
-import aiohttp
 import asyncio
 import logging
-from typing import Optional, Dict
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
 from enum import Enum
 
+from core.controllers.base import (
+    BaseController, CAP_STATE, CAP_POWER, CAP_SWITCH, CAP_BATCH_READ
+)
+from core.utils.health import health_registry, CircuitOpenError, ServerError
+from core.utils.http import get_session
+from core.utils.async_bridge import run_sync
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,23 +24,82 @@ class ShellyGeneration(Enum):
     GEN2 = "gen2"  # Shelly Plus, Pro
 
 
-class ShellyController:
+# Felder, die get_status() liefern kann
+STATUS_FIELDS = ('online', 'state', 'power', 'voltage', 'temperature', 'overtemperature', 'has_update')
+
+# Felder, die Gen2 Switch.GetStatus ohne vollen Shelly.GetStatus liefert
+GEN2_SWITCH_FIELDS = {'state', 'power', 'voltage', 'temperature', 'overtemperature'}
+
+
+class ShellyController(BaseController):
     """Controller fuer alle Shelly Devices"""
+
+    capabilities = frozenset({CAP_STATE, CAP_POWER, CAP_SWITCH, CAP_BATCH_READ})
     
-    def __init__(self, ip: str, device_type: str = "shelly_plug"):
+    def __init__(self, ip: str, device_type: str = "shelly_plug", relay_id: int = 0):
+        """
+        Args:
+            ip: IP-Adresse des Shelly
+            device_type: Geraete-Typ (bestimmt die Generation)
+            relay_id: Kanal bei Mehrkanal-Geraeten (2PM, Pro 2/4PM, 2.5)
+        """
         self.ip = ip
         self.device_type = device_type
         self.generation = self._detect_generation(device_type)
-        self.relay_id = 0  # Default relay
+        self.relay_id = relay_id
+
+    @property
+    def unit_key(self) -> str:
+        """Alle Kanaele eines Shelly teilen sich eine IP"""
+        return self.ip
+
+    @property
+    def channel(self) -> int:
+        return self.relay_id
         
     def _detect_generation(self, device_type: str) -> ShellyGeneration:
         """Erkenne Shelly Generation anhand Typ"""
-        gen2_types = ["shelly_plus_1pm", "shelly_pro_1pm", "shelly_pro_3em"]
+        gen2_types = [
+            "shelly_plus_1pm", "shelly_plus_2pm", "shelly_pro_1pm", "shelly_pro_2pm",
+            "shelly_pro_4pm", "shelly_pro_3em"
+        ]
         
         if any(t in device_type for t in gen2_types):
             return ShellyGeneration.GEN2
         return ShellyGeneration.GEN1
     
+    async def _request(self, url: str, action: str) -> Optional[Dict]:
+        """
+        HTTP GET mit Circuit Breaker und adaptivem Timeout
+        
+        Returns:
+            JSON-Antwort oder None (HTTP-Fehler, Timeout, Breaker offen);
+            HTTP 4xx zaehlt fuer den Breaker nicht als Fehler, 5xx schon
+        """
+        async def fetch(timeout: float):
+            import aiohttp  # erst bei Bedarf (Startzeit)
+            session = get_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status >= 500:
+                    raise ServerError(response.status)
+                if response.status != 200:
+                    return response.status, None
+                return response.status, await response.json(content_type=None)
+        
+        try:
+            status, data = await health_registry.call(self.ip, fetch)
+        except CircuitOpenError:
+            logger.debug(f"Shelly {self.ip}: {action} skipped - circuit open")
+            return None
+        except Exception as e:
+            logger.error(f"✗ Shelly {self.ip}: {action} failed - {e}")
+            return None
+        
+        if status != 200:
+            logger.error(f"✗ Shelly {self.ip}: {action} failed (HTTP {status})")
+            return None
+        return data
+    
     async def turn_on(self) -> bool:
         """Schalte Device EIN"""
         try:
@@ -43,15 +108,11 @@ class ShellyController:
             else:  # GEN2
                 url = f"http://{self.ip}/rpc/Switch.Set?id={self.relay_id}&on=true"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    if response.status == 200:
-                        logger.info(f"✓ Shelly {self.ip}: Turned ON")
-                        return True
-                    else:
-                        logger.error(f"✗ Shelly {self.ip}: Failed to turn on (HTTP {response.status})")
-                        return False
-                        
+            if await self._request(url, "Turn on") is None:
+                return False
+            logger.info(f"✓ Shelly {self.ip}: Turned ON")
+            return True
+            
         except Exception as e:
             logger.error(f"✗ Shelly {self.ip}: Turn on failed - {e}")
             return False
@@ -64,47 +125,97 @@ class ShellyController:
             else:  # GEN2
                 url = f"http://{self.ip}/rpc/Switch.Set?id={self.relay_id}&on=false"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    if response.status == 200:
-                        logger.info(f"✓ Shelly {self.ip}: Turned OFF")
-                        return True
-                    else:
-                        logger.error(f"✗ Shelly {self.ip}: Failed to turn off (HTTP {response.status})")
-                        return False
-                        
+            if await self._request(url, "Turn off") is None:
+                return False
+            logger.info(f"✓ Shelly {self.ip}: Turned OFF")
+            return True
+            
         except Exception as e:
             logger.error(f"✗ Shelly {self.ip}: Turn off failed - {e}")
             return False
     
-    async def get_status(self) -> Optional[Dict]:
-        """Hole vollstaendigen Status"""
+    def _select_endpoint(self, fields: Optional[Set[str]]) -> Tuple[str, Callable[[Dict], Dict]]:
+        """
+        Waehle den kleinsten Endpoint, der alle angefragten Felder liefert
+        
+        Returns:
+            (URL-Pfad, Parser)
+        """
+        if fields is not None:
+            needed = fields - {'online'}
+            if self.generation == ShellyGeneration.GEN2:
+                if needed <= GEN2_SWITCH_FIELDS:
+                    return f"/rpc/Switch.GetStatus?id={self.relay_id}", self._parse_switch
+            else:
+                if needed <= {'state'}:
+                    return f"/relay/{self.relay_id}", self._parse_relay
+                if needed <= {'power'}:
+                    return f"/meter/{self.relay_id}", self._parse_meter
+        
+        if self.generation == ShellyGeneration.GEN1:
+            return "/status", self._parse_status
+        return "/rpc/Shelly.GetStatus", self._parse_status
+    
+    async def get_status(self, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        """
+        Hole Status
+        
+        Args:
+            fields: Nur diese Felder liefern (siehe STATUS_FIELDS). Dann wird der
+                    kleinste passende Endpoint abgefragt statt des vollen Status
+                    (Gen2: Switch.GetStatus, Gen1: /relay/N bzw. /meter/N).
+                    None = vollstaendiger Status.
+        """
         try:
-            if self.generation == ShellyGeneration.GEN1:
-                url = f"http://{self.ip}/status"
-            else:  # GEN2
-                url = f"http://{self.ip}/rpc/Shelly.GetStatus"
+            wanted = set(fields) if fields is not None else None
+            path, parser = self._select_endpoint(wanted)
+            
+            data = await self._request(f"http://{self.ip}{path}", "Status request")
+            if data is None:
+                return None
+            
+            status = parser(data)
+            if wanted is not None:
+                status = {key: status[key] for key in status if key in wanted or key == 'online'}
+            return status
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return self._parse_status(data)
-                    else:
-                        logger.error(f"✗ Shelly {self.ip}: Status request failed (HTTP {response.status})")
-                        return None
-                        
         except Exception as e:
             logger.error(f"✗ Shelly {self.ip}: Status request failed - {e}")
             return None
     
-    def _parse_status(self, data: Dict) -> Dict:
-        """Parse Status-Response basierend auf Generation"""
+    async def get_channel_statuses(self, channels: Iterable[int]) -> Optional[Dict[int, Dict]]:
+        """
+        Status mehrerer Kanaele mit einem einzigen Request
+        
+        Der volle Status wird einmal geholt und fuer jeden Kanal geparst.
+        
+        Returns:
+            {Kanal: Status} oder None wenn das Geraet nicht antwortet
+        """
+        try:
+            path, _ = self._select_endpoint(None)
+            data = await self._request(f"http://{self.ip}{path}", "Status request")
+            if data is None:
+                return None
+            return {channel: self._parse_status(data, channel) for channel in channels}
+        
+        except Exception as e:
+            logger.error(f"✗ Shelly {self.ip}: Multi-channel status failed - {e}")
+            return None
+
+    async def read_batch(self, channels: Iterable[int]) -> Optional[Dict[int, Dict]]:
+        """BaseController: Batch-Read = ein Status-Request fuer alle Kanaele"""
+        return await self.get_channel_statuses(channels)
+    
+    def _parse_status(self, data: Dict, channel: Optional[int] = None) -> Dict:
+        """Parse vollstaendige Status-Response basierend auf Generation"""
+        if channel is None:
+            channel = self.relay_id
         try:
             if self.generation == ShellyGeneration.GEN1:
                 # Gen1 Format
-                relay = data.get('relays', [{}])[self.relay_id]
-                meter = data.get('meters', [{}])[self.relay_id] if 'meters' in data else {}
+                relay = data.get('relays', [{}])[channel]
+                meter = data.get('meters', [{}])[channel] if 'meters' in data else {}
                 
                 return {
                     'online': True,
@@ -118,17 +229,9 @@ class ShellyController:
             
             else:  # GEN2
                 # Gen2 Format
-                switch = data.get(f'switch:{self.relay_id}', {})
-                
-                return {
-                    'online': True,
-                    'state': 'on' if switch.get('output', False) else 'off',
-                    'power': switch.get('apower', 0.0),
-                    'voltage': switch.get('voltage', 0.0),
-                    'temperature': switch.get('temperature', {}).get('tC', 0.0),
-                    'overtemperature': False,  # Gen2 hat das nicht direkt
-                    'has_update': False
-                }
+                status = self._parse_switch(data.get(f'switch:{channel}', {}))
+                status['has_update'] = bool(data.get('sys', {}).get('available_updates'))
+                return status
                 
         except Exception as e:
             logger.error(f"✗ Shelly {self.ip}: Failed to parse status - {e}")
@@ -142,10 +245,30 @@ class ShellyController:
                 'has_update': False
             }
     
+    def _parse_switch(self, switch: Dict) -> Dict:
+        """Parse Gen2 Switch-Komponente (Switch.GetStatus bzw. switch:N)"""
+        return {
+            'online': True,
+            'state': 'on' if switch.get('output', False) else 'off',
+            'power': switch.get('apower', 0.0),
+            'voltage': switch.get('voltage', 0.0),
+            'temperature': switch.get('temperature', {}).get('tC', 0.0),
+            'overtemperature': 'overtemp' in switch.get('errors', []),
+            'has_update': False
+        }
+    
+    def _parse_relay(self, relay: Dict) -> Dict:
+        """Parse Gen1 /relay/N"""
+        return {'online': True, 'state': 'on' if relay.get('ison', False) else 'off'}
+    
+    def _parse_meter(self, meter: Dict) -> Dict:
+        """Parse Gen1 /meter/N"""
+        return {'online': True, 'power': meter.get('power', 0.0)}
+    
     async def get_power(self) -> Optional[float]:
-        """Hole nur Power-Wert (schneller)"""
+        """Hole nur Power-Wert (minimaler Endpoint)"""
         try:
-            status = await self.get_status()
+            status = await self.get_status(fields=('power',))
             if status:
                 return status.get('power', 0.0)
             return None
@@ -154,12 +277,19 @@ class ShellyController:
             logger.error(f"✗ Shelly {self.ip}: Power request failed - {e}")
             return None
     
+    async def get_state(self) -> Optional[str]:
+        """Hole nur Schaltzustand (on/off, minimaler Endpoint)"""
+        status = await self.get_status(fields=('state',))
+        if status:
+            return status.get('state')
+        return None
+    
     async def toggle(self) -> bool:
         """Toggle Device (Ein/Aus)"""
         try:
-            status = await self.get_status()
-            if status:
-                if status['state'] == 'on':
+            state = await self.get_state()
+            if state:
+                if state == 'on':
                     return await self.turn_off()
                 else:
                     return await self.turn_on()
@@ -172,7 +302,7 @@ class ShellyController:
     async def test_connection(self) -> bool:
         """Test ob Device erreichbar ist"""
         try:
-            status = await self.get_status()
+            status = await self.get_status(fields=('online',))
             return status is not None and status.get('online', False)
             
         except Exception as e:
@@ -181,46 +311,28 @@ class ShellyController:
 
 
 # Synchrone Wrapper fuer Flask (da Flask nicht async ist)
-def create_controller(ip: str, device_type: str = "shelly_plug") -> ShellyController:
+# Laufen auf dem geteilten Hintergrund-Loop (core.utils.async_bridge)
+SYNC_TIMEOUT = 10
+def create_controller(ip: str, device_type: str = "shelly_plug", relay_id: int = 0) -> ShellyController:
     """Factory fuer Shelly Controller"""
-    return ShellyController(ip, device_type)
+    return ShellyController(ip, device_type, relay_id)
 
 
-def turn_on_sync(ip: str, device_type: str = "shelly_plug") -> bool:
+def turn_on_sync(ip: str, device_type: str = "shelly_plug", relay_id: int = 0) -> bool:
     """Synchrone Version von turn_on"""
-    controller = ShellyController(ip, device_type)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(controller.turn_on())
-    loop.close()
-    return result
+    return run_sync(ShellyController(ip, device_type, relay_id).turn_on(), timeout=SYNC_TIMEOUT)
 
 
-def turn_off_sync(ip: str, device_type: str = "shelly_plug") -> bool:
+def turn_off_sync(ip: str, device_type: str = "shelly_plug", relay_id: int = 0) -> bool:
     """Synchrone Version von turn_off"""
-    controller = ShellyController(ip, device_type)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(controller.turn_off())
-    loop.close()
-    return result
+    return run_sync(ShellyController(ip, device_type, relay_id).turn_off(), timeout=SYNC_TIMEOUT)
 
 
-def get_status_sync(ip: str, device_type: str = "shelly_plug") -> Optional[Dict]:
+def get_status_sync(ip: str, device_type: str = "shelly_plug", relay_id: int = 0) -> Optional[Dict]:
     """Synchrone Version von get_status"""
-    controller = ShellyController(ip, device_type)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(controller.get_status())
-    loop.close()
-    return result
+    return run_sync(ShellyController(ip, device_type, relay_id).get_status(), timeout=SYNC_TIMEOUT)
 
 
-def get_power_sync(ip: str, device_type: str = "shelly_plug") -> Optional[float]:
+def get_power_sync(ip: str, device_type: str = "shelly_plug", relay_id: int = 0) -> Optional[float]:
     """Synchrone Version von get_power"""
-    controller = ShellyController(ip, device_type)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(controller.get_power())
-    loop.close()
-    return result
+    return run_sync(ShellyController(ip, device_type, relay_id).get_power(), timeout=SYNC_TIMEOUT)
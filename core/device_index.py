@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+EMS-Core v2.0 - Device Index
+Sekundaer-Indizes und N-Gramm-Suchindex fuer den DeviceManager
+
+Wird bei add/update/remove inkrementell gepflegt; Filter, Suche und
+Statistik laufen damit ohne Scan ueber alle Geraete.
+
+Geschrieben wird nur unter dem Lock des DeviceManagers. Leser sperren nicht:
+sie kopieren die benoetigten Container zuerst (list()/set() einer Sammlung
+aus Strings laeuft unter dem GIL ohne Unterbrechung) und vertragen IDs,
+die zwischenzeitlich entfernt wurden.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEXED_FIELDS = ('type', 'category', 'priority', 'room', 'enabled', 'can_control')
+SEARCH_FIELDS = ('name', 'ip', 'type', 'id')
+NGRAM = 3
+
+
+def _grams(text: str) -> Set[str]:
+    """Alle Teilstrings der Laenge NGRAM"""
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class DeviceIndex:
+    """
+    Indizes ueber DeviceConfig-Objekte
+
+    - `fields[Feld][Wert]` -> Device-IDs (exakte Filter, Zaehler fuer Statistik)
+    - `grams[Trigramm]` -> Device-IDs (Teilstring-Suche ueber Name/IP/Typ/ID):
+      Schnittmenge der Trigramme der Anfrage, danach exakte Pruefung;
+      kuerzere Anfragen pruefen die vorab kleingeschriebenen Texte direkt
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.fields: Dict[str, Dict[object, Set[str]]] = {f: {} for f in INDEXED_FIELDS}
+        self.grams: Dict[str, Set[str]] = {}
+        self.total_power = 0.0
+        self._entries: Dict[str, Tuple[tuple, Tuple[str, ...], float]] = {}  # ID -> (Feldwerte, Suchtexte, Leistung)
+        self._order: Dict[str, int] = {}   # Einfuege-Reihenfolge (wie DeviceManager.devices)
+        self._sequence = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self, devices: Iterable):
+        """Komplett neu aufbauen (Laden, Rollback)"""
+        self._reset()
+        for device in devices:
+            self.add(device)
+
+    def add(self, device):
+        """Device aufnehmen (bereits bekannte ID -> update)"""
+        if device.id in self._entries:
+            self.remove(device.id, keep_order=True)
+        values = tuple(getattr(device, f) for f in INDEXED_FIELDS)
+        texts = tuple(str(getattr(device, f) or '').lower() for f in SEARCH_FIELDS)
+        power = float(device.power or 0)
+
+        for field, value in zip(INDEXED_FIELDS, values):
+            self.fields[field].setdefault(value, set()).add(device.id)
+        for gram in set().union(*(_grams(t) for t in texts)):
+            self.grams.setdefault(gram, set()).add(device.id)
+        self.total_power += power
+        self._entries[device.id] = (values, texts, power)
+        if device.id not in self._order:
+            self._order[device.id] = self._sequence
+            self._sequence += 1
+
+    def update(self, device):
+        """Nach Aenderung eines Devices (alte Werte stehen im Index)"""
+        self.add(device)
+
+    def remove(self, device_id: str, keep_order: bool = False):
+        entry = self._entries.pop(device_id, None)
+        if entry is None:
+            return
+        values, texts, power = entry
+        for field, value in zip(INDEXED_FIELDS, values):
+            ids = self.fields[field].get(value)
+            if ids is not None:
+                ids.discard(device_id)
+                if not ids:
+                    del self.fields[field][value]
+        for gram in set().union(*(_grams(t) for t in texts)):
+            ids = self.grams.get(gram)
+            if ids is not None:
+                ids.discard(device_id)
+                if not ids:
+                    del self.grams[gram]
+        self.total_power -= power
+        if not self._entries:
+            self.total_power = 0.0  # Rundungsfehler nicht aufsummieren
+        if not keep_order:
+            self._order.pop(device_id, None)
+
+    def ordered(self, ids: Iterable[str]) -> List[str]:
+        """IDs in Einfuege-Reihenfolge"""
+        ids = list(ids)
+        try:
+            return sorted(ids, key=self._order.__getitem__)
+        except KeyError:
+            # Waehrend des Lesens entfernt
+            order = dict(self._order)
+            return sorted((i for i in ids if i in order), key=order.__getitem__)
+
+    def lookup(self, field: str, value) -> Set[str]:
+        return self.fields[field].get(value, set())
+
+    def filter(self, **criteria) -> List[str]:
+        """
+        Device-IDs, die allen Kriterien entsprechen (None = ignorieren)
+
+        Beispiel: filter(type='shelly_plug', enabled=True)
+        """
+        sets = [self.lookup(field, value) for field, value in criteria.items() if value is not None]
+        if not sets:
+            return self.ordered(self._entries)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return self.ordered(result)
+
+    def search(self, query: str) -> List[str]:
+        """Teilstring-Suche (case-insensitive) ueber Name, IP, Typ und ID"""
+        query = query.lower()
+        if not query:
+            return self.ordered(self._entries)
+        entries = dict(self._entries)
+        if len(query) < NGRAM:
+            return self.ordered(i for i, entry in entries.items() if any(query in t for t in entry[1]))
+
+        candidates: Optional[Set[str]] = None
+        for gram in sorted({query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)},
+                           key=lambda g: len(self.grams.get(g, ()))):
+            ids = self.grams.get(gram)
+            if not ids:
+                return []
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        return self.ordered(i for i in candidates
+                            if i in entries and any(query in t for t in entries[i][1]))
+
+    def counts(self, field: str) -> Dict[object, int]:
+        """Anzahl Devices je Wert eines Feldes"""
+        return {value: len(ids) for value, ids in list(self.fields[field].items())}
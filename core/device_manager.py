@@ -5,24 +5,35 @@ Zentrale Verwaltung für Geräte-Mapping und Konfiguration
 """
 import json
 import logging
-import yaml
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, replace
 from datetime import datetime
 
+from core.device_index import DeviceIndex
+from core.device_store import YamlDeviceStore
+from core.models.cached import CachedModel, dumps_list, slotted
+from core.models.diff import ConfigDiff, diff_mappings
+from core.models.registry import CHANGE_LOG_SIZE, RegistryChanges, VersionedRegistry
+from core.utils.file_watcher import file_key
+
 logger = logging.getLogger(__name__)
 
 
+@slotted
 @dataclass
-class DeviceConfig:
-    """Geräte-Konfiguration"""
+class DeviceConfig(CachedModel):
+    """Geräte-Konfiguration (kompakt, JSON-Darstellung gecacht bis zur naechsten Aenderung)"""
     id: str
     name: str
     type: str  # shelly_plug, shelly_1pm, solax, sdm630, etc.
     ip: str
     port: int = 80
+    channel: int = 0  # Relais-Kanal bei Mehrkanal-Geraeten (2PM, Pro 4PM, ...)
     power: float = 0  # Nennleistung in Watt
+    phase: str = ""  # A, B, C (einphasig) oder leer = dreiphasig/unbekannt
     priority: str = "MEDIUM"  # CRITICAL, HIGH, MEDIUM, LOW, OPTIONAL
     can_control: bool = True
     min_runtime: int = 0  # Minuten
@@ -36,108 +47,230 @@ class DeviceConfig:
 
 
 class DeviceManager:
-    """Zentrale Geräte-Verwaltung"""
+    """
+    Zentrale Geräte-Verwaltung
+    
+    `devices` und `device_mapping` sind Copy-on-Write-Registries: Leser
+    (Flask-Threads, Optimizer) sehen ohne Lock immer einen vollstaendigen
+    Stand, Aenderungen ersetzen DeviceConfig-Objekte statt sie zu veraendern
+    und werden pro Mutation bzw. Transaktion als neuer Snapshot veroeffentlicht.
+    Jeder Snapshot traegt eine Version, `changes_since()` liefert die Deltas
+    (Change-Feed fuer Web UI und andere Prozesse).
+    
+    EMS-Prozess und Web UI schreiben denselben Store: hat ihn der andere
+    Prozess seit dem letzten Laden geaendert, wird er vor der naechsten
+    Aenderung neu gelesen, statt den veralteten Stand zurueckzuschreiben.
+    """
     
     def __init__(self, 
                  devices_file: str = "config/devices.yaml",
-                 mapping_file: str = "config/device_mapping.json"):
+                 mapping_file: str = "config/device_mapping.json",
+                 store=None):
+        """
+        Args:
+            devices_file: YAML-Datei (Standard-Store)
+            mapping_file: JSON-Datei IP -> Device ID (Standard-Store)
+            store: Alternativer Store (z.B. SqliteDeviceStore aus open_device_store)
+        """
         self.devices_file = Path(devices_file)
         self.mapping_file = Path(mapping_file)
+        self.store = store or YamlDeviceStore(devices_file, mapping_file)
+        
+        # Schreiber serialisiert (gemeinsamer Lock beider Registries)
+        self._lock = threading.RLock()
+        self.devices = VersionedRegistry(lock=self._lock, history=CHANGE_LOG_SIZE)  # Device ID -> DeviceConfig
+        self.device_mapping = VersionedRegistry(lock=self._lock)   # IP -> Device ID
+        self.index = DeviceIndex()  # Filter/Suche/Statistik ohne Scan
         
-        self.devices: Dict[str, DeviceConfig] = {}
-        self.device_mapping: Dict[str, str] = {}  # IP -> Device ID
+        # Offene Aenderungen (geschrieben bei flush(), in Transaktionen gebuendelt)
+        self._changed: set = set()
+        self._removed: set = set()
+        self._transaction_depth = 0
+        self._snapshot = None
+        
+        # Stand der Store-Dateien beim letzten Laden/Schreiben (extern geaendert?)
+        self._file_key = None
+        # Nach jedem Reload mit Aenderungen aufgerufen (z.B. Controller verwerfen)
+        self.reload_listeners: List[Callable[[ConfigDiff], None]] = []
         
         self.load_devices()
-        self.load_mapping()
     
     def load_devices(self):
-        """Lade Geräte aus YAML"""
-        try:
-            if self.devices_file.exists():
-                with open(self.devices_file, 'r') as f:
-                    data = yaml.safe_load(f)
-                
-                for device_data in data.get('devices', []):
+        """Lade Geräte und IP -> Device ID Mapping aus dem Store"""
+        with self._lock:
+            try:
+                self._file_key = self._store_key()
+                devices, mapping = self.store.load()
+                loaded = {}
+                for device_data in devices:
                     device = DeviceConfig(**device_data)
-                    self.devices[device.id] = device
-                    
-                logger.info(f"Loaded {len(self.devices)} devices from {self.devices_file}")
-            else:
-                logger.warning(f"No devices file found at {self.devices_file}")
-                self.devices = {}
-        except Exception as e:
-            logger.error(f"Failed to load devices: {e}")
-            self.devices = {}
+                    loaded[device.id] = device
+                self.devices.replace_all(loaded)
+                self.device_mapping.replace_all(mapping)
+                self.index.rebuild(loaded.values())
+                logger.info(f"Loaded {len(loaded)} devices, {len(mapping)} mappings "
+                            f"({self.store.backend})")
+            except Exception as e:
+                logger.error(f"Failed to load devices: {e}")
+                self.devices.clear()
+                self.device_mapping.clear()
+                self.index.rebuild([])
     
-    def save_devices(self):
-        """Speichere Geräte als YAML"""
-        try:
-            self.devices_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Convert to dict format
-            devices_list = []
-            for device in self.devices.values():
-                device_dict = asdict(device)
-                # Remove None values
-                device_dict = {k: v for k, v in device_dict.items() if v is not None}
-                devices_list.append(device_dict)
-            
-            data = {'devices': devices_list}
-            
-            with open(self.devices_file, 'w') as f:
-                yaml.dump(data, f, default_flow_style=False, sort_keys=False)
-            
-            logger.info(f"Saved {len(self.devices)} devices to {self.devices_file}")
-        except Exception as e:
-            logger.error(f"Failed to save devices: {e}")
+    def reload_devices(self) -> ConfigDiff:
+        """
+        Store neu lesen und nur Abweichungen uebernehmen (Hot Reload)
+        
+        Unveraenderte Geraete behalten ihr Objekt (und damit Controller und
+        Zustand), zurueckgeschrieben wird nichts.
+        
+        Raises:
+            Exception: Store nicht lesbar (der bisherige Stand bleibt aktiv)
+        """
+        key = self._store_key()
+        devices, mapping = self.store.load()
+        loaded = {}
+        for device_data in devices:
+            device = DeviceConfig(**device_data)
+            loaded[device.id] = device
+        
+        with self._lock:
+            self._file_key = key
+            diff = diff_mappings(self.devices.view(), loaded, key=DeviceConfig.to_json)
+            mapping_changed = dict(self.device_mapping) != mapping
+            if not diff and not mapping_changed:
+                return diff
+            with self.devices.batch(), self.device_mapping.batch():
+                for device_id in diff.removed:
+                    del self.devices[device_id]
+                    self.index.remove(device_id)
+                    self._changed.discard(device_id)
+                for device_id in diff.added + diff.changed:
+                    self.devices[device_id] = loaded[device_id]
+                    self.index.add(loaded[device_id])
+                if mapping_changed:
+                    self.device_mapping.replace_all(mapping)
+        logger.info(f"♻️ Devices reloaded: {diff}")
+        if diff:
+            for listener in self.reload_listeners:
+                listener(diff)
+        return diff
+    
+    def _store_key(self) -> tuple:
+        watch_files = getattr(self.store, 'watch_files', None)  # Stores ohne Dateien: ()
+        return tuple(file_key(path) for path in watch_files()) if watch_files else ()
+    
+    def _sync_from_disk(self):
+        """Vor einer Aenderung: vom anderen Prozess geaenderten Store zuerst uebernehmen"""
+        key = self._store_key()
+        if key and key[0] is not None and key != self._file_key:
+            try:
+                self.reload_devices()
+            except Exception as e:
+                logger.error(f"✗ Reload of device store failed: {e}")
+    
+    @property
+    def version(self) -> int:
+        """Version des aktuellen Geraete-Stands (steigt mit jeder Aenderung)"""
+        return self.devices.version
+    
+    def changes_since(self, since: int) -> RegistryChanges:
+        """Geaenderte/entfernte Geraete nach Version `since` (kompletter Stand, falls zu alt)"""
+        return self.devices.changes_since(since)
     
     def load_mapping(self):
-        """Lade IP -> Device ID Mapping"""
-        try:
-            if self.mapping_file.exists():
-                with open(self.mapping_file, 'r') as f:
-                    self.device_mapping = json.load(f)
-                logger.info(f"Loaded {len(self.device_mapping)} device mappings")
-            else:
-                self.device_mapping = {}
-        except Exception as e:
-            logger.error(f"Failed to load mapping: {e}")
-            self.device_mapping = {}
+        """Lade IP -> Device ID Mapping (zusammen mit den Geraeten)"""
+        self.load_devices()
+    
+    def save_devices(self):
+        """Schreibe den kompletten Stand in den Store"""
+        self._changed.update(self.devices)
+        self.flush()
     
     def save_mapping(self):
-        """Speichere IP -> Device ID Mapping"""
+        """Mapping wird immer zusammen mit den Geraeten geschrieben"""
+        self.save_devices()
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Buendle Mutationen: ein Schreibvorgang und ein Snapshot am Ende der
+        aeussersten Transaktion, bei einer Exception wird nichts veroeffentlicht
+        """
+        with self._lock:
+            if self._transaction_depth == 0:
+                self._sync_from_disk()
+                self._snapshot = (set(self._changed), set(self._removed))
+            self._transaction_depth += 1
+            try:
+                with self.devices.batch(), self.device_mapping.batch():
+                    yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._changed, self._removed = self._snapshot
+                    self._snapshot = None
+                    self.index.rebuild(self.devices.values())
+                    logger.warning("Device transaction rolled back")
+                raise
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._snapshot = None
+                self.flush()
+    
+    def _mark(self, device_id: str, removed: bool = False):
+        """Merke Aenderung und schreibe sofort, ausser innerhalb einer Transaktion"""
+        if removed:
+            self._changed.discard(device_id)
+            self._removed.add(device_id)
+        else:
+            self._removed.discard(device_id)
+            self._changed.add(device_id)
+        if self._transaction_depth == 0:
+            self.flush()
+    
+    def flush(self) -> bool:
+        """Schreibe offene Aenderungen (ein Commit)"""
+        if not self._changed and not self._removed:
+            return True
         try:
-            self.mapping_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.mapping_file, 'w') as f:
-                json.dump(self.device_mapping, f, indent=2)
-            logger.info(f"Saved {len(self.device_mapping)} device mappings")
+            self.store.commit(
+                {device_id: device.to_dict() for device_id, device in self.devices.items()},
+                dict(self.device_mapping), changed=sorted(self._changed), removed=sorted(self._removed)
+            )
+            self._file_key = self._store_key()
+            logger.debug(f"Saved {len(self._changed)} changed, {len(self._removed)} removed devices")
+            self._changed.clear()
+            self._removed.clear()
+            return True
         except Exception as e:
-            logger.error(f"Failed to save mapping: {e}")
+            logger.error(f"Failed to save devices: {e}")
+            return False
     
     def add_device(self, device: DeviceConfig) -> bool:
         """Füge neues Gerät hinzu"""
         try:
-            # Prüfe ob ID bereits existiert
-            if device.id in self.devices:
-                logger.warning(f"Device {device.id} already exists")
-                return False
-            
-            # Setze discovered_at
-            if device.discovered_at is None:
-                device.discovered_at = datetime.now().isoformat()
-            
-            device.last_seen = datetime.now().isoformat()
-            
-            # Speichere Gerät
-            self.devices[device.id] = device
-            
-            # Update Mapping
-            if device.ip:
-                self.device_mapping[device.ip] = device.id
-            
-            # Persistiere
-            self.save_devices()
-            self.save_mapping()
+            with self.transaction():
+                # Prüfe ob ID bereits existiert
+                if device.id in self.devices:
+                    logger.warning(f"Device {device.id} already exists")
+                    return False
+                
+                # Setze discovered_at
+                if device.discovered_at is None:
+                    device.discovered_at = datetime.now().isoformat()
+                
+                device.last_seen = datetime.now().isoformat()
+                
+                # Speichere Gerät
+                self.devices[device.id] = device
+                self.index.add(device)
+                
+                # Update Mapping
+                if device.ip:
+                    self.device_mapping[device.ip] = device.id
+                
+                # Persistiere (am Ende der Transaktion)
+                self._mark(device.id)
             
             logger.info(f"Added device: {device.name} ({device.id})")
             return True
@@ -149,28 +282,31 @@ class DeviceManager:
     def update_device(self, device_id: str, updates: Dict) -> bool:
         """Update Gerät"""
         try:
-            if device_id not in self.devices:
-                logger.warning(f"Device {device_id} not found")
-                return False
-            
-            device = self.devices[device_id]
-            old_ip = device.ip
-            
-            # Update fields
-            for key, value in updates.items():
-                if hasattr(device, key):
-                    setattr(device, key, value)
-            
-            device.last_seen = datetime.now().isoformat()
-            
-            # Update mapping if IP changed
-            if 'ip' in updates and updates['ip'] != old_ip:
-                if old_ip in self.device_mapping:
-                    del self.device_mapping[old_ip]
-                self.device_mapping[device.ip] = device_id
-            
-            self.save_devices()
-            self.save_mapping()
+            with self.transaction():
+                if device_id not in self.devices:
+                    logger.warning(f"Device {device_id} not found")
+                    return False
+                
+                # Copy-on-Write: Leser behalten das bisherige Objekt
+                device = replace(self.devices[device_id])
+                old_ip = device.ip
+                
+                # Update fields
+                for key, value in updates.items():
+                    if key in device.field_names():
+                        setattr(device, key, value)
+                
+                device.last_seen = datetime.now().isoformat()
+                self.devices[device_id] = device
+                self.index.update(device)
+                
+                # Update mapping if IP changed
+                if 'ip' in updates and updates['ip'] != old_ip:
+                    if old_ip in self.device_mapping:
+                        del self.device_mapping[old_ip]
+                    self.device_mapping[device.ip] = device_id
+                
+                self._mark(device_id)
             
             logger.info(f"Updated device: {device_id}")
             return True
@@ -182,21 +318,22 @@ class DeviceManager:
     def remove_device(self, device_id: str) -> bool:
         """Entferne Gerät"""
         try:
-            if device_id not in self.devices:
-                logger.warning(f"Device {device_id} not found")
-                return False
-            
-            device = self.devices[device_id]
-            
-            # Remove from mapping
-            if device.ip in self.device_mapping:
-                del self.device_mapping[device.ip]
-            
-            # Remove device
-            del self.devices[device_id]
-            
-            self.save_devices()
-            self.save_mapping()
+            with self.transaction():
+                if device_id not in self.devices:
+                    logger.warning(f"Device {device_id} not found")
+                    return False
+                
+                device = self.devices[device_id]
+                
+                # Remove from mapping
+                if device.ip in self.device_mapping:
+                    del self.device_mapping[device.ip]
+                
+                # Remove device
+                del self.devices[device_id]
+                self.index.remove(device_id)
+                
+                self._mark(device_id, removed=True)
             
             logger.info(f"Removed device: {device_id}")
             return True
@@ -217,32 +354,36 @@ class DeviceManager:
         return None
     
     def get_all_devices(self) -> List[DeviceConfig]:
-        """Hole alle Geräte"""
+        """Hole alle Geräte (ein Snapshot)"""
         return list(self.devices.values())
     
+    def _resolve(self, device_ids: List[str]) -> List[DeviceConfig]:
+        """Index-Treffer -> Geraete des aktuellen Stands (zwischenzeitlich entfernte fallen weg)"""
+        devices = self.devices.view()
+        return [device for device in map(devices.get, device_ids) if device is not None]
+    
     def get_devices_by_type(self, device_type: str) -> List[DeviceConfig]:
         """Hole Geräte nach Typ"""
-        return [d for d in self.devices.values() if d.type == device_type]
+        return self.filter_devices(type=device_type)
     
     def get_devices_by_category(self, category: str) -> List[DeviceConfig]:
         """Hole Geräte nach Kategorie"""
-        return [d for d in self.devices.values() if d.category == category]
+        return self.filter_devices(category=category)
     
-    def search_devices(self, query: str) -> List[DeviceConfig]:
-        """Suche Geräte (Name, IP, Typ)"""
-        query = query.lower()
-        results = []
-        
-        for device in self.devices.values():
-            if (query in device.name.lower() or 
-                query in device.ip.lower() or 
-                query in device.type.lower() or
-                query in device.id.lower()):
-                results.append(device)
+    def filter_devices(self, **criteria) -> List[DeviceConfig]:
+        """
+        Filtere Geräte über die Sekundär-Indizes
         
-        return results
+        Args:
+            criteria: type, category, priority, room, enabled, can_control (None = ignorieren)
+        """
+        return self._resolve(self.index.filter(**criteria))
     
-    def validate_device(self, device: DeviceConfig) -> tuple[bool, str]:
+    def search_devices(self, query: str) -> List[DeviceConfig]:
+        """Suche Geräte (Teilstring in Name, IP, Typ, ID)"""
+        return self._resolve(self.index.search(query))
+    
+    def validate_device(self, device: DeviceConfig) -> Tuple[bool, str]:
         """Validiere Geräte-Konfiguration"""
         # ID Check
         if not device.id or len(device.id) < 2:
@@ -252,14 +393,15 @@ class DeviceManager:
         if not device.name or len(device.name) < 2:
             return False, "Invalid device name"
         
-        # IP Check
-        if not device.ip:
+        # IP Check (SG-Ready ist virtuell: zwei Relais-Devices)
+        if not device.ip and device.type != 'sg_ready':
             return False, "IP address required"
         
         # Type Check
         valid_types = [
-            'shelly_plug', 'shelly_1pm', 'shelly_plus_1pm', 'shelly_pro_1pm',
-            'shelly_pro_3em', 'solax', 'sdm630', 'sg_ready', 'generic'
+            'shelly_plug', 'shelly_1pm', 'shelly_25', 'shelly_plus_1pm', 'shelly_plus_2pm',
+            'shelly_pro_1pm', 'shelly_pro_2pm', 'shelly_pro_4pm', 'shelly_pro_3em',
+            'solax', 'sdm630', 'sg_ready', 'generic'
         ]
         if device.type not in valid_types:
             return False, f"Invalid device type. Must be one of: {', '.join(valid_types)}"
@@ -269,6 +411,15 @@ class DeviceManager:
         if device.priority not in valid_priorities:
             return False, f"Invalid priority. Must be one of: {', '.join(valid_priorities)}"
         
+        # Channel Check
+        if device.channel < 0:
+            return False, "Channel must be >= 0"
+        
+        # Phase Check
+        valid_phases = ['', 'A', 'B', 'C']
+        if device.phase not in valid_phases:
+            return False, "Invalid phase. Must be A, B, C or empty (three-phase)"
+        
         # Power Check
         if device.power < 0:
             return False, "Power must be positive"
@@ -284,69 +435,78 @@ class DeviceManager:
             
         Returns:
             Anzahl erfolgreich importierter Geräte
+        
+        Alle Geraete werden in einer Transaktion (ein Schreibvorgang) angelegt.
         """
         imported = 0
         
-        for disc_device in discovered:
-            try:
-                # Generiere ID aus IP
-                device_id = f"{disc_device['type']}_{disc_device['ip'].replace('.', '_')}"
-                
-                # Prüfe ob bereits existiert
-                if device_id in self.devices:
-                    # Update last_seen
-                    self.devices[device_id].last_seen = datetime.now().isoformat()
-                    continue
-                
-                # Erstelle neues Gerät
-                device = DeviceConfig(
-                    id=device_id,
-                    name=disc_device.get('name', f"{disc_device['type']} {disc_device['ip']}"),
-                    type=disc_device['type'],
-                    ip=disc_device['ip'],
-                    port=disc_device.get('port', 80),
-                    power=0,  # Muss manuell gesetzt werden
-                    priority='MEDIUM',
-                    discovered_at=datetime.now().isoformat()
-                )
-                
-                if self.add_device(device):
-                    imported += 1
-                    
-            except Exception as e:
-                logger.error(f"Failed to import device {disc_device}: {e}")
+        with self.transaction():
+            for disc_device in discovered:
+                imported += self._import_discovered(disc_device)
         
         return imported
     
+    def _import_discovered(self, disc_device: Dict) -> int:
+        """Importiere ein entdecktes Geraet (1 = neu angelegt)"""
+        try:
+            # Generiere ID aus IP
+            device_id = f"{disc_device['type']}_{disc_device['ip'].replace('.', '_')}"
+            
+            # Prüfe ob bereits existiert
+            if device_id in self.devices:
+                # Update last_seen (Copy-on-Write)
+                self.devices[device_id] = replace(self.devices[device_id], last_seen=datetime.now().isoformat())
+                self._mark(device_id)
+                return 0
+            
+            # Erstelle neues Gerät
+            device = DeviceConfig(
+                id=device_id,
+                name=disc_device.get('name', f"{disc_device['type']} {disc_device['ip']}"),
+                type=disc_device['type'],
+                ip=disc_device['ip'],
+                port=disc_device.get('port', 80),
+                power=0,  # Muss manuell gesetzt werden
+                priority='MEDIUM',
+                discovered_at=datetime.now().isoformat()
+            )
+            
+            return 1 if self.add_device(device) else 0
+            
+        except Exception as e:
+            logger.error(f"Failed to import device {disc_device}: {e}")
+            return 0
+    
     def export_to_dict(self) -> Dict:
         """Exportiere alle Geräte als Dict"""
+        devices = self.devices.view()
         return {
-            'devices': [asdict(d) for d in self.devices.values()],
-            'mapping': self.device_mapping,
-            'count': len(self.devices),
+            'devices': [d.to_dict() for d in devices.values()],
+            'mapping': dict(self.device_mapping),
+            'count': len(devices),
             'exported_at': datetime.now().isoformat()
         }
     
+    def export_to_json(self) -> str:
+        """Wie export_to_dict, Geraete aus den gecachten JSON-Fragmenten"""
+        devices = self.devices.view()
+        meta = json.dumps({'mapping': dict(self.device_mapping), 'count': len(devices),
+                           'exported_at': datetime.now().isoformat()})
+        return '{"devices":' + dumps_list(devices.values()) + ',' + meta[1:]
+    
     def get_statistics(self) -> Dict:
         """Hole Statistiken"""
-        stats = {
+        by_category = self.index.counts('category')
+        by_category.pop('', None)
+        return {
             'total_devices': len(self.devices),
-            'enabled_devices': sum(1 for d in self.devices.values() if d.enabled),
-            'controllable_devices': sum(1 for d in self.devices.values() if d.can_control),
-            'by_type': {},
-            'by_priority': {},
-            'by_category': {},
-            'total_power': sum(d.power for d in self.devices.values()),
+            'enabled_devices': len(self.index.lookup('enabled', True)),
+            'controllable_devices': len(self.index.lookup('can_control', True)),
+            'by_type': self.index.counts('type'),
+            'by_priority': self.index.counts('priority'),
+            'by_category': by_category,
+            'total_power': self.index.total_power,
         }
-        
-        # Count by type
-        for device in self.devices.values():
-            stats['by_type'][device.type] = stats['by_type'].get(device.type, 0) + 1
-            stats['by_priority'][device.priority] = stats['by_priority'].get(device.priority, 0) + 1
-            if device.category:
-                stats['by_category'][device.category] = stats['by_category'].get(device.category, 0) + 1
-        
-        return stats
 
 
 if __name__ == "__main__":
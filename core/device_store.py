@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+EMS-Core v2.0 - Device Store
+Persistenz der Geraete-Konfiguration (YAML oder SQLite)
+
+Der DeviceManager sammelt Aenderungen und uebergibt sie gebuendelt per
+`commit()` - ein Schreibvorgang pro Transaktion statt pro Mutation.
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import yaml
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from core.utils.config_snapshot import ConfigSnapshot, load_yaml
+
+logger = logging.getLogger(__name__)
+
+# Geraete als Dicts (asdict(DeviceConfig)), IP -> Device ID
+StoreData = Tuple[List[Dict], Dict[str, str]]
+
+
+def atomic_write(path: Path, text: Union[str, bytes]):
+    """Schreibe Datei atomar (Temp-Datei im selben Verzeichnis + rename), Text oder Bytes"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def parse_devices_yaml(raw: bytes) -> List[Dict]:
+    """devices.yaml -> Liste von Device-Dicts (Struktur validiert)"""
+    data = load_yaml(raw) or {}
+    devices = data.get('devices', []) or []
+    for device in devices:
+        if not isinstance(device, dict) or not device.get('id'):
+            raise ValueError(f"invalid device entry: {device!r}")
+    return devices
+
+
+def parse_mapping_json(raw: bytes) -> Dict[str, str]:
+    mapping = json.loads(raw)
+    if not isinstance(mapping, dict):
+        raise ValueError("device mapping must be an object")
+    return mapping
+
+
+class YamlDeviceStore:
+    """devices.yaml + device_mapping.json (komplett neu geschrieben, atomar)"""
+
+    backend = 'yaml'
+
+    def __init__(self, devices_file: str = "config/devices.yaml",
+                 mapping_file: str = "config/device_mapping.json",
+                 snapshot: Optional[ConfigSnapshot] = None):
+        self.devices_file = Path(devices_file)
+        self.mapping_file = Path(mapping_file)
+        self.snapshot = snapshot
+        self.commits = 0
+
+    def watch_files(self) -> List[Path]:
+        """Dateien, deren Aenderung ein Neuladen erfordert (Hot Reload)"""
+        return [self.devices_file, self.mapping_file]
+
+    def _read(self, path: Path, parser):
+        return self.snapshot.read(path, parser) if self.snapshot else parser(path.read_bytes())
+
+    def load(self) -> StoreData:
+        devices = []
+        if self.devices_file.exists():
+            devices = [dict(d) for d in self._read(self.devices_file, parse_devices_yaml)]
+        else:
+            logger.warning(f"No devices file found at {self.devices_file}")
+
+        mapping = {}
+        if self.mapping_file.exists():
+            mapping = dict(self._read(self.mapping_file, parse_mapping_json))
+        return devices, mapping
+
+    def commit(self, devices: Dict[str, Dict], mapping: Dict[str, str],
+               changed: Iterable[str] = (), removed: Iterable[str] = ()):
+        """Schreibe den vollstaendigen Stand (changed/removed nur fuer inkrementelle Backends)"""
+        dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+        devices_list = [{k: v for k, v in d.items() if v is not None} for d in devices.values()]
+        atomic_write(self.devices_file, yaml.dump({'devices': devices_list}, Dumper=dumper,
+                                                  default_flow_style=False, sort_keys=False))
+        atomic_write(self.mapping_file, json.dumps(mapping, indent=2))
+        self.commits += 1
+
+
+class SqliteDeviceStore:
+    """
+    SQLite-Backend: nur geaenderte Zeilen werden geschrieben
+
+    Beim ersten Laden wird einmalig aus `seed` (z.B. dem bisherigen
+    YAML-Store) uebernommen; danach ist eine leere Datenbank ein gueltiger
+    Stand (Flag `migrated` in der Tabelle meta).
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, db_file: str = "config/devices.db", seed: Optional[YamlDeviceStore] = None):
+        self.db_file = Path(db_file)
+        self.seed = seed
+        self.commits = 0
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        db = self._connect()
+        try:
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS devices (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+                db.execute("CREATE TABLE IF NOT EXISTS mapping (ip TEXT PRIMARY KEY, device_id TEXT NOT NULL)")
+                db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        finally:
+            db.close()
+
+    def watch_files(self) -> List[Path]:
+        """Datenbank + WAL (Commits landen zuerst im WAL, das nach der letzten Verbindung fehlt)"""
+        return [self.db_file, self.db_file.with_name(self.db_file.name + '-wal')]
+
+    def _connect(self) -> sqlite3.Connection:
+        # Eine Verbindung pro Vorgang (Flask-Threads), WAL fuer parallele Leser
+        db = sqlite3.connect(self.db_file)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def load(self) -> StoreData:
+        db = self._connect()
+        try:
+            devices = [json.loads(row[0]) for row in db.execute("SELECT data FROM devices ORDER BY rowid")]
+            mapping = dict(db.execute("SELECT ip, device_id FROM mapping"))
+            migrated = db.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone() is not None
+        finally:
+            db.close()
+
+        if not migrated:
+            if not devices and self.seed is not None:
+                devices, mapping = self.seed.load()
+                if devices:
+                    logger.info(f"Migrating {len(devices)} devices from {self.seed.devices_file} to {self.db_file}")
+                    self.commit({d['id']: d for d in devices}, mapping, changed=[d['id'] for d in devices])
+            self._mark_migrated()
+        return devices, mapping
+
+    def _mark_migrated(self):
+        db = self._connect()
+        try:
+            with db:
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)",
+                           (datetime.now().isoformat(),))
+        finally:
+            db.close()
+
+    def commit(self, devices: Dict[str, Dict], mapping: Dict[str, str],
+               changed: Iterable[str] = (), removed: Iterable[str] = ()):
+        """Upsert geaenderter, Delete entfernter Devices + Mapping in einer Transaktion"""
+        db = self._connect()
+        try:
+            with db:
+                db.executemany(
+                    "INSERT INTO devices (id, data) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                    [(device_id, json.dumps(devices[device_id])) for device_id in changed if device_id in devices]
+                )
+                db.executemany("DELETE FROM devices WHERE id = ?", [(device_id,) for device_id in removed])
+                db.execute("DELETE FROM mapping")
+                db.executemany("INSERT INTO mapping (ip, device_id) VALUES (?, ?)", list(mapping.items()))
+        finally:
+            db.close()
+        self.commits += 1
+
+
+def open_device_store(config: Optional[Dict] = None,
+                      devices_file: str = "config/devices.yaml",
+                      mapping_file: str = "config/device_mapping.json",
+                      snapshot: Optional[ConfigSnapshot] = None):
+    """
+    Store gemaess settings.yaml `device_store`
+
+    Args:
+        config: {backend: yaml|sqlite, sqlite_file: ...}
+        snapshot: Config-Snapshot fuer das Laden der YAML-Dateien
+    """
+    config = config or {}
+    yaml_store = YamlDeviceStore(devices_file, mapping_file, snapshot=snapshot)
+    if config.get('backend', 'yaml') == 'sqlite':
+        return SqliteDeviceStore(config.get('sqlite_file', 'config/devices.db'), seed=yaml_store)
+    return yaml_store
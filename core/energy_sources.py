@@ -7,15 +7,114 @@ Verwaltet verschiedene Energie-Datenquellen (PV, Grid, Battery)
 import asyncio
 import json
 import logging
+import time
 from typing import Dict, Optional, List
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, replace
 from enum import Enum
 from pathlib import Path
 from datetime import datetime
+from urllib.parse import urlparse
+
+from core.utils.health import health_registry, CircuitOpenError, ServerError
+from core.utils.http import get_session
+from core.utils.resolver import host_resolver
+from core.utils.expressions import ExpressionGraph, ExpressionError
+from core.utils.config_snapshot import ConfigSnapshot
+from core.utils.file_watcher import file_key
+from core.device_store import atomic_write
+from core.models.cached import CachedModel, slotted
+from core.models.diff import ConfigDiff, diff_mappings
+from core.models.registry import CHANGE_LOG_SIZE, RegistryChanges, VersionedRegistry
 
 logger = logging.getLogger(__name__)
 
 
+# Solax Register: Wert -> (Registertyp, Adresse, Anzahl Worte, signed)
+# Mehrwort-Werte: niederwertiges Wort zuerst (Solax-Konvention)
+SOLAX_REGISTERS: Dict[str, tuple] = {
+    'pv1_power': ('input', 0x000A, 1, False),
+    'pv2_power': ('input', 0x000B, 1, False),
+    'feedin_power': ('input', 0x0046, 2, True),   # + = Einspeisung, - = Netzbezug
+    'battery_power': ('holding', 0x0096, 1, True),  # + = Laden, - = Entladen
+    'battery_soc': ('holding', 0x00B8, 1, False),
+}
+
+SOLAX_MAX_POWER = 100000  # W - betragsmaessig groessere Werte sind Lese-/Dekodierfehler
+
+MAX_BLOCK_GAP = 64       # Luecke (Register), bis zu der zwei Reads zusammengefasst werden
+MAX_BLOCK_COUNT = 125    # Modbus-Limit pro Read
+
+
+def plan_register_reads(registers, max_gap: int = MAX_BLOCK_GAP) -> List[tuple]:
+    """
+    Fasse Register zu moeglichst wenigen Block-Reads zusammen
+    
+    Returns:
+        [(Registertyp, Start, Anzahl), ...]
+    """
+    by_kind: Dict[str, List[tuple]] = {}
+    for kind, address, count, _signed in registers:
+        by_kind.setdefault(kind, []).append((address, address + count))
+    
+    blocks = []
+    for kind, ranges in sorted(by_kind.items()):
+        ranges.sort()
+        start, end = ranges[0]
+        for range_start, range_end in ranges[1:]:
+            if range_start - end <= max_gap and max(end, range_end) - start <= MAX_BLOCK_COUNT:
+                end = max(end, range_end)
+            else:
+                blocks.append((kind, start, end - start))
+                start, end = range_start, range_end
+        blocks.append((kind, start, end - start))
+    return blocks
+
+
+def decode_solax_snapshot(registers: Dict[str, tuple], raw: Dict[tuple, int]) -> Dict:
+    """
+    Dekodiere gelesene Register in Leistungswerte (Vorzeichen wie current_data)
+    
+    Raises:
+        ValueError: Unplausibler Wert (SOC ausserhalb 0-100 %, Leistung ueber SOLAX_MAX_POWER)
+    """
+    values = {}
+    for name, (kind, address, count, signed) in registers.items():
+        value = 0
+        for i in range(count):
+            value |= raw[(kind, address + i)] << (16 * i)
+        if signed and value >= 1 << (16 * count - 1):
+            value -= 1 << (16 * count)
+        limit = 100 if name == 'battery_soc' else SOLAX_MAX_POWER
+        if abs(value) > limit or (name == 'battery_soc' and value < 0):
+            raise ValueError(f"implausible Solax value {name}={value}")
+        values[name] = float(value)
+    
+    pv_power = sum(v for k, v in values.items() if k.startswith('pv') and k.endswith('_power'))
+    grid_power = -values['feedin_power']  # Grid positiv = Netzbezug
+    return {
+        'pv_power': pv_power,
+        'grid_power': grid_power,
+        'battery_power': values['battery_power'],
+        'battery_soc': values['battery_soc'],
+        # Hausverbrauch = PV - battery_power + grid_power (Konvention wie update_all_sources)
+        'house_consumption': pv_power - values['battery_power'] + grid_power
+    }
+
+
+# Abgeleitete Werte (Knoten im Berechnungs-Graph, in Ausdruecken referenzierbar)
+DERIVED_VALUES = ('pv', 'grid', 'house', 'available')
+# Eingaenge neben den Quellen-IDs - wie DERIVED_VALUES als Quellen-ID reserviert
+INPUT_VALUES = ('battery', 'battery_soc', 'grid_phase_a', 'grid_phase_b', 'grid_phase_c')
+
+
+# Solax-Snapshot-Feld je Quellen-Typ
+SOLAX_SOURCE_VALUES = {
+    'pv_generation': 'pv_power',
+    'grid_power': 'grid_power',
+    'house_consumption': 'house_consumption',
+}
+
+
 class SourceType(Enum):
     """Energie-Quellen Typen"""
     PV_GENERATION = "pv_generation"
@@ -35,9 +134,10 @@ class SourceProvider(Enum):
     CALCULATED = "calculated"
 
 
+@slotted
 @dataclass
-class EnergySource:
-    """Definition einer Energie-Datenquelle"""
+class EnergySource(CachedModel):
+    """Definition einer Energie-Datenquelle (JSON-Darstellung gecacht)"""
     id: str
     name: str
     type: SourceType
@@ -48,13 +148,63 @@ class EnergySource:
     last_update: Optional[str] = None
 
 
+def parse_sources_json(raw: bytes) -> Dict:
+    """energy_sources.json parsen und Pflichtfelder pruefen"""
+    data = json.loads(raw)
+    for source_data in data.get('sources', []):
+        missing = [k for k in ('id', 'name', 'type', 'provider', 'config') if k not in source_data]
+        if missing:
+            raise ValueError(f"energy source {source_data.get('id', '?')}: missing {', '.join(missing)}")
+        SourceType(source_data['type'])
+        SourceProvider(source_data['provider'])
+    return data
+
+
+def _build_sources(data: Dict) -> Dict[str, EnergySource]:
+    sources = {}
+    for source_data in data.get('sources', []):
+        source = EnergySource(
+            id=source_data['id'],
+            name=source_data['name'],
+            type=SourceType(source_data['type']),
+            provider=SourceProvider(source_data['provider']),
+            config=dict(source_data['config']),
+            enabled=source_data.get('enabled', True),
+            last_value=source_data.get('last_value', 0.0),
+            last_update=source_data.get('last_update')
+        )
+        sources[source.id] = source
+    return sources
+
+
+def _source_config(source: EnergySource) -> tuple:
+    """Konfigurations-Felder (ohne Messwerte) - Grundlage fuer den Reload-Diff"""
+    return source.name, source.type, source.provider, source.config, source.enabled
+
+
 class EnergySourcesManager:
-    """Manager fuer alle Energie-Datenquellen"""
+    """
+    Manager fuer alle Energie-Datenquellen
     
-    def __init__(self, config_file: str = "config/energy_sources.json"):
+    `sources` ist eine Copy-on-Write-Registry: Quellen werden ersetzt statt
+    veraendert, Messwerte eines Zyklus als ein Snapshot veroeffentlicht.
+    Ueber die Snapshot-Versionen liefert `changes_since()` die Deltas.
+    """
+    
+    def __init__(self, config_file: str = "config/energy_sources.json",
+                 snapshot: Optional[ConfigSnapshot] = None):
         self.config_file = Path(config_file)
-        self.sources: Dict[str, EnergySource] = {}
+        self.snapshot = snapshot  # Config-Snapshot: unveraenderte Datei nicht neu parsen
+        self._file_key = None  # Stand der Datei beim letzten Laden/Speichern (extern geaendert?)
+        self.sources = VersionedRegistry(history=CHANGE_LOG_SIZE)  # Quellen-ID -> EnergySource
         self.controllers = {}
+        self.modbus_proxy = None  # ModbusProxy: gecachte Register statt eigener Verbindung
+        self.solax_snapshots: Dict[tuple, Dict] = {}  # (IP, Port, Unit) -> Snapshot des Zyklus
+        # Persistente Modbus-Verbindung je (IP, Port) - Wechselrichter haben oft nur einen Slot
+        self.modbus_clients: Dict[tuple, object] = {}
+        self._modbus_locks: Dict[tuple, asyncio.Lock] = {}
+        self.calculations: Optional[ExpressionGraph] = None
+        self._calculations_signature = None
         
         self.current_data = {
             'pv_power': 0.0,
@@ -62,7 +212,11 @@ class EnergySourcesManager:
             'battery_power': 0.0,
             'battery_soc': 0.0,
             'house_consumption': 0.0,
-            'available_power': 0.0
+            'available_power': 0.0,
+            # Phasen-Leistung am Netzanschluss (None = keine Phasen-Messung)
+            'grid_phase_a': None,
+            'grid_phase_b': None,
+            'grid_phase_c': None
         }
         
         self.load_sources()
@@ -71,21 +225,13 @@ class EnergySourcesManager:
         """Lade Quellen aus JSON"""
         try:
             if self.config_file.exists():
-                with open(self.config_file, 'r') as f:
-                    data = json.load(f)
+                self._file_key = file_key(self.config_file)
+                if self.snapshot:
+                    data = self.snapshot.read(self.config_file, parse_sources_json)
+                else:
+                    data = parse_sources_json(self.config_file.read_bytes())
                 
-                for source_data in data.get('sources', []):
-                    source = EnergySource(
-                        id=source_data['id'],
-                        name=source_data['name'],
-                        type=SourceType(source_data['type']),
-                        provider=SourceProvider(source_data['provider']),
-                        config=source_data['config'],
-                        enabled=source_data.get('enabled', True),
-                        last_value=source_data.get('last_value', 0.0),
-                        last_update=source_data.get('last_update')
-                    )
-                    self.sources[source.id] = source
+                self.sources.replace_all(_build_sources(data))
                 
                 logger.info(f"Loaded {len(self.sources)} energy sources")
             else:
@@ -93,68 +239,227 @@ class EnergySourcesManager:
         except Exception as e:
             logger.error(f"Failed to load energy sources: {e}")
     
-    def save_sources(self):
-        """Speichere Quellen als JSON"""
+    def reload_sources(self) -> ConfigDiff:
+        """
+        energy_sources.json neu lesen und nur Konfigurations-Aenderungen uebernehmen
+        
+        Verglichen wird ohne last_value/last_update (Laufzeitwerte);
+        geaenderte Quellen behalten ihren letzten Messwert.
+        
+        Raises:
+            Exception: Datei nicht lesbar/ungueltig (der bisherige Stand bleibt aktiv)
+        """
+        key = file_key(self.config_file)
+        loaded = _build_sources(parse_sources_json(self.config_file.read_bytes()))
+        self._file_key = key
+        with self.sources.batch():
+            current = dict(self.sources.view())
+            diff = diff_mappings(current, loaded, key=_source_config)
+            for source_id in diff.removed:
+                del self.sources[source_id]
+            for source_id in diff.added:
+                self.sources[source_id] = loaded[source_id]
+            for source_id in diff.changed:
+                self.sources[source_id] = replace(loaded[source_id], last_value=current[source_id].last_value,
+                                                  last_update=current[source_id].last_update)
+        if diff:
+            logger.info(f"♻️ Energy sources reloaded: {diff}")
+        return diff
+    
+    def save_sources(self) -> bool:
+        """
+        Speichere Quellen als JSON (atomar)
+        
+        Wurde die Datei seit dem letzten Laden extern geaendert (Hand-Edit,
+        anderer Prozess), wird sie nicht ueberschrieben - erst neu laden.
+        """
         try:
-            self.config_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            sources_list = []
-            for source in self.sources.values():
-                source_dict = {
-                    'id': source.id,
-                    'name': source.name,
-                    'type': source.type.value,
-                    'provider': source.provider.value,
-                    'config': source.config,
-                    'enabled': source.enabled,
-                    'last_value': source.last_value,
-                    'last_update': source.last_update
-                }
-                sources_list.append(source_dict)
+            if file_key(self.config_file) != self._file_key:
+                logger.warning(f"{self.config_file.name} changed on disk - not overwriting, reload first")
+                return False
             
-            data = {'sources': sources_list}
-            
-            with open(self.config_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            data = {'sources': [source.to_dict() for source in self.sources.values()]}
+            atomic_write(self.config_file, json.dumps(data, indent=2))
+            self._file_key = file_key(self.config_file)
             
             logger.info(f"Saved {len(self.sources)} energy sources")
+            return True
         except Exception as e:
             logger.error(f"Failed to save energy sources: {e}")
+            return False
+    
+    def _sync_from_disk(self):
+        """Vor einer Aenderung: extern geaenderte Datei zuerst uebernehmen"""
+        if self.config_file.exists() and file_key(self.config_file) != self._file_key:
+            try:
+                self.reload_sources()
+            except Exception as e:
+                logger.error(f"✗ Reload of {self.config_file.name} failed: {e}")
+    
+    @property
+    def version(self) -> int:
+        """Version des aktuellen Quellen-Stands (steigt mit jeder Aenderung)"""
+        return self.sources.version
+    
+    def changes_since(self, since: int) -> RegistryChanges:
+        """Geaenderte/entfernte Quellen nach Version `since` (kompletter Stand, falls zu alt)"""
+        return self.sources.changes_since(since)
     
     def add_source(self, source: EnergySource):
         """Fuege Datenquelle hinzu"""
-        self.sources[source.id] = source
-        self.save_sources()
+        with self.sources.lock:
+            self._sync_from_disk()
+            self.sources[source.id] = source
+            self.save_sources()
         logger.info(f"Added energy source: {source.name} ({source.type.value} via {source.provider.value})")
     
     def remove_source(self, source_id: str):
         """Entferne Datenquelle"""
-        if source_id in self.sources:
+        with self.sources.lock:
+            self._sync_from_disk()
+            if source_id not in self.sources:
+                return
             del self.sources[source_id]
             self.save_sources()
-            logger.info(f"Removed energy source: {source_id}")
+        logger.info(f"Removed energy source: {source_id}")
+    
+    def update_source(self, source_id: str, **changes) -> Optional[EnergySource]:
+        """
+        Aendere Felder einer Quelle (Copy-on-Write, Leser behalten das alte Objekt)
+        
+        Returns:
+            Neue EnergySource oder None (unbekannte ID)
+        """
+        with self.sources.lock:
+            self._sync_from_disk()
+            source = self.sources.get(source_id)
+            if source is None:
+                return None
+            source = replace(source, **changes)
+            self.sources[source_id] = source
+            self.save_sources()
+        return source
+    
+    def _publish_values(self, updated: Dict[str, tuple]):
+        """
+        Messwerte eines Zyklus als ein Snapshot veroeffentlichen
+        
+        Args:
+            updated: Quellen-ID -> (gelesenes Objekt, Objekt mit neuem Wert); wurde
+                     die Quelle zwischenzeitlich geaendert/entfernt, gewinnt die Aenderung
+        """
+        with self.sources.batch():
+            for source_id, (original, source) in updated.items():
+                if self.sources.get(source_id) is original:
+                    self.sources[source_id] = source
+    
+    def get_calculation_graph(self) -> ExpressionGraph:
+        """
+        Berechnungs-Graph fuer abgeleitete Werte und CALCULATED-Quellen
+        
+        Wird nur neu kompiliert, wenn sich die Quellen-Konfiguration aendert.
+        pv/grid = Mittel der jeweiligen Quellen (inkl. berechneter),
+        house = Mittel gemessener Hausverbrauchs-Quellen, sonst Energie-Bilanz.
+        """
+        enabled = [s for s in self.sources.values() if s.enabled]
+        signature = tuple(
+            (s.id, s.type.value, s.provider.value, s.config.get('expression')) for s in enabled
+        )
+        if self.calculations is not None and signature == self._calculations_signature:
+            return self.calculations
+        
+        graph = ExpressionGraph()
+        calculated = []
+        for source in enabled:
+            if source.provider != SourceProvider.CALCULATED:
+                continue
+            if source.id in DERIVED_VALUES or source.id in INPUT_VALUES:
+                logger.error(f"Calculated source {source.id}: id is reserved")
+                continue
+            try:
+                graph.add(source.id, source.config.get('expression', ''))
+                calculated.append(source.id)
+            except ExpressionError as e:
+                logger.error(f"Calculated source {source.id}: {e}")
+        
+        def average(source_type: SourceType) -> str:
+            ids = [
+                s.id for s in enabled
+                if s.type == source_type and s.id.isidentifier()
+                and (s.provider != SourceProvider.CALCULATED or s.id in graph.nodes)
+            ]
+            return f"avg({', '.join(ids)})" if ids else "0"
+        
+        graph.add('pv', average(SourceType.PV_GENERATION))
+        graph.add('grid', average(SourceType.GRID_POWER))
+        house = average(SourceType.HOUSE_CONSUMPTION)
+        # Energie-Bilanz: Grid + = Netzbezug, Battery + = Laden
+        graph.add('house', house if house != "0" else "pv - battery + grid")
+        graph.add('available', "max(0, -grid)")
+        
+        # Zyklen (z.B. PV-Quelle, die 'pv' referenziert) -> beteiligte Quellen entfernen
+        while True:
+            try:
+                graph.order()
+                break
+            except ExpressionError as e:
+                broken = [name for name in e.cycle if name in calculated]
+                logger.error(f"Calculated sources disabled: {e}")
+                if not broken:
+                    raise
+                for name in broken:
+                    graph.remove(name)
+                    calculated.remove(name)
+        
+        self.calculations = graph
+        self._calculations_signature = signature
+        return graph
+    
+    async def _http_get(self, url: str, headers: Optional[Dict] = None):
+        """
+        HTTP GET mit Circuit Breaker und adaptivem Timeout pro Host
+        
+        Returns:
+            (HTTP-Status, JSON oder None)
+        
+        Raises:
+            CircuitOpenError: Host ist gesperrt
+            ServerError: Host antwortet mit HTTP 5xx
+        """
+        import aiohttp
+        
+        async def fetch(timeout: float):
+            session = get_session()
+            async with session.get(url, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status >= 500:
+                    raise ServerError(response.status)
+                if response.status != 200:
+                    return response.status, None
+                return response.status, await response.json()
+        
+        return await health_registry.call(urlparse(url).netloc, fetch)
     
     async def read_home_assistant(self, config: Dict) -> Optional[float]:
         """Lese Wert von Home Assistant"""
         try:
-            import aiohttp
-            
             url = f"{config['url']}/api/states/{config['entity_id']}"
             headers = {
                 "Authorization": f"Bearer {config['token']}",
                 "Content-Type": "application/json"
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, timeout=5) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        value = float(data['state'])
-                        logger.info(f"HA {config['entity_id']}: {value}")
-                        return value
-                    else:
-                        logger.error(f"HA API error {response.status}: {config['entity_id']}")
-                        return None
+            status, data = await self._http_get(url, headers)
+            if status == 200:
+                value = float(data['state'])
+                logger.debug(f"HA {config['entity_id']}: {value}")
+                return value
+            else:
+                logger.error(f"HA API error {status}: {config['entity_id']}")
+                return None
+        except CircuitOpenError:
+            logger.debug(f"HA {config.get('url')}: skipped - circuit open")
+            return None
         except Exception as e:
             logger.error(f"Failed to read from Home Assistant: {e}")
             return None
@@ -168,50 +473,43 @@ class EnergySourcesManager:
         - entity_id_soc: fuer Battery SOC (%)
         """
         try:
-            import aiohttp
-            
             result = {'power': 0.0, 'soc': 0.0}
             
             logger.info(f"Reading battery from HA: {config.get('entity_id')}, {config.get('entity_id_soc')}")
             
-            async with aiohttp.ClientSession() as session:
-                # Battery Power lesen
-                if 'entity_id' in config:
-                    url = f"{config['url']}/api/states/{config['entity_id']}"
-                    headers = {
-                        "Authorization": f"Bearer {config['token']}",
-                        "Content-Type": "application/json"
-                    }
-                    
-                    async with session.get(url, headers=headers, timeout=5) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            result['power'] = float(data['state'])
-                            logger.info(f"Battery Power: {result['power']}W")
-                        else:
-                            logger.error(f"HA Battery Power API error {response.status}")
-                
-                # Battery SOC lesen
-                if 'entity_id_soc' in config:
-                    url_soc = f"{config['url']}/api/states/{config['entity_id_soc']}"
-                    headers = {
-                        "Authorization": f"Bearer {config['token']}",
-                        "Content-Type": "application/json"
-                    }
-                    
-                    async with session.get(url_soc, headers=headers, timeout=5) as response:
-                        if response.status == 200:
-                            data = await response.json()
-                            result['soc'] = float(data['state'])
-                            logger.info(f"Battery SOC: {result['soc']}%")
-                        else:
-                            logger.error(f"HA Battery SOC API error {response.status}")
+            headers = {
+                "Authorization": f"Bearer {config['token']}",
+                "Content-Type": "application/json"
+            }
+            
+            # Battery Power lesen
+            if 'entity_id' in config:
+                url = f"{config['url']}/api/states/{config['entity_id']}"
+                status, data = await self._http_get(url, headers)
+                if status == 200:
+                    result['power'] = float(data['state'])
+                    logger.info(f"Battery Power: {result['power']}W")
                 else:
-                    logger.warning("No entity_id_soc configured for battery!")
-                
-                logger.info(f"HA Battery FINAL: {result['power']}W, SOC: {result['soc']}%")
-                return result
-                
+                    logger.error(f"HA Battery Power API error {status}")
+            
+            # Battery SOC lesen
+            if 'entity_id_soc' in config:
+                url_soc = f"{config['url']}/api/states/{config['entity_id_soc']}"
+                status, data = await self._http_get(url_soc, headers)
+                if status == 200:
+                    result['soc'] = float(data['state'])
+                    logger.info(f"Battery SOC: {result['soc']}%")
+                else:
+                    logger.error(f"HA Battery SOC API error {status}")
+            else:
+                logger.warning("No entity_id_soc configured for battery!")
+            
+            logger.info(f"HA Battery FINAL: {result['power']}W, SOC: {result['soc']}%")
+            return result
+        
+        except CircuitOpenError:
+            logger.debug(f"HA {config.get('url')}: battery skipped - circuit open")
+            return None
         except Exception as e:
             logger.error(f"Failed to read battery from Home Assistant: {e}", exc_info=True)
             return None
@@ -219,8 +517,6 @@ class EnergySourcesManager:
     async def read_shelly_3em(self, config: Dict) -> Optional[Dict]:
         """Lese Wert von Shelly 3EM (Gen1)"""
         try:
-            import aiohttp
-            
             ip = config.get('ip')
             if not ip:
                 logger.error("Shelly 3EM: No IP in config!")
@@ -228,41 +524,49 @@ class EnergySourcesManager:
             
             url = f"http://{ip}/status"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        
-                        if 'emeters' in data and 'total_power' in data:
-                            emeters = data['emeters']
-                            result = {
-                                'total_power': data.get('total_power', 0),
-                                'phase_a': emeters[0].get('power', 0) if len(emeters) > 0 else 0,
-                                'phase_b': emeters[1].get('power', 0) if len(emeters) > 1 else 0,
-                                'phase_c': emeters[2].get('power', 0) if len(emeters) > 2 else 0
-                            }
-                            
-                            logger.info(f"Shelly 3EM: {result['total_power']}W (A:{result['phase_a']}W, B:{result['phase_b']}W, C:{result['phase_c']}W)")
-                            return result
-                        else:
-                            logger.error(f"Shelly 3EM: Unexpected format")
-                            return None
-                    else:
-                        logger.error(f"Shelly 3EM HTTP error: {response.status}")
-                        return None
+            status, data = await self._http_get(url)
+            if status == 200:
+                if 'emeters' in data and 'total_power' in data:
+                    emeters = data['emeters']
+                    result = {
+                        'total_power': data.get('total_power', 0),
+                        'phase_a': emeters[0].get('power', 0) if len(emeters) > 0 else 0,
+                        'phase_b': emeters[1].get('power', 0) if len(emeters) > 1 else 0,
+                        'phase_c': emeters[2].get('power', 0) if len(emeters) > 2 else 0
+                    }
+                    
+                    logger.debug(f"Shelly 3EM: {result['total_power']}W (A:{result['phase_a']}W, B:{result['phase_b']}W, C:{result['phase_c']}W)")
+                    return result
+                else:
+                    logger.error(f"Shelly 3EM: Unexpected format")
+                    return None
+            else:
+                logger.error(f"Shelly 3EM HTTP error: {status}")
+                return None
+        except CircuitOpenError:
+            logger.debug(f"Shelly 3EM {config.get('ip')}: skipped - circuit open")
+            return None
         except Exception as e:
             logger.error(f"Failed to read from Shelly 3EM: {e}")
             return None
     
-    async def read_solax_modbus_battery(self, config: Dict) -> Optional[Dict]:
+    async def read_solax_snapshot(self, config: Dict, max_age: Optional[float] = None) -> Optional[Dict]:
         """
-        Lese Battery Daten von Solax via Modbus
+        Lese PV, Grid, Battery und Hausverbrauch von Solax in einem Durchgang
+        
+        Alle Solax-Quellen mit gleicher IP/Port/Unit teilen sich einen
+        Snapshot pro Zyklus: eine Verbindung, benachbarte Register werden zu
+        moeglichst wenigen Block-Reads zusammengefasst. Pollt der Modbus-Proxy
+        das Geraet, wird nur aus dessen Cache gelesen (sonst None).
         
-        Liest Battery Power und SOC von Solax Inverter
+        Args:
+            config: {ip, port, unit_id, registers (optional, ueberschreibt SOLAX_REGISTERS)}
+            max_age: Gecachten Snapshot verwenden, wenn juenger (None = ganzer Zyklus)
+        
+        Returns:
+            {'pv_power', 'grid_power', 'battery_power', 'battery_soc', 'house_consumption'} oder None
         """
         try:
-            from pymodbus.client import ModbusTcpClient
-            
             ip = config.get('ip')
             port = config.get('port', 502)
             unit_id = config.get('unit_id', 1)
@@ -271,55 +575,150 @@ class EnergySourcesManager:
                 logger.error("Solax Modbus: No IP in config!")
                 return None
             
-            logger.info(f"Reading Solax Battery from {ip}:{port} (unit {unit_id})...")
-            
-            client = ModbusTcpClient(ip, port=port, timeout=5)
-            
-            if not client.connect():
-                logger.error("Solax Modbus: Connection failed")
-                return None
-            
-            try:
-                # Battery Power (Register 0x0096, signed int16)
-                power_result = client.read_holding_registers(0x0096, 1, slave=unit_id)
-                
-                # Battery SOC (Register 0x00B8, unsigned int16, in %)
-                soc_result = client.read_holding_registers(0x00B8, 1, slave=unit_id)
+            key = (ip, port, unit_id)
+            # Zyklus und Grid Guard lesen nie gleichzeitig; wer wartet, nutzt den frischen Snapshot
+            async with self._modbus_locks.setdefault((ip, port), asyncio.Lock()):
+                cached = self.solax_snapshots.get(key)
+                if cached and (max_age is None or time.monotonic() - cached['updated'] <= max_age):
+                    return cached
                 
-                if not power_result.isError() and not soc_result.isError():
-                    # Power: convert to signed
-                    power_raw = power_result.registers[0]
-                    if power_raw > 32767:
-                        power_raw -= 65536
-                    battery_power = float(power_raw)
-                    
-                    # SOC
-                    battery_soc = float(soc_result.registers[0])
-                    
-                    result = {
-                        'power': battery_power,
-                        'soc': battery_soc
-                    }
-                    
-                    logger.info(f"Solax Battery: {battery_power}W, SOC: {battery_soc}%")
-                    return result
+                registers = {**SOLAX_REGISTERS, **{k: tuple(v) for k, v in config.get('registers', {}).items()}}
+                blocks = plan_register_reads(registers.values())
+                if self.modbus_proxy and self.modbus_proxy.polls_endpoint(ip, port):
+                    # Der Proxy belegt den (einzigen) Modbus-Slot - keine eigene Verbindung
+                    raw = self._solax_from_proxy(ip, port, unit_id, blocks)
+                    if raw is None:
+                        logger.warning(f"Solax {ip}: no fresh data from Modbus proxy")
+                        return None
+                    snapshot = decode_solax_snapshot(registers, raw)
                 else:
-                    logger.error("Solax Modbus: Read error")
-                    return None
+                    async def read(timeout: float) -> Dict:
+                        # Dekodieren zaehlt mit: unplausible Werte (ValueError) sind ein Fehler des Endpoints
+                        raw = await self._read_modbus_blocks(ip, port, unit_id, blocks, timeout)
+                        return decode_solax_snapshot(registers, raw)
                     
-            finally:
-                client.close()
+                    snapshot = await health_registry.call(f"{ip}:{port}", read)
                 
+                snapshot['updated'] = time.monotonic()
+                self.solax_snapshots[key] = snapshot
+            logger.debug(
+                f"Solax {ip}: PV={snapshot['pv_power']:.0f}W, Grid={snapshot['grid_power']:.0f}W, "
+                f"Battery={snapshot['battery_power']:.0f}W ({snapshot['battery_soc']:.0f}%) "
+                f"[{len(blocks)} reads]"
+            )
+            return snapshot
+            
+        except CircuitOpenError:
+            logger.debug(f"Solax Modbus {config.get('ip')}: skipped - circuit open")
+            return None
         except Exception as e:
-            logger.error(f"Failed to read battery from Solax Modbus: {e}")
+            logger.error(f"Failed to read Solax Modbus snapshot: {e}")
+            return None
+    
+    def _solax_from_proxy(self, ip: str, port: int, unit_id: int,
+                          blocks: List[tuple]) -> Optional[Dict[tuple, int]]:
+        """Register aus dem Modbus-Proxy-Cache (None wenn nicht vollstaendig/frisch)"""
+        raw = {}
+        for kind, start, count in blocks:
+            values = self.modbus_proxy.get_registers(ip, port, unit_id, start, count, kind=kind)
+            if values is None:
+                return None
+            raw.update({(kind, start + i): v for i, v in enumerate(values)})
+        return raw
+    
+    async def _read_modbus_blocks(self, ip: str, port: int, unit_id: int,
+                                  blocks: List[tuple], timeout: float) -> Dict[tuple, int]:
+        """
+        Lese Register-Bloecke ueber die persistente Verbindung -> {(Typ, Adresse): Wert}
+        
+        Bei einem Fehler wird die Verbindung geschlossen und beim naechsten
+        Aufruf neu aufgebaut.
+        """
+        from pymodbus.client import AsyncModbusTcpClient
+        
+        client = self.modbus_clients.get((ip, port))
+        try:
+            if client is None or not client.connected:
+                if client is not None:
+                    client.close()
+                client = AsyncModbusTcpClient(await host_resolver.resolve_host(ip), port=port, timeout=timeout)
+                self.modbus_clients[(ip, port)] = client
+                if not await client.connect():
+                    raise ConnectionError("connection failed")
+            raw = {}
+            for kind, start, count in blocks:
+                if kind == 'input':
+                    result = await client.read_input_registers(start, count, slave=unit_id)
+                else:
+                    result = await client.read_holding_registers(start, count, slave=unit_id)
+                if result.isError():
+                    raise IOError(f"read error at {start} ({kind})")
+                raw.update({(kind, start + i): v for i, v in enumerate(result.registers)})
+            return raw
+        except BaseException:
+            if client is not None:
+                client.close()
+            self.modbus_clients.pop((ip, port), None)
+            raise
+    
+    def close(self):
+        """Persistente Modbus-Verbindungen schliessen"""
+        for client in self.modbus_clients.values():
+            client.close()
+        self.modbus_clients.clear()
+    
+    async def read_solax_modbus_battery(self, config: Dict) -> Optional[Dict]:
+        """
+        Lese Battery Daten von Solax via Modbus
+        
+        Liest Battery Power und SOC aus dem gemeinsamen Solax-Snapshot
+        """
+        snapshot = await self.read_solax_snapshot(config)
+        if not snapshot:
             return None
+        return {'power': snapshot['battery_power'], 'soc': snapshot['battery_soc']}
+    
+    async def read_grid_power(self, max_age: float = 1.0) -> Optional[float]:
+        """
+        Lese nur die Grid-Quellen (schneller Pfad fuer den Grid Guard)
+        
+        Args:
+            max_age: Solax-Snapshot wiederverwenden, wenn juenger (Sekunden) -
+                     begrenzt die Modbus-Reads auf einen pro `max_age`
+        
+        Returns:
+            Mittelwert aller aktiven Grid-Quellen oder None
+        """
+        values = []
+        for source in self.sources.values():
+            if not source.enabled or source.type != SourceType.GRID_POWER:
+                continue
+            
+            value = None
+            if source.provider == SourceProvider.SHELLY_3EM:
+                data = await self.read_shelly_3em(source.config)
+                if data:
+                    value = data['total_power']
+            elif source.provider == SourceProvider.HOME_ASSISTANT:
+                value = await self.read_home_assistant(source.config)
+            elif source.provider == SourceProvider.SOLAX_MODBUS:
+                snapshot = await self.read_solax_snapshot(source.config, max_age=max_age)
+                if snapshot:
+                    value = snapshot['grid_power']
+            
+            if value is not None:
+                values.append(value)
+        
+        return sum(values) / len(values) if values else None
     
     async def update_all_sources(self):
         """Aktualisiere alle Datenquellen"""
         
-        pv_values = []
-        grid_values = []
+        values: Dict[str, float] = {}  # Quellen-ID -> Wert dieses Zyklus
+        updated: Dict[str, tuple] = {}  # Quellen-ID -> (alt, neu), am Ende ein Snapshot
+        phase_values = []
         battery_data = None
+        self.solax_snapshots.clear()  # Ein Solax-Snapshot pro Zyklus
         
         logger.info(f"Updating {len(self.sources)} energy sources...")
         
@@ -327,6 +726,8 @@ class EnergySourcesManager:
             if not source.enabled:
                 logger.debug(f"Skipping disabled: {source.id}")
                 continue
+            if source.provider == SourceProvider.CALCULATED:
+                continue  # nach den Messwerten ueber den Berechnungs-Graph
             
             try:
                 value = None
@@ -342,6 +743,8 @@ class EnergySourcesManager:
                     data = await self.read_shelly_3em(source.config)
                     if data:
                         value = data['total_power']
+                        if source.type == SourceType.GRID_POWER:
+                            phase_values.append((data['phase_a'], data['phase_b'], data['phase_c']))
                 
                 # === Battery Sources ===
                 
@@ -361,20 +764,22 @@ class EnergySourcesManager:
                     if battery_data:
                         value = battery_data['power']
                 
+                # Solax Modbus PV/Grid/Haus (gleicher Snapshot wie Battery)
+                elif source.provider == SourceProvider.SOLAX_MODBUS:
+                    snapshot = await self.read_solax_snapshot(source.config)
+                    if snapshot:
+                        value = snapshot[SOLAX_SOURCE_VALUES[source.type.value]]
+                
                 # Wert speichern (nur fuer PV/Grid, Battery wird separat behandelt)
                 if value is not None and source.type != SourceType.BATTERY:
-                    source.last_value = value
-                    source.last_update = datetime.now().isoformat()
-                    
-                    if source.type == SourceType.PV_GENERATION:
-                        pv_values.append(value)
-                    elif source.type == SourceType.GRID_POWER:
-                        grid_values.append(value)
+                    updated[source.id] = (source, replace(source, last_value=value,
+                                                          last_update=datetime.now().isoformat()))
+                    values[source.id] = value
                 
-                # Battery Last Value updaten
+                # Battery Last Value updaten (Zeige SOC als last_value)
                 elif battery_data and source.type == SourceType.BATTERY:
-                    source.last_value = battery_data['soc']  # Zeige SOC als last_value
-                    source.last_update = datetime.now().isoformat()
+                    updated[source.id] = (source, replace(source, last_value=battery_data['soc'],
+                                                          last_update=datetime.now().isoformat()))
                 
                 elif value is None and not battery_data:
                     logger.warning(f"No data for {source.name}")
@@ -382,9 +787,11 @@ class EnergySourcesManager:
             except Exception as e:
                 logger.error(f"Source {source.id} error: {e}", exc_info=True)
         
-        # Berechne Werte
-        self.current_data['pv_power'] = sum(pv_values) / len(pv_values) if pv_values else 0
-        self.current_data['grid_power'] = sum(grid_values) / len(grid_values) if grid_values else 0
+        # Phasen-Werte (Mittel ueber alle Grid-Quellen mit Phasen-Messung)
+        for index, key in enumerate(('grid_phase_a', 'grid_phase_b', 'grid_phase_c')):
+            self.current_data[key] = (
+                sum(p[index] for p in phase_values) / len(phase_values) if phase_values else None
+            )
         
         # Battery Daten setzen
         if battery_data:
@@ -397,25 +804,33 @@ class EnergySourcesManager:
             self.current_data['battery_soc'] = 0.0
             logger.warning("No battery data available - setting to 0")
         
-        # Hausverbrauch berechnen
-        # Energie-Bilanz nach Vorzeichen-Konvention:
-        # - Grid positiv = Netzbezug, Grid negativ = Einspeisung
-        # - Battery positiv = Laden, Battery negativ = Entladen
-        # Formel: Hausverbrauch = PV - battery_power + grid_power
-        self.current_data['house_consumption'] = (
-            self.current_data['pv_power'] -
-            self.current_data['battery_power'] +
-            self.current_data['grid_power']
-        )
-        
-        # Verfuegbare Leistung (wenn Grid negativ = Einspeisung)
-        if self.current_data['grid_power'] < 0:
-            self.current_data['available_power'] = abs(self.current_data['grid_power'])
-        else:
-            self.current_data['available_power'] = 0
+        # Abgeleitete Werte + CALCULATED-Quellen (topologisch, nur bei geaenderten Eingaben)
+        inputs = {
+            **values,
+            'battery': self.current_data['battery_power'],
+            'battery_soc': self.current_data['battery_soc'],
+            'grid_phase_a': self.current_data['grid_phase_a'],
+            'grid_phase_b': self.current_data['grid_phase_b'],
+            'grid_phase_c': self.current_data['grid_phase_c'],
+        }
+        try:
+            derived = self.get_calculation_graph().evaluate(inputs)
+        except Exception as e:
+            # Ein fehlerhafter Ausdruck darf den Zyklus nicht abbrechen
+            logger.error(f"✗ Calculation failed: {e}", exc_info=True)
+            derived = {}
+        for source_id, value in derived.items():
+            source = self.sources.get(source_id)
+            if source is not None and value is not None:
+                updated[source_id] = (source, replace(source, last_value=value,
+                                                      last_update=datetime.now().isoformat()))
+        self._publish_values(updated)
         
-        # Speichere aktualisierte Werte
-        self.save_sources()
+        self.current_data['pv_power'] = derived.get('pv') or 0.0
+        self.current_data['grid_power'] = derived.get('grid') or 0.0
+        self.current_data['house_consumption'] = derived.get('house') or 0.0
+        self.current_data['available_power'] = derived.get('available') or 0.0
+        # Messwerte nur im Speicher: die Datei bleibt Konfiguration (Hot Reload, Hand-Edits)
         
         logger.info(
             f"==> PV={self.current_data['pv_power']:.0f}W, "
@@ -428,6 +843,26 @@ class EnergySourcesManager:
         """Hole aktuelle Energie-Daten"""
         return self.current_data.copy()
     
+    def export_state(self) -> Dict:
+        """Messwerte fuer andere Prozesse (Web UI) - current_data und Wert je Quelle"""
+        return {
+            'current': self.get_current_data(),
+            'values': {
+                source.id: {'last_value': source.last_value, 'last_update': source.last_update}
+                for source in self.sources.values() if source.last_update
+            }
+        }
+    
+    def apply_state(self, state: Dict):
+        """Messwerte aus `export_state()` (EMS-Prozess) uebernehmen, ohne selbst zu lesen"""
+        self.current_data.update(state['current'])
+        updated = {}
+        for source_id, value in state['values'].items():
+            source = self.sources.get(source_id)
+            if source is not None:
+                updated[source_id] = (source, replace(source, **value))
+        self._publish_values(updated)
+    
     def get_source(self, source_id: str) -> Optional[EnergySource]:
         """Hole Datenquelle"""
         return self.sources.get(source_id)
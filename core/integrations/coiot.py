@@ -0,0 +1,211 @@
+"""
+EMS-Core v2.0 - Shelly Gen1 CoIoT Listener
+Empfaengt CoIoT-Status (CoAP ueber UDP-Multicast 224.0.1.187:5683) von
+Shelly Gen1 Devices (Plug, Plug S, 1PM, 2.5) und schreibt Relais-Zustand
+und Leistung in den Device State Cache.
+"""
+import asyncio
+import json
+import logging
+import socket
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.integrations.state_cache import DeviceStateCache, state_cache
+
+logger = logging.getLogger(__name__)
+
+COIOT_GROUP = "224.0.1.187"
+COIOT_PORT = 5683
+COIOT_STATUS_CODE = 30      # Shelly-spezifischer CoAP-Code 0.30 = Status (/cit/s)
+OPTION_URI_PATH = 11
+OPTION_DEVICE_ID = 3332     # "SHPLG-S#6A1B2C#2" (Typ#ID#CoIoT-Version)
+PUSH_SOURCE = "coiot"
+
+
+def parse_coap(packet: bytes) -> Optional[Tuple[int, Dict[int, List[bytes]], bytes]]:
+    """
+    Minimaler CoAP-Parser (RFC 7252)
+
+    Returns:
+        (Code, {Option-Nummer: [Werte]}, Payload) oder None bei ungueltigem Paket
+    """
+    if len(packet) < 4 or packet[0] >> 6 != 1:
+        return None
+    token_length = packet[0] & 0x0F
+    code = packet[1]
+    pos = 4 + token_length
+    options: Dict[int, List[bytes]] = {}
+    number = 0
+
+    while pos < len(packet):
+        if packet[pos] == 0xFF:
+            return code, options, packet[pos + 1:]
+        delta = packet[pos] >> 4
+        length = packet[pos] & 0x0F
+        pos += 1
+        values = []
+        for nibble in (delta, length):
+            if nibble == 13:
+                values.append(packet[pos] + 13)
+                pos += 1
+            elif nibble == 14:
+                values.append(struct.unpack('!H', packet[pos:pos + 2])[0] + 269)
+                pos += 2
+            elif nibble == 15:
+                return None
+            else:
+                values.append(nibble)
+        delta, length = values
+        number += delta
+        options.setdefault(number, []).append(packet[pos:pos + length])
+        pos += length
+
+    return code, options, b''
+
+
+def decode_status(payload: bytes) -> Dict[int, Dict]:
+    """
+    Dekodiere CoIoT-Status {"G": [[Block, Sensor-ID, Wert], ...]}
+
+    Sensor-IDs:
+    - CoIoT v2: 1101/1201 Relais-Ausgang, 4101/4201 Leistung (Kanal 0/1)
+    - CoIoT v1: 112/122 Relais-Ausgang, 111/121 Leistung
+
+    Returns:
+        {Kanal: {'state': 'on'/'off', 'power': W}} (nur gefundene Felder)
+    """
+    data = json.loads(payload.decode('utf-8'))
+    channels: Dict[int, Dict] = {}
+    for entry in data.get('G', []):
+        if len(entry) < 3:
+            continue
+        sensor_id, value = int(entry[1]), entry[2]
+        if 1000 <= sensor_id < 10000:
+            kind, channel, index = sensor_id // 1000, (sensor_id // 100) % 10 - 1, sensor_id % 100
+            if index != 1 or channel < 0:
+                continue
+            if kind == 1:
+                channels.setdefault(channel, {})['state'] = 'on' if value else 'off'
+            elif kind == 4:
+                channels.setdefault(channel, {})['power'] = float(value)
+        elif 100 <= sensor_id < 1000 and sensor_id // 100 == 1:
+            channel, kind = (sensor_id // 10) % 10 - 1, sensor_id % 10
+            if channel < 0:
+                continue
+            if kind == 2:
+                channels.setdefault(channel, {})['state'] = 'on' if value else 'off'
+            elif kind == 1:
+                channels.setdefault(channel, {})['power'] = float(value)
+    return channels
+
+
+class CoIoTListener(asyncio.DatagramProtocol):
+    """
+    Asyncio UDP-Listener fuer CoIoT-Status-Pakete
+
+    Jedes Status-Paket meldet den Sender fuer `connected_ttl` Sekunden als
+    push-verbunden an (Gen1 sendet bei jeder Aenderung und periodisch) -
+    so bestaetigt der Reconciler Befehle per Push statt per Poll.
+    """
+
+    def __init__(self,
+                 cache: Optional[DeviceStateCache] = None,
+                 host: str = "0.0.0.0",
+                 port: int = COIOT_PORT,
+                 group: Optional[str] = COIOT_GROUP,
+                 connected_ttl: float = 45.0):
+        """
+        Args:
+            cache: Ziel-Cache (Standard: prozessweiter state_cache)
+            host: Bind-Adresse
+            port: UDP-Port (0 = frei waehlen, z.B. fuer Tests)
+            group: Multicast-Gruppe (None = nur Unicast)
+            connected_ttl: Sekunden ohne Paket, bis der Sender als getrennt
+                gilt (UDP kennt keinen Verbindungsabbau)
+        """
+        self.cache = cache or state_cache
+        self.host = host
+        self.port = port
+        self.group = group
+        self.connected_ttl = connected_ttl
+        self.transport = None
+        self.devices: Dict[str, Dict] = {}  # IP -> Freshness-Infos
+        self.packets = 0
+        self.invalid_packets = 0
+
+    async def start(self):
+        """Oeffne den UDP-Socket und trete der Multicast-Gruppe bei"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        if self.group:
+            membership = struct.pack('4s4s', socket.inet_aton(self.group), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.port = sock.getsockname()[1]
+
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=sock)
+        logger.info(f"📡 CoIoT listener on udp/{self.port}" + (f" (group {self.group})" if self.group else ""))
+
+    def stop(self):
+        """Schliesse den Socket"""
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    def datagram_received(self, data: bytes, addr):
+        ip = addr[0]
+        try:
+            parsed = parse_coap(data)
+            if parsed is None:
+                self.invalid_packets += 1
+                return
+            code, options, payload = parsed
+            if code != COIOT_STATUS_CODE or not payload:
+                return
+
+            channels = decode_status(payload)
+        except Exception as e:
+            self.invalid_packets += 1
+            logger.debug(f"CoIoT {ip}: invalid packet - {e}")
+            return
+
+        self.packets += 1
+        for channel, values in channels.items():
+            self.cache.update(ip, channel, state=values.get('state'),
+                              power=values.get('power'), source=PUSH_SOURCE)
+        self.cache.set_connected(ip, PUSH_SOURCE, ttl=self.connected_ttl)
+        self._track(ip, options)
+
+    def _track(self, ip: str, options: Dict[int, List[bytes]]):
+        """Freshness pro Device: letzter Empfang + gleitendes Sende-Intervall"""
+        now = time.monotonic()
+        info = self.devices.get(ip)
+        if info is None:
+            device_id = options.get(OPTION_DEVICE_ID, [b''])[0].decode('utf-8', 'replace')
+            info = {'device_id': device_id, 'packets': 0, 'last_seen': now, 'interval': None}
+            self.devices[ip] = info
+            logger.info(f"CoIoT: new device {device_id or '?'} at {ip}")
+        else:
+            gap = now - info['last_seen']
+            info['interval'] = gap if info['interval'] is None else 0.8 * info['interval'] + 0.2 * gap
+            info['last_seen'] = now
+        info['packets'] += 1
+
+    def get_devices(self) -> Dict[str, Dict]:
+        """Freshness-Status aller CoIoT-Devices"""
+        now = time.monotonic()
+        result = {}
+        for ip, info in self.devices.items():
+            age = now - info['last_seen']
+            interval = info['interval']
+            result[ip] = {
+                'device_id': info['device_id'],
+                'packets': info['packets'],
+                'age': round(age, 1),
+                'interval': round(interval, 1) if interval is not None else None,
+                'fresh': interval is None or age <= 3 * interval
+            }
+        return result
@@ -1,23 +1,349 @@
 """
-EMS-Core - Device Discovery
-Simplified version
+EMS-Core v2.0 - Device Discovery
+Asynchroner Netzwerk-Scan nach Shelly (HTTP), Solax und SDM630 (Modbus TCP)
+
+Ablauf pro Host: TCP-Connect-Probe auf Port 80/502 (begrenzte Parallelitaet),
+offene Ports werden per `/shelly` bzw. Modbus-Unit-ID-Probe klassifiziert.
+Ergebnisse werden geliefert, sobald sie gefunden sind.
 """
+import asyncio
+import ipaddress
 import logging
+import queue
+import struct
+import time
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+from core.utils.async_bridge import get_bridge, run_sync
 
 logger = logging.getLogger(__name__)
 
+MAX_SCAN_HOSTS = 4096  # groesser als /20 -> abgelehnt
+
+# Gen1: Feld `type` aus /shelly
+SHELLY_GEN1_TYPES = {
+    'SHPLG-S': 'shelly_plug',
+    'SHPLG-1': 'shelly_plug',
+    'SHPLG2-1': 'shelly_plug',
+    'SHPLG-U1': 'shelly_plug',
+    'SHSW-PM': 'shelly_1pm',
+    'SHSW-25': 'shelly_25',
+}
+
+# Gen2+: Feld `app` aus /shelly
+SHELLY_GEN2_APPS = {
+    'Plus1PM': 'shelly_plus_1pm',
+    'Plus1PMMini': 'shelly_plus_1pm',
+    'PlusPlugS': 'shelly_plus_1pm',
+    'PlusPlugUK': 'shelly_plus_1pm',
+    'PlusPlugIT': 'shelly_plus_1pm',
+    'PlusPlugUS': 'shelly_plus_1pm',
+    'Plus2PM': 'shelly_plus_2pm',
+    'Pro1PM': 'shelly_pro_1pm',
+    'Pro2PM': 'shelly_pro_2pm',
+    'Pro4PM': 'shelly_pro_4pm',
+    'Pro3EM': 'shelly_pro_3em',
+}
+
+
+def classify_shelly(info: Dict) -> Dict:
+    """
+    Klassifiziere die Antwort von GET /shelly
+
+    Returns:
+        {type, model, generation, mac, channels}; unbekannte Modelle -> 'generic'
+    """
+    generation = info.get('gen')
+    if generation:
+        app = info.get('app', '')
+        model = info.get('model') or app
+        device_type = SHELLY_GEN2_APPS.get(app, 'generic')
+        channels = int(app[-3]) if app.endswith('PM') and app[-3:-2].isdigit() else 1
+    else:
+        generation = 1
+        model = info.get('type', '')
+        device_type = SHELLY_GEN1_TYPES.get(model, 'generic')
+        channels = info.get('num_outputs', 1)
+
+    return {
+        'type': device_type,
+        'model': model,
+        'generation': generation,
+        'mac': info.get('mac'),
+        'channels': channels,
+    }
+
+
+def _is_printable(registers: List[int]) -> bool:
+    """Register als ASCII (2 Zeichen pro Register, z.B. Seriennummer)"""
+    raw = b''.join(struct.pack('>H', r) for r in registers).rstrip(b'\x00')
+    return len(raw) >= 4 and all(32 <= c < 127 for c in raw)
+
+
+def _registers_to_float(registers: List[int]) -> float:
+    return struct.unpack('>f', struct.pack('>HH', registers[0], registers[1]))[0]
+
+
 class DeviceDiscovery:
-    """Simple Device Discovery"""
-    
-    def __init__(self):
-        self.discovered = []
-    
-    def scan_network(self, network: str = "10.0.0.0/24"):
-        """Scan network for devices"""
-        logger.info(f"Scanning network: {network}")
-        # TODO: Implement actual discovery
-        return []
-    
-    def get_discovered(self):
+    """
+    Asynchroner Netzwerk-Scanner
+
+    - `scan()` ist ein Async-Generator (Streaming), `scan_network()` die
+      synchrone Variante fuer Flask (sammelt alle Ergebnisse)
+    - Parallelitaet ueber ein Semaphore begrenzt; eine /24 dauert im
+      schlechtesten Fall ca. 2 * 254 / concurrency * connect_timeout
+    """
+
+    def __init__(self,
+                 concurrency: int = 128,
+                 connect_timeout: float = 0.5,
+                 http_timeout: float = 2.0,
+                 modbus_timeout: float = 1.0,
+                 modbus_units: Iterable[int] = (1,),
+                 http_port: int = 80,
+                 modbus_port: int = 502):
+        """
+        Args:
+            concurrency: Max. gleichzeitige Verbindungsversuche
+            connect_timeout: Timeout der TCP-Connect-Probe (Sekunden)
+            http_timeout: Timeout fuer GET /shelly
+            modbus_timeout: Timeout pro Modbus-Request
+            modbus_units: Zu pruefende Modbus Unit-IDs
+            http_port: HTTP-Port (Tests)
+            modbus_port: Modbus-TCP-Port (Tests)
+        """
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.http_timeout = http_timeout
+        self.modbus_timeout = modbus_timeout
+        self.modbus_units = tuple(modbus_units)
+        self.http_port = http_port
+        self.modbus_port = modbus_port
+        self.discovered: List[Dict] = []
+        self.last_scan: Optional[Dict] = None
+
+    # ------------------------------------------------------------------
+    # Scan
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _hosts(network: str) -> List[str]:
+        net = ipaddress.ip_network(network, strict=False)
+        if net.num_addresses > MAX_SCAN_HOSTS:
+            raise ValueError(f"network {network} too large (max {MAX_SCAN_HOSTS} addresses)")
+        hosts = list(net.hosts()) or [net.network_address]
+        return [str(ip) for ip in hosts]
+
+    async def scan(self, network: str = "10.0.0.0/24") -> AsyncIterator[Dict]:
+        """
+        Scanne ein CIDR-Netz und liefere Geraete sobald sie gefunden sind
+
+        Raises:
+            ValueError: Ungueltiges oder zu grosses Netz
+        """
+        hosts = self._hosts(network)
+        logger.info(f"🔍 Scanning network: {network} ({len(hosts)} hosts)")
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        found = []
+
+        async def worker(ip: str):
+            try:
+                for device in await self.scan_host(ip, semaphore):
+                    await results.put(device)
+            except Exception as e:
+                logger.debug(f"Discovery {ip}: {e}")
+
+        tasks = [asyncio.create_task(worker(ip)) for ip in hosts]
+        done = asyncio.create_task(asyncio.wait(tasks))
+        try:
+            while True:
+                getter = asyncio.create_task(results.get())
+                await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    if results.empty():
+                        break
+                    continue
+                device = getter.result()
+                found.append(device)
+                yield device
+        finally:
+            for task in tasks:
+                task.cancel()
+            done.cancel()
+            self._merge(found)
+            duration = time.perf_counter() - started
+            self.last_scan = {
+                'network': network, 'hosts': len(hosts), 'found': len(found),
+                'duration': round(duration, 2), 'finished_at': time.time()
+            }
+            logger.info(f"✓ Discovery {network}: {len(found)} devices in {duration:.1f}s")
+
+    async def scan_host(self, ip: str, semaphore: Optional[asyncio.Semaphore] = None) -> List[Dict]:
+        """
+        Probe und klassifiziere einen Host (Port 80 und 502 parallel)
+
+        Connect-Probes, HTTP-Fingerprint und Modbus-Probe teilen sich das
+        Semaphore - auch viele offene Hosts halten nie mehr als
+        `concurrency` Verbindungen gleichzeitig.
+        """
+        semaphore = semaphore or asyncio.Semaphore(self.concurrency)
+        http_open, modbus_open = await asyncio.gather(
+            self.probe_port(ip, self.http_port, semaphore),
+            self.probe_port(ip, self.modbus_port, semaphore)
+        )
+        devices = []
+        if http_open:
+            async with semaphore:
+                shelly = await self.fingerprint_shelly(ip)
+            if shelly:
+                devices.append(shelly)
+        if modbus_open:
+            async with semaphore:
+                devices.extend(await self.probe_modbus(ip))
+        return devices
+
+    async def probe_port(self, ip: str, port: int, semaphore: asyncio.Semaphore) -> bool:
+        """TCP-Connect-Probe"""
+        async with semaphore:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), self.connect_timeout)
+            except (OSError, asyncio.TimeoutError):
+                return False
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return True
+
+    # ------------------------------------------------------------------
+    # Fingerprinting
+    # ------------------------------------------------------------------
+
+    async def fingerprint_shelly(self, ip: str) -> Optional[Dict]:
+        """GET /shelly -> Generation/Modell (None wenn kein Shelly)"""
+        import aiohttp
+        from core.utils.http import get_session
+
+        try:
+            session = get_session()
+            url = f"http://{ip}:{self.http_port}/shelly"
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.http_timeout)) as response:
+                if response.status != 200:
+                    return None
+                info = await response.json(content_type=None)
+        except Exception as e:
+            logger.debug(f"Discovery {ip}: no Shelly ({e})")
+            return None
+
+        if not isinstance(info, dict) or not ('gen' in info or 'type' in info):
+            return None
+        device = classify_shelly(info)
+        name = info.get('name') or info.get('id') or f"Shelly {device['model']}"
+        logger.info(f"✓ Found Shelly {device['model']} (Gen{device['generation']}) at {ip}")
+        return {'ip': ip, 'port': self.http_port, 'name': name, 'protocol': 'http', **device}
+
+    async def probe_modbus(self, ip: str) -> List[Dict]:
+        """Pruefe Unit-IDs auf Solax (Seriennummer) bzw. SDM630 (Spannung L1)"""
+        from pymodbus.client import AsyncModbusTcpClient
+
+        client = AsyncModbusTcpClient(ip, port=self.modbus_port, timeout=self.modbus_timeout, retries=0)
+        devices = []
+        try:
+            if not await client.connect():
+                return []
+            for unit in self.modbus_units:
+                device = await self._classify_modbus_unit(client, ip, unit)
+                if device:
+                    devices.append(device)
+        except Exception as e:
+            logger.debug(f"Discovery {ip}: Modbus probe failed ({e})")
+        finally:
+            client.close()
+        return devices
+
+    async def _classify_modbus_unit(self, client, ip: str, unit: int) -> Optional[Dict]:
+        base = {'ip': ip, 'port': self.modbus_port, 'unit_id': unit, 'protocol': 'modbus'}
+
+        # Solax: Seriennummer als ASCII in Holding 0x0000-0x0006
+        try:
+            result = await client.read_holding_registers(0x0000, 7, slave=unit)
+            if not result.isError() and _is_printable(result.registers):
+                serial = b''.join(struct.pack('>H', r) for r in result.registers).rstrip(b'\x00').decode()
+                logger.info(f"✓ Found Solax inverter {serial} at {ip} (unit {unit})")
+                return {**base, 'type': 'solax', 'model': 'Solax', 'serial': serial, 'name': f"Solax {serial}"}
+        except Exception as e:
+            logger.debug(f"Discovery {ip}/{unit}: no Solax ({e})")
+
+        # SDM630: Spannung L1 als Float in Input 0x0000
+        try:
+            result = await client.read_input_registers(0x0000, 2, slave=unit)
+            if not result.isError() and 80.0 <= _registers_to_float(result.registers) <= 300.0:
+                logger.info(f"✓ Found SDM630 at {ip} (unit {unit})")
+                return {**base, 'type': 'sdm630', 'model': 'SDM630', 'name': f"SDM630 {ip}"}
+        except Exception as e:
+            logger.debug(f"Discovery {ip}/{unit}: no SDM630 ({e})")
+        return None
+
+    # ------------------------------------------------------------------
+    # Ergebnisse / synchrone API
+    # ------------------------------------------------------------------
+
+    def _merge(self, found: List[Dict]):
+        """Neue Funde ersetzen alte Eintraege gleicher IP/Typ"""
+        keys = {(d['ip'], d['type']) for d in found}
+        self.discovered = [d for d in self.discovered if (d['ip'], d['type']) not in keys] + found
+
+    async def scan_network_async(self, network: str = "10.0.0.0/24") -> List[Dict]:
+        """Scan komplett ausfuehren und Liste zurueckgeben"""
+        return [device async for device in self.scan(network)]
+
+    def scan_network(self, network: str = "10.0.0.0/24", timeout: float = 60) -> List[Dict]:
+        """Synchrone Version fuer Flask"""
+        self._hosts(network)  # ValueError vor dem Start
+        return run_sync(self.scan_network_async(network), timeout=timeout)
+
+    def stream_network(self, network: str = "10.0.0.0/24", timeout: float = 60) -> Iterator[Dict]:
+        """
+        Synchroner Iterator ueber Funde (fuer gestreamte HTTP-Antworten)
+
+        Raises:
+            ValueError: Ungueltiges Netz (sofort, nicht erst beim Iterieren)
+        """
+        self._hosts(network)
+        return self._stream(network, timeout)
+
+    def _stream(self, network: str, timeout: float) -> Iterator[Dict]:
+        found: queue.Queue = queue.Queue()
+        finished = object()
+
+        async def pump():
+            try:
+                async for device in self.scan(network):
+                    found.put(device)
+            finally:
+                found.put(finished)
+
+        future = get_bridge().submit(pump())
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Discovery timed out after {timeout}s")
+                try:
+                    item = found.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if item is finished:
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def get_discovered(self) -> List[Dict]:
         """Get discovered devices"""
         return self.discovered
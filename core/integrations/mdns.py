@@ -0,0 +1,380 @@
+"""
+EMS-Core v2.0 - mDNS Listener
+Passive Discovery ueber mDNS-Announcements (UDP-Multicast 224.0.0.251:5353)
+
+Shelly Gen2+ (`_shelly._tcp`), Shelly Gen1 (`_http._tcp`, Name `shelly*`) und
+Home Assistant (`_home-assistant._tcp`) kuendigen sich beim Start und nach
+DHCP-Wechseln selbst an. Fingerprints (MAC, Modell, Generation, Firmware, IP)
+werden auf Platte gecacht; aendert sich die IP eines bekannten Geraets, wird
+die Device-Konfiguration (inkl. `device_mapping`) sofort nachgezogen.
+"""
+import asyncio
+import json
+import logging
+import re
+import socket
+import struct
+import time
+from dataclasses import dataclass, asdict, fields
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from core.device_store import atomic_write
+from core.integrations.discovery import SHELLY_GEN2_APPS
+
+logger = logging.getLogger(__name__)
+
+MDNS_GROUP = "224.0.0.251"
+MDNS_PORT = 5353
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_TXT = 16
+TYPE_AAAA = 28
+TYPE_SRV = 33
+
+SERVICE_SHELLY = "_shelly._tcp.local"
+SERVICE_HTTP = "_http._tcp.local"
+SERVICE_HOME_ASSISTANT = "_home-assistant._tcp.local"
+SERVICES = (SERVICE_SHELLY, SERVICE_HTTP, SERVICE_HOME_ASSISTANT)
+
+# Gen1: Praefix des Hostnamens (shelly1pm-XXXXXXXXXXXX)
+SHELLY_GEN1_PREFIXES = {
+    'shellyplug-s': 'shelly_plug',
+    'shellyplug': 'shelly_plug',
+    'shelly1pm': 'shelly_1pm',
+    'shellyswitch25': 'shelly_25',
+}
+
+_MAC_SUFFIX = re.compile(r'-([0-9a-fA-F]{12})$')
+
+
+@dataclass
+class DnsRecord:
+    """Resource Record aus Answer/Additional-Section"""
+    name: str
+    type: int
+    ttl: int
+    data: object  # A: IP, PTR: Name, SRV: (Port, Ziel), TXT: {Key: Wert}
+
+
+def _read_name(packet: bytes, pos: int) -> Tuple[str, int]:
+    """DNS-Name inkl. Kompression (RFC 1035 4.1.4) -> (Name, naechste Position)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = packet[pos]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = pos + 2
+            pos = ((length & 0x3F) << 8) | packet[pos + 1]
+            jumps += 1
+            if jumps > 32:
+                raise ValueError("compression loop")
+            continue
+        pos += 1
+        if length == 0:
+            break
+        labels.append(packet[pos:pos + length].decode('utf-8', 'replace'))
+        pos += length
+    return '.'.join(labels), end if end is not None else pos
+
+
+def _decode_rdata(packet: bytes, rtype: int, pos: int, length: int):
+    rdata = packet[pos:pos + length]
+    if rtype == TYPE_A and length == 4:
+        return socket.inet_ntoa(rdata)
+    if rtype == TYPE_AAAA and length == 16:
+        return socket.inet_ntop(socket.AF_INET6, rdata)
+    if rtype == TYPE_PTR:
+        return _read_name(packet, pos)[0]
+    if rtype == TYPE_SRV:
+        _, _, port = struct.unpack('!HHH', rdata[:6])
+        return port, _read_name(packet, pos + 6)[0]
+    if rtype == TYPE_TXT:
+        txt = {}
+        i = 0
+        while i < length:
+            size = rdata[i]
+            entry = rdata[i + 1:i + 1 + size].decode('utf-8', 'replace')
+            key, _, value = entry.partition('=')
+            if key:
+                txt[key.lower()] = value
+            i += 1 + size
+        return txt
+    return None
+
+
+def parse_dns(packet: bytes) -> Optional[Tuple[int, List[DnsRecord]]]:
+    """
+    Minimaler DNS-Parser fuer mDNS-Antworten
+
+    Returns:
+        (Flags, Records aus Answer/Authority/Additional) oder None bei ungueltigem Paket
+    """
+    try:
+        _, flags, questions, answers, authority, additional = struct.unpack('!6H', packet[:12])
+        pos = 12
+        for _ in range(questions):
+            _, pos = _read_name(packet, pos)
+            pos += 4
+        records = []
+        for _ in range(answers + authority + additional):
+            name, pos = _read_name(packet, pos)
+            rtype, _, ttl, length = struct.unpack('!HHIH', packet[pos:pos + 10])
+            pos += 10
+            if pos + length > len(packet):
+                return None
+            records.append(DnsRecord(name.lower(), rtype, ttl, _decode_rdata(packet, rtype, pos, length)))
+            pos += length
+        return flags, records
+    except (IndexError, ValueError, struct.error):
+        return None
+
+
+def build_query(services=SERVICES) -> bytes:
+    """PTR-Query fuer die Service-Typen (aktive Nachfrage auf Wunsch)"""
+    packet = struct.pack('!6H', 0, 0, len(services), 0, 0, 0)
+    for service in services:
+        packet += b''.join(bytes([len(label)]) + label.encode() for label in service.split('.')) + b'\x00'
+        packet += struct.pack('!HH', TYPE_PTR, 1)
+    return packet
+
+
+@dataclass
+class DeviceFingerprint:
+    """Per mDNS gesehenes Geraet"""
+    key: str                    # MAC (Shelly) bzw. UUID (Home Assistant)
+    hostname: str
+    ip: str
+    service: str
+    type: str = 'generic'       # EMS Device-Typ (shelly_plus_1pm, ...) bzw. home_assistant
+    model: str = ''
+    generation: Optional[int] = None
+    firmware: str = ''
+    mac: Optional[str] = None
+    port: int = 80
+    device_id: Optional[str] = None   # verknuepftes EMS-Device
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+
+
+def classify_announcement(instance: str, service: str, txt: Dict[str, str],
+                          hostname: str, ip: str, port: int) -> Optional[DeviceFingerprint]:
+    """Fingerprint aus Service-Instanz + TXT-Record (None = kein relevantes Geraet)"""
+    label = instance.split('.')[0]
+    match = _MAC_SUFFIX.search(label)
+    mac = match.group(1).upper() if match else (txt.get('mac') or '').upper() or None
+
+    if service == SERVICE_HOME_ASSISTANT:
+        key = txt.get('uuid') or hostname
+        return DeviceFingerprint(key=key, hostname=hostname, ip=ip, service=service, type='home_assistant',
+                                 model='home_assistant', firmware=txt.get('version', ''), port=port)
+
+    if not label.lower().startswith('shelly'):
+        return None
+
+    if txt.get('gen'):
+        app = txt.get('app', '')
+        return DeviceFingerprint(key=mac or hostname, hostname=hostname, ip=ip, service=service,
+                                 type=SHELLY_GEN2_APPS.get(app, 'generic'), model=app,
+                                 generation=int(txt['gen']), firmware=txt.get('ver', ''), mac=mac, port=port)
+
+    if service == SERVICE_SHELLY:
+        return None  # Gen2 ohne TXT (unvollstaendiges Announcement)
+    prefix = label.lower().rsplit('-', 1)[0] if match else label.lower()
+    return DeviceFingerprint(key=mac or hostname, hostname=hostname, ip=ip, service=service,
+                             type=SHELLY_GEN1_PREFIXES.get(prefix, 'generic'), model=prefix,
+                             generation=1, firmware=txt.get('fw', ''), mac=mac, port=port)
+
+
+def load_fingerprints(cache_file: str) -> Dict[str, DeviceFingerprint]:
+    """Lade den Fingerprint-Cache (fehlende/defekte Datei -> leer)"""
+    path = Path(cache_file)
+    try:
+        if path.exists():
+            with open(path, 'r') as f:
+                data = json.load(f)
+            known = {f.name for f in fields(DeviceFingerprint)}
+            return {key: DeviceFingerprint(**{k: v for k, v in entry.items() if k in known})
+                    for key, entry in data.items()}
+    except Exception as e:
+        logger.error(f"Failed to load fingerprints: {e}")
+    return {}
+
+
+class MdnsListener(asyncio.DatagramProtocol):
+    """
+    Passiver mDNS-Listener mit persistentem Fingerprint-Cache
+
+    - Fingerprints ueberleben Neustarts (`cache_file`), bekannte Geraete
+      sind damit ohne Netzwerk-Scan sofort wieder zugeordnet
+    - IP-Wechsel eines bekannten Geraets -> DeviceManager.update_device()
+      fuer alle Devices (Kanaele) mit der alten IP
+    """
+
+    def __init__(self,
+                 device_manager=None,
+                 cache_file: str = "config/device_fingerprints.json",
+                 host: str = "0.0.0.0",
+                 port: int = MDNS_PORT,
+                 group: Optional[str] = MDNS_GROUP,
+                 controllers=None,
+                 resolver=None):
+        """
+        Args:
+            device_manager: DeviceManager fuer IP-Updates (None = nur Cache)
+            cache_file: JSON-Datei des Fingerprint-Caches
+            host: Bind-Adresse
+            port: UDP-Port (0 = frei waehlen, z.B. fuer Tests)
+            group: Multicast-Gruppe (None = nur Unicast)
+            controllers: Controller-Registry (Controller der alten IP verwerfen)
+            resolver: HostResolver, der angekuendigte A-Records uebernimmt
+        """
+        self.device_manager = device_manager
+        self.cache_file = Path(cache_file)
+        self.host = host
+        self.port = port
+        self.group = group
+        self.controllers = controllers
+        self.resolver = resolver
+        self.transport = None
+        self.fingerprints: Dict[str, DeviceFingerprint] = load_fingerprints(cache_file)
+        self.hosts: Dict[str, str] = {fp.hostname: fp.key for fp in self.fingerprints.values()}
+        self.stats = {'packets': 0, 'invalid_packets': 0, 'announcements': 0, 'ip_changes': 0}
+        self._dirty = False
+
+    async def start(self):
+        """Oeffne den UDP-Socket und trete der Multicast-Gruppe bei"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # neben avahi
+        sock.bind((self.host, self.port))
+        if self.group:
+            membership = struct.pack('4s4s', socket.inet_aton(self.group), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        self.port = sock.getsockname()[1]
+
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, sock=sock)
+        logger.info(f"📡 mDNS listener on udp/{self.port} ({len(self.fingerprints)} cached fingerprints)")
+
+    def stop(self):
+        """Schliesse den Socket und speichere den Cache"""
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+        if self._dirty:
+            self.save()
+
+    def query(self):
+        """Einmalige aktive PTR-Query (alle Geraete antworten per Multicast)"""
+        if self.transport and self.group:
+            self.transport.sendto(build_query(), (self.group, MDNS_PORT))
+
+    def datagram_received(self, data: bytes, addr):
+        parsed = parse_dns(data)
+        if parsed is None:
+            self.stats['invalid_packets'] += 1
+            return
+        flags, records = parsed
+        if not flags & 0x8000:
+            return  # Query, keine Antwort
+        self.stats['packets'] += 1
+        try:
+            self.handle_records(records, addr[0])
+        except Exception as e:
+            logger.error(f"✗ mDNS: failed to process announcement from {addr[0]}: {e}")
+
+    def handle_records(self, records: List[DnsRecord], source_ip: str):
+        """Werte die Records eines Pakets aus"""
+        addresses = {r.name: r.data for r in records if r.type == TYPE_A}
+        if self.resolver is not None:
+            for record in records:
+                if record.type == TYPE_A and record.ttl:
+                    self.resolver.learn(record.name, record.data, ttl=record.ttl)
+        srv = {r.name: r.data for r in records if r.type == TYPE_SRV}
+        txt = {r.name: r.data for r in records if r.type == TYPE_TXT}
+        instances = {r.data for r in records if r.type == TYPE_PTR and r.name in SERVICES}
+        instances.update(name for name in srv if name.split('.', 1)[-1] in SERVICES)
+
+        for instance in instances:
+            service = instance.split('.', 1)[1]
+            port, hostname = srv.get(instance, (80, ''))
+            ip = addresses.get(hostname, source_ip)
+            fingerprint = classify_announcement(instance, service, txt.get(instance, {}),
+                                                hostname or instance, ip, port)
+            if fingerprint:
+                self.stats['announcements'] += 1
+                self.upsert(fingerprint)
+
+        # Reine A-Record-Announcements (z.B. nach DHCP-Renew) bekannter Hostnamen
+        for hostname, ip in addresses.items():
+            key = self.hosts.get(hostname)
+            if key in self.fingerprints and self.fingerprints[key].ip != ip:
+                self.upsert(DeviceFingerprint(**{**asdict(self.fingerprints[key]), 'ip': ip}))
+
+    def upsert(self, fingerprint: DeviceFingerprint):
+        """Fingerprint uebernehmen, IP-Wechsel an den DeviceManager melden"""
+        now = time.time()
+        existing = self.fingerprints.get(fingerprint.key)
+        fingerprint.last_seen = now
+
+        if existing is None:
+            fingerprint.first_seen = now
+            fingerprint.device_id = self._linked_device(fingerprint.ip)
+            logger.info(f"mDNS: new {fingerprint.model or fingerprint.type} {fingerprint.key} at {fingerprint.ip}")
+            self._dirty = True
+        else:
+            fingerprint.first_seen = existing.first_seen
+            fingerprint.device_id = existing.device_id or self._linked_device(existing.ip)
+            if existing.ip != fingerprint.ip:
+                self._ip_changed(fingerprint, existing.ip)
+            if (existing.ip, existing.firmware, existing.device_id) != \
+                    (fingerprint.ip, fingerprint.firmware, fingerprint.device_id):
+                self._dirty = True
+
+        self.fingerprints[fingerprint.key] = fingerprint
+        self.hosts[fingerprint.hostname] = fingerprint.key
+        if self._dirty:
+            self.save()
+
+    def _linked_device(self, ip: str) -> Optional[str]:
+        if self.device_manager is None:
+            return None
+        return self.device_manager.device_mapping.get(ip)
+
+    def _ip_changed(self, fingerprint: DeviceFingerprint, old_ip: str):
+        self.stats['ip_changes'] += 1
+        logger.info(f"🔄 mDNS: {fingerprint.key} moved {old_ip} -> {fingerprint.ip}")
+        if self.device_manager is None:
+            return
+        # Alle Kanaele (eigene Devices) der alten IP umziehen - ein Schreibvorgang
+        with self.device_manager.transaction():
+            for device in self.device_manager.get_all_devices():
+                if device.ip != old_ip:
+                    continue
+                if self.device_manager.update_device(device.id, {'ip': fingerprint.ip}):
+                    logger.info(f"✓ Device {device.id}: IP updated to {fingerprint.ip}")
+                    if self.controllers is not None:
+                        self.controllers.invalidate(device.id)
+
+    def save(self):
+        """Persistiere den Fingerprint-Cache"""
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            atomic_write(self.cache_file, json.dumps(
+                {key: asdict(fp) for key, fp in self.fingerprints.items()}, indent=2))
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save fingerprints: {e}")
+
+    def lookup(self, ip: str) -> Optional[DeviceFingerprint]:
+        """Fingerprint zu einer IP"""
+        return next((fp for fp in self.fingerprints.values() if fp.ip == ip), None)
+
+    def get_fingerprints(self) -> List[Dict]:
+        """Alle Fingerprints fuer Logging/API"""
+        return [asdict(fp) for fp in self.fingerprints.values()]
@@ -0,0 +1,289 @@
+"""
+EMS-Core v2.0 - Modbus TCP Proxy
+Liest Wechselrichter/Zaehler einmal pro Intervall und stellt die Register
+per Modbus TCP fuer weitere Leser (Wallbox, Tools, ...) bereit.
+
+Der physische Wechselrichter hat oft nur einen Modbus-Slot - mit dem Proxy
+haelt nur das EMS eine Verbindung, alle anderen lesen aus dem Cache.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from core.utils.health import health_registry
+from core.utils.resolver import host_resolver
+
+logger = logging.getLogger(__name__)
+
+MAX_READ_COUNT = 125  # Modbus-Limit pro Read Holding/Input Registers
+
+
+@dataclass
+class Upstream:
+    """Ein gepolltes Modbus-Geraet"""
+    name: str
+    ip: str
+    port: int = 502
+    unit_id: int = 1
+    serve_unit: int = 1                 # Unit-ID am Proxy
+    blocks: List[Tuple[int, int, str]] = field(default_factory=list)  # (Start, Anzahl, holding/input)
+    client: object = None
+    updated: Optional[float] = None     # monotonic, letzter vollstaendiger Poll
+    polls: int = 0
+    failures: int = 0
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.ip}:{self.port}"
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'Upstream':
+        blocks = []
+        for block in config.get('blocks', []):
+            start, count = int(block[0]), int(block[1])
+            kind = block[2] if len(block) > 2 else 'holding'
+            # Modbus erlaubt max. 125 Register pro Request
+            for offset in range(0, count, MAX_READ_COUNT):
+                blocks.append((start + offset, min(MAX_READ_COUNT, count - offset), kind))
+        unit_id = config.get('unit_id', 1)
+        return cls(
+            name=config.get('name', config['ip']),
+            ip=config['ip'],
+            port=config.get('port', 502),
+            unit_id=unit_id,
+            serve_unit=config.get('serve_unit', unit_id),
+            blocks=blocks
+        )
+
+
+class ModbusProxy:
+    """
+    Modbus TCP Server (pymodbus) mit Register-Cache
+
+    - Ein Poll-Loop liest alle Upstreams einmal pro `interval` ueber eine
+      persistente Verbindung
+    - Leser erhalten die gecachten Register; aelter als `max_age` ->
+      Exception "Gateway Target Device Failed to Respond"
+    - Statistik pro Client (IP)
+    """
+
+    def __init__(self,
+                 upstreams: List[Dict],
+                 host: str = "0.0.0.0",
+                 port: int = 5020,
+                 interval: float = 5.0,
+                 max_age: float = 30.0):
+        """
+        Args:
+            upstreams: [{name, ip, port, unit_id, serve_unit, blocks: [[Start, Anzahl, Typ], ...]}]
+            host: Bind-Adresse des Proxys
+            port: TCP-Port des Proxys (0 = frei waehlen)
+            interval: Poll-Intervall in Sekunden
+            max_age: Max. Alter der Daten, die noch ausgeliefert werden
+        """
+        self.upstreams = [Upstream.from_config(u) for u in upstreams]
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.max_age = max_age
+
+        self.context = None
+        self.server = None
+        self.running = False
+        self.clients: Dict[str, Dict] = {}
+        self._by_unit: Dict[int, Upstream] = {u.serve_unit: u for u in self.upstreams}
+        self._by_endpoint: Dict[Tuple[str, int, int], Upstream] = {
+            (u.ip, u.port, u.unit_id): u for u in self.upstreams
+        }
+
+    # ------------------------------------------------------------------
+    # Server
+    # ------------------------------------------------------------------
+
+    def _build_context(self):
+        from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSparseDataBlock
+
+        slaves = {
+            unit: ModbusSlaveContext(
+                hr=ModbusSparseDataBlock({}), ir=ModbusSparseDataBlock({}),
+                di=ModbusSparseDataBlock({}), co=ModbusSparseDataBlock({}),
+                zero_mode=True
+            )
+            for unit in self._by_unit
+        }
+        return ModbusServerContext(slaves=slaves, single=False)
+
+    async def start(self):
+        """Starte Modbus-Server (der Poll-Loop laeuft separat ueber run())"""
+        from pymodbus.server import ModbusTcpServer
+        from pymodbus.server.async_io import ModbusServerRequestHandler
+        from pymodbus.pdu import ModbusExceptions
+
+        proxy = self
+
+        class TrackingHandler(ModbusServerRequestHandler):
+            def execute(self, request, *addr):
+                peer = self.transport.get_extra_info('peername') if self.transport else None
+                if not proxy.record_request(peer[0] if peer else 'unknown', request):
+                    response = request.doException(ModbusExceptions.GatewayNoResponse)
+                    response.transaction_id = request.transaction_id
+                    response.slave_id = request.slave_id
+                    self.send(response, *addr)
+                    return
+                super().execute(request, *addr)
+
+        class ProxyServer(ModbusTcpServer):
+            def callback_new_connection(self):
+                return TrackingHandler(self)
+
+        self.context = self._build_context()
+        self.server = ProxyServer(self.context, address=(self.host, self.port), ignore_missing_slaves=False)
+        await self.server.transport_listen()
+        if self.port == 0:
+            self.port = self.server.transport.sockets[0].getsockname()[1]
+        logger.info(f"📡 Modbus proxy listening on {self.host}:{self.port} "
+                    f"(units {sorted(self._by_unit)})")
+
+    async def stop(self):
+        """Stoppe Server, Poll-Loop und Upstream-Verbindungen"""
+        self.running = False
+        if self.server:
+            await self.server.shutdown()
+            self.server = None
+        for upstream in self.upstreams:
+            if upstream.client:
+                upstream.client.close()
+                upstream.client = None
+
+    def record_request(self, client: str, request) -> bool:
+        """
+        Zaehle Request pro Client
+
+        Returns:
+            False wenn die Daten der angefragten Unit veraltet sind
+        """
+        stats = self.clients.setdefault(client, {
+            'requests': 0, 'stale': 0, 'by_function': {}, 'first_seen': time.time(), 'last_request': None
+        })
+        stats['requests'] += 1
+        stats['last_request'] = time.time()
+        code = str(request.function_code)
+        stats['by_function'][code] = stats['by_function'].get(code, 0) + 1
+
+        upstream = self._by_unit.get(request.slave_id)
+        if upstream is not None and not self._is_fresh(upstream):
+            stats['stale'] += 1
+            return False
+        return True
+
+    def _is_fresh(self, upstream: Upstream, max_age: Optional[float] = None) -> bool:
+        max_age = self.max_age if max_age is None else max_age
+        return upstream.updated is not None and time.monotonic() - upstream.updated <= max_age
+
+    # ------------------------------------------------------------------
+    # Poll-Loop
+    # ------------------------------------------------------------------
+
+    async def run(self):
+        """Lese alle Upstreams einmal pro Intervall"""
+        self.running = True
+        while self.running:
+            started = time.monotonic()
+            await asyncio.gather(*(self.poll(u) for u in self.upstreams))
+            await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    async def poll(self, upstream: Upstream) -> bool:
+        """Lese alle Bloecke eines Upstreams ueber die persistente Verbindung"""
+        from pymodbus.client import AsyncModbusTcpClient
+
+        health = health_registry.get(upstream.endpoint)
+        if not health.allow_request():
+            logger.debug(f"Modbus proxy {upstream.name}: skipped - circuit open")
+            return False
+
+        started = time.perf_counter()
+        try:
+            if upstream.client is None or not upstream.client.connected:
+                address = await host_resolver.resolve_host(upstream.ip)
+                upstream.client = AsyncModbusTcpClient(address, port=upstream.port, timeout=health.timeout())
+                if not await upstream.client.connect():
+                    raise ConnectionError("connection failed")
+
+            values = []
+            for start, count, kind in upstream.blocks:
+                if kind == 'input':
+                    result = await upstream.client.read_input_registers(start, count, slave=upstream.unit_id)
+                else:
+                    result = await upstream.client.read_holding_registers(start, count, slave=upstream.unit_id)
+                if result.isError():
+                    raise IOError(f"read error at {start} ({kind})")
+                values.append((start, kind, result.registers))
+
+            for start, kind, registers in values:
+                self.update(upstream.serve_unit, start, registers, kind)
+            upstream.updated = time.monotonic()
+            upstream.polls += 1
+            health.record_success(time.perf_counter() - started)
+            return True
+
+        except Exception as e:
+            upstream.failures += 1
+            health.record_failure(f"{type(e).__name__}: {e}")
+            logger.warning(f"✗ Modbus proxy {upstream.name}: poll failed - {e}")
+            if upstream.client:
+                upstream.client.close()
+                upstream.client = None
+            return False
+
+    # ------------------------------------------------------------------
+    # Register-Cache
+    # ------------------------------------------------------------------
+
+    def update(self, unit: int, address: int, values: List[int], kind: str = 'holding'):
+        """Schreibe Register in den Cache der Unit"""
+        if self.context is None:
+            self.context = self._build_context()
+        function_code = 4 if kind == 'input' else 3
+        self.context[unit].setValues(function_code, address, list(values))
+
+    def polls_endpoint(self, ip: str, port: int) -> bool:
+        """Haelt der Proxy die Verbindung zu diesem Geraet (IP/Port, beliebige Unit)?"""
+        return any(u.ip == ip and u.port == port for u in self.upstreams)
+
+    def get_registers(self, ip: str, port: int, unit_id: int, address: int, count: int = 1,
+                      kind: str = 'holding', max_age: Optional[float] = None) -> Optional[List[int]]:
+        """
+        Gecachte Register eines Upstreams (fuer EMS-interne Leser)
+
+        Returns:
+            Register oder None (unbekanntes Geraet, nicht gecacht, veraltet)
+        """
+        upstream = self._by_endpoint.get((ip, port, unit_id))
+        if upstream is None or self.context is None or not self._is_fresh(upstream, max_age):
+            return None
+        function_code = 4 if kind == 'input' else 3
+        slave = self.context[upstream.serve_unit]
+        if not slave.validate(function_code, address, count):
+            return None
+        return slave.getValues(function_code, address, count)
+
+    def get_stats(self) -> Dict:
+        """Statistik fuer Logging/API"""
+        now = time.monotonic()
+        return {
+            'port': self.port,
+            'upstreams': [
+                {
+                    'name': u.name,
+                    'endpoint': u.endpoint,
+                    'serve_unit': u.serve_unit,
+                    'polls': u.polls,
+                    'failures': u.failures,
+                    'age': round(now - u.updated, 1) if u.updated is not None else None
+                }
+                for u in self.upstreams
+            ],
+            'clients': {ip: dict(stats) for ip, stats in self.clients.items()}
+        }
@@ -0,0 +1,115 @@
+"""
+EMS-Core v2.0 - Shelly Outbound WebSocket
+Empfaengt NotifyStatus / NotifyFullStatus / NotifyEvent von Shelly Gen2/Plus/Pro
+
+Konfiguration am Shelly: Settings -> Outbound WebSocket ->
+    ws://<ems-host>:8765/shelly
+"""
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+from core.integrations.state_cache import DeviceStateCache, state_cache
+
+logger = logging.getLogger(__name__)
+
+PUSH_SOURCE = "ws"
+
+
+class ShellyWebSocketServer:
+    """WebSocket-Endpoint, zu dem sich Shelly Gen2 Devices verbinden"""
+
+    def __init__(self,
+                 cache: Optional[DeviceStateCache] = None,
+                 host: str = "0.0.0.0",
+                 port: int = 8765,
+                 path: str = "/shelly"):
+        self.cache = cache or state_cache
+        self.host = host
+        self.port = port
+        self.path = path
+        self.runner = None
+        self.clients: Dict[str, Dict] = {}  # IP -> Verbindungs-Infos
+
+    async def start(self):
+        """Starte den Server (Port 0 = freien Port waehlen)"""
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get(self.path, self.handle_connection)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"📡 Shelly WebSocket server listening on ws://{self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Stoppe den Server"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_connection(self, request):
+        """Eine Verbindung pro Shelly - bleibt offen solange das Geraet laeuft"""
+        from aiohttp import web, WSMsgType
+
+        ws = web.WebSocketResponse(heartbeat=60)
+        await ws.prepare(request)
+
+        ip = request.remote
+        client = {'src': None, 'connected_at': time.time(), 'last_message': None, 'messages': 0}
+        self.clients[ip] = client
+        self.cache.set_connected(ip, PUSH_SOURCE)
+        logger.info(f"Shelly {ip} connected via WebSocket")
+
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    client['messages'] += 1
+                    client['last_message'] = time.time()
+                    self.handle_message(ip, msg.data, client)
+                elif msg.type == WSMsgType.ERROR:
+                    logger.warning(f"Shelly {ip} WebSocket error: {ws.exception()}")
+        finally:
+            self.cache.set_connected(ip, None)
+            self.clients.pop(ip, None)
+            logger.info(f"Shelly {ip} WebSocket disconnected")
+
+        return ws
+
+    def handle_message(self, ip: str, raw: str, client: Optional[Dict] = None):
+        """Verarbeite eine JSON-RPC Notification"""
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            logger.debug(f"Shelly {ip}: invalid JSON frame")
+            return
+
+        if client is not None and message.get('src'):
+            client['src'] = message['src']
+
+        method = message.get('method')
+        params = message.get('params') or {}
+
+        if method in ('NotifyStatus', 'NotifyFullStatus'):
+            for component, values in params.items():
+                if not component.startswith('switch:') or not isinstance(values, dict):
+                    continue
+                channel = int(component.split(':', 1)[1])
+                output = values.get('output')
+                self.cache.update(
+                    ip, channel,
+                    state=None if output is None else ('on' if output else 'off'),
+                    power=values.get('apower'),
+                    source=PUSH_SOURCE
+                )
+        elif method == 'NotifyEvent':
+            for event in params.get('events', []):
+                logger.debug(f"Shelly {ip} event: {event.get('component')} {event.get('event')}")
+
+    def get_clients(self) -> Dict[str, Dict]:
+        """Aktuell verbundene Devices"""
+        return {ip: dict(info) for ip, info in self.clients.items()}
@@ -0,0 +1,114 @@
+"""
+EMS-Core v2.0 - Device State Cache
+Zuletzt bekannter Zustand/Leistung pro Geraete-Kanal aus Push-Quellen
+(Shelly WebSocket, CoIoT) und Polling
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceStateCache:
+    """
+    Thread-sicherer Cache: (IP, Kanal) -> {state, power, updated, source}
+
+    Push-Updates koennen partiell sein (nur geaenderte Felder) und werden
+    mit dem bestehenden Eintrag zusammengefuehrt. Ein Eintrag gilt als
+    frisch, wenn er juenger als `max_age` ist oder das Geraet eine offene
+    Push-Verbindung hat (dann meldet es jede Aenderung selbst). Quellen ohne
+    Verbindungsabbau (CoIoT/UDP) melden sich mit einer Gueltigkeit `ttl` an.
+    """
+
+    def __init__(self):
+        self.entries: Dict[Tuple[str, int], Dict] = {}
+        self.connected: Dict[str, str] = {}  # IP -> Push-Quelle mit offener Verbindung
+        self.connected_until: Dict[str, float] = {}  # IP -> Ablauf (monotonic), nur mit ttl
+        self._lock = threading.Lock()
+
+    def update(self, ip: str, channel: int = 0,
+               state: Optional[str] = None,
+               power: Optional[float] = None,
+               source: str = "poll"):
+        """Aktualisiere Eintrag (None-Felder bleiben unveraendert)"""
+        with self._lock:
+            entry = self.entries.setdefault((ip, channel), {'state': None, 'power': None})
+            if state is not None:
+                entry['state'] = state
+            if power is not None:
+                entry['power'] = power
+            entry['updated'] = time.monotonic()
+            entry['timestamp'] = time.time()
+            entry['source'] = source
+
+    def get(self, ip: str, channel: int = 0, max_age: Optional[float] = None) -> Optional[Dict]:
+        """
+        Hole Eintrag
+
+        Args:
+            max_age: Nur frische Eintraege liefern (Sekunden); None = beliebig alt
+        """
+        with self._lock:
+            entry = self.entries.get((ip, channel))
+            if entry is None:
+                return None
+            if max_age is not None and not self._is_fresh(ip, entry, max_age):
+                return None
+            return dict(entry)
+
+    def _is_fresh(self, ip: str, entry: Dict, max_age: float) -> bool:
+        if entry['state'] is None:
+            return False
+        if self._connected_source(ip) == entry['source']:
+            return True
+        return time.monotonic() - entry['updated'] <= max_age
+
+    def _connected_source(self, ip: str) -> Optional[str]:
+        until = self.connected_until.get(ip)
+        if until is not None and time.monotonic() > until:
+            return None
+        return self.connected.get(ip)
+
+    def set_connected(self, ip: str, source: Optional[str], ttl: Optional[float] = None):
+        """
+        Markiere offene (source) bzw. geschlossene (None) Push-Verbindung
+
+        Args:
+            ttl: Verbindung gilt nur so viele Sekunden (bis zum naechsten
+                Aufruf) - fuer Quellen ohne Verbindungsabbau, z.B. CoIoT
+        """
+        with self._lock:
+            if source:
+                self.connected[ip] = source
+                if ttl is None:
+                    self.connected_until.pop(ip, None)
+                else:
+                    self.connected_until[ip] = time.monotonic() + ttl
+            else:
+                self.connected.pop(ip, None)
+                self.connected_until.pop(ip, None)
+
+    def is_connected(self, ip: str) -> bool:
+        """Hat das Geraet eine offene (nicht abgelaufene) Push-Verbindung?"""
+        with self._lock:
+            return self._connected_source(ip) is not None
+
+    def get_stats(self) -> Dict:
+        """Statistiken fuer Logging/API"""
+        now = time.monotonic()
+        with self._lock:
+            by_source: Dict[str, int] = {}
+            for entry in self.entries.values():
+                by_source[entry['source']] = by_source.get(entry['source'], 0) + 1
+            return {
+                'entries': len(self.entries),
+                'push_connected': sum(1 for ip in self.connected if self._connected_source(ip)),
+                'by_source': by_source,
+                'oldest_age': round(max((now - e['updated'] for e in self.entries.values()), default=0.0), 1)
+            }
+
+
+# Prozessweiter Cache
+state_cache = DeviceStateCache()
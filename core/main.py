@@ -3,15 +3,30 @@
 EMS-Core v2.0 - Main Optimizer Loop
 Das Herzstück: Intelligente Energie-Verteilung basierend auf PV, Battery, Grid
 """
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 import asyncio
 import logging
-import time
 from typing import List, Dict, Optional
 from datetime import datetime
 
 from core.device_manager import DeviceManager, DeviceConfig
+from core.device_store import open_device_store
 from core.energy_sources import EnergySourcesManager
-from core.controllers.shelly import ShellyController
+from core.controllers.base import CAP_SWITCH, CAP_STATE, CAP_BATCH_READ
+from core.controllers.registry import ControllerRegistry, controller_registry
+from core.controllers.sg_ready import register_sg_ready
+from core.optimizer.power_profile import PowerProfileManager
+from core.optimizer.grid_guard import GridGuard
+from core.optimizer.phase_budget import PhaseBudget
+from core.optimizer.reconciler import Reconciler
+from core.utils.settings import load_settings
+from core.utils.config_snapshot import ConfigSnapshot, StartupTimer
+from core.utils.health import health_registry
+from core.utils.http import close_session
+from core.utils.resolver import host_resolver
+from core.integrations.state_cache import DeviceStateCache, state_cache
 
 logging.basicConfig(
     level=logging.INFO,
@@ -35,26 +50,110 @@ class EMSOptimizer:
     def __init__(self, 
                  device_manager: DeviceManager,
                  energy_manager: EnergySourcesManager,
-                 cycle_interval: int = 30):
+                 cycle_interval: int = 30,
+                 power_profiles: Optional[PowerProfileManager] = None,
+                 settings: Optional[Dict] = None,
+                 device_states: Optional[DeviceStateCache] = None,
+                 controllers: Optional[ControllerRegistry] = None):
         """
         Args:
             device_manager: Verwaltet alle steuerbaren Devices
             energy_manager: Liefert Energie-Daten
             cycle_interval: Sekunden zwischen Optimierungs-Zyklen
+            power_profiles: Gelernte Leistungsaufnahme der Devices
+            settings: Inhalt von settings.yaml (siehe core.utils.settings)
+            device_states: Cache mit gepushten/gepollten Device-Zustaenden
+            controllers: Controller-Registry (Standard: prozessweite Registry)
         """
         self.device_manager = device_manager
         self.energy_manager = energy_manager
         self.cycle_interval = cycle_interval
+        self.power_profiles = power_profiles or PowerProfileManager()
+        
+        self.settings = settings or load_settings()
+        self.device_states = device_states or state_cache
+        self.controllers = controllers or controller_registry
+        if self.settings.get('sg_ready', {}).get('enabled'):
+            register_sg_ready(self.controllers, device_manager.get_device, self.settings['sg_ready'])
         
         self.running = False
         self.current_state = {}
+        self.grid_guard: Optional[GridGuard] = None
+        self.reconciler = Reconciler(
+            device_manager.get_device,
+            controllers=self.controllers,
+            cache=self.device_states,
+            **self.settings.get('reconciliation', {})
+        )
+        self._wakeup = asyncio.Event()
         
         # Strategien
         self.min_surplus_threshold = 200  # Minimum W um Devices zuzuschalten
-        self.hysteresis = 100  # Hysterese um Flackern zu vermeiden
+        self.hysteresis = self.settings.get('hysteresis', 100)  # Hysterese um Flackern zu vermeiden
+        self.battery_min_soc = self.settings.get('battery', {}).get('min_soc', 20)
+        self.battery_max_soc = self.settings.get('battery', {}).get('max_soc', 90)
         
         logger.info("EMS Optimizer initialized")
     
+    def create_grid_guard(self) -> GridGuard:
+        """Erzeuge den schnellen Schutz-Loop fuer grid.max_import / grid.max_export"""
+        grid = self.settings.get('grid', {})
+        protection = self.settings.get('grid_protection', {})
+        interval = protection.get('interval', 0.5)
+        # Solax: hoechstens ein Modbus-Read pro zwei Guard-Intervallen (persistente Verbindung)
+        solax_max_age = protection.get('solax_max_age', 2 * interval)
+        self.grid_guard = GridGuard(
+            read_grid_power=lambda: self.energy_manager.read_grid_power(max_age=solax_max_age),
+            get_candidates=self.get_running_devices,
+            shed_device=self.shed_device,
+            max_import=grid.get('max_import', 0),
+            max_export=grid.get('max_export', 0),
+            interval=interval,
+            max_reaction=protection.get('max_reaction', 2.0),
+            shed_hold=protection.get('shed_hold', 300),
+            settle_time=protection.get('settle_time', 3.0),
+            on_export_exceeded=self.request_cycle
+        )
+        return self.grid_guard
+    
+    def on_devices_reloaded(self, diff):
+        """Hot Reload: Laufzeit-Zustand entfernter Devices verwerfen"""
+        for device_id in diff.removed:
+            self.current_state.pop(device_id, None)
+            self.reconciler.forget(device_id)
+            self.controllers.invalidate(device_id)
+    
+    def request_cycle(self):
+        """Starte den naechsten Optimierungs-Zyklus sofort"""
+        self._wakeup.set()
+    
+    def get_running_devices(self) -> List[tuple]:
+        """Laufende steuerbare Devices mit gemessener/geschaetzter Leistung"""
+        running = []
+        for device_id, state in self.current_state.items():
+            if state != 'on':
+                continue
+            device = self.device_manager.get_device(device_id)
+            if not device or not device.can_control:
+                continue
+            power = self.power_profiles.measured_power(device_id)
+            if not power:
+                power = self.power_profiles.estimate(device)
+            running.append((device, power))
+        return running
+    
+    async def shed_device(self, device: DeviceConfig) -> bool:
+        """Lastabwurf durch den Grid Guard"""
+        controller = self.controllers.get(device)
+        if controller is None or not controller.supports(CAP_SWITCH):
+            return False
+        success = await controller.turn_off()
+        if success:
+            self.current_state[device.id] = 'off'
+            self.reconciler.set_desired(device.id, 'off', 'grid guard - load shed')
+            self.reconciler.observe(device.id, 'off')
+        return success
+    
     async def run(self):
         """Hauptschleife - laeuft kontinuierlich"""
         self.running = True
@@ -87,9 +186,14 @@ class EMSOptimizer:
                 # 6. Log Summary
                 self.log_cycle_summary(energy_data, available_power, decisions)
                 
-                # 7. Wait for next cycle
+                # 7. Wait for next cycle (oder frueher, wenn angestossen)
                 logger.info(f"⏳ Waiting {self.cycle_interval}s for next cycle...")
-                await asyncio.sleep(self.cycle_interval)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.cycle_interval)
+                    logger.info("⚡ Early cycle requested")
+                except asyncio.TimeoutError:
+                    pass
                 
             except KeyboardInterrupt:
                 logger.info("⚠️ Received interrupt signal")
@@ -124,12 +228,12 @@ class EMSOptimizer:
         else:
             available = 0
         
-        # Batterie-SOC beruecksichtigen
-        # Wenn Battery voll (>90%), mehr aggressiv optionale Devices zuschalten
-        if battery_soc > 90:
+        # Batterie-SOC beruecksichtigen (battery.min_soc / battery.max_soc)
+        # Wenn Battery voll, mehr aggressiv optionale Devices zuschalten
+        if battery_soc > self.battery_max_soc:
             available += 200  # Bonus
-        # Wenn Battery leer (<20%), konservativer sein
-        elif battery_soc < 20:
+        # Wenn Battery leer, konservativer sein
+        elif battery_soc < self.battery_min_soc:
             available = max(0, available - 300)  # Penalty
         
         logger.info(f"💡 Available Power: {available:.0f}W (Grid: {grid_power:.0f}W, Battery SOC: {battery_soc:.0f}%)")
@@ -158,37 +262,133 @@ class EMSOptimizer:
         priority_order = {'CRITICAL': 0, 'HIGH': 1, 'MEDIUM': 2, 'LOW': 3, 'OPTIONAL': 4}
         controllable_devices.sort(key=lambda d: priority_order.get(d.priority, 99))
         
-        remaining_power = available_power
+        # Status-Sweep: aktueller Zustand + Messwerte fuer die Power-Profile
+        states = await self.sweep_device_states(controllable_devices)
+        self.power_profiles.save_profiles()  # gedrosselt, siehe save_interval
+        
+        # Nicht erreichbare Devices: letzter bekannter Zustand statt 'unknown'
+        for device in controllable_devices:
+            states[device.id] = self.reconciler.observe(device.id, states[device.id]) or 'unknown'
+        
+        # Laufende Ueberschuss-Verbraucher stecken bereits im Grid-Wert:
+        # ihre gemessene Leistung steht fuer die Neuverteilung zur Verfuegung
+        surplus_priorities = ('MEDIUM', 'LOW', 'OPTIONAL')
+        running_power = {}
+        for device in controllable_devices:
+            if device.priority in surplus_priorities and states[device.id] == 'on':
+                measured = self.power_profiles.measured_power(device.id)
+                running_power[device.id] = (
+                    measured if measured is not None else self.power_profiles.estimate(device)
+                )
+        
+        remaining_power = available_power + sum(running_power.values())
+        
+        # Zweite Nebenbedingung: Ueberschuss je Phase (opt-in, falls gemessen)
+        phase_budget = None
+        if self.settings.get('grid', {}).get('per_phase_balance', False):
+            phase_budget = PhaseBudget.from_energy_data(energy_data, reserve=self.hysteresis)
+        if phase_budget:
+            for device in controllable_devices:
+                if device.id in running_power:
+                    phase_budget.release(device, running_power[device.id])
         
         for device in controllable_devices:
-            decision = await self.decide_device_action(device, remaining_power, energy_data)
+            decision = await self.decide_device_action(
+                device, remaining_power, energy_data, current_state=states[device.id]
+            )
+            
+            # Vom Grid Guard abgeworfene Devices bleiben gesperrt
+            if (decision and decision['action'] == 'on' and
+                    self.grid_guard and self.grid_guard.is_shed(device.id)):
+                logger.info(f"🛡️ {device.name} ({device.id}) held off by grid guard")
+                continue
+            
+            if phase_budget and device.priority in surplus_priorities:
+                decision = self.apply_phase_constraint(
+                    device, decision, states[device.id], phase_budget,
+                    running_power.get(device.id)
+                )
+            
+            # Rate-Limit des Controllers (z.B. SG-Ready Moduswechsel)
+            if decision:
+                controller = self.controllers.get(device)
+                hold = controller.hold_remaining() if controller else 0.0
+                if hold > 0:
+                    logger.info(f"⏸️ {device.name} ({device.id}) held for {hold:.0f}s (rate limit)")
+                    decision = None
             
             if decision:
                 decisions.append(decision)
                 
                 # Subtract estimated power consumption
                 if decision['action'] == 'on':
-                    estimated_power = device.power_rating or 500  # Default 500W
-                    remaining_power -= estimated_power
+                    remaining_power -= self.power_profiles.estimate(device)
+            else:
+                # Keine Aenderung gewuenscht: Soll = Ist
+                if states[device.id] != 'unknown':
+                    self.reconciler.set_desired(device.id, states[device.id])
+                if device.id in running_power:
+                    # Bleibt an: gemessene Leistung wieder abziehen
+                    remaining_power -= running_power[device.id]
         
         return decisions
     
+    def apply_phase_constraint(self,
+                               device: DeviceConfig,
+                               decision: Optional[Dict],
+                               current_state: Optional[str],
+                               phase_budget: PhaseBudget,
+                               running_power: Optional[float]) -> Optional[Dict]:
+        """
+        Pruefe eine Entscheidung gegen den Phasen-Ueberschuss
+        
+        Devices, die an sein sollen (neu oder weiterhin), muessen auf ihre
+        Phase(n) passen - sonst wird das Einschalten verworfen bzw. ein
+        laufendes Device abgeschaltet. Greedy in Prioritaets-Reihenfolge: O(n).
+        """
+        turning_on = decision is not None and decision['action'] == 'on'
+        staying_on = decision is None and current_state == 'on'
+        if not (turning_on or staying_on):
+            return decision
+        
+        power = running_power if staying_on and running_power else self.power_profiles.estimate(device)
+        phase = phase_budget.limiting_phase(device, power)
+        if phase is None:
+            phase_budget.consume(device, power)
+            return decision
+        
+        if turning_on:
+            logger.info(f"🔌 {device.name} ({device.id}) not switched on - phase {phase} has no surplus")
+            return None
+        return {
+            'device_id': device.id,
+            'device_name': device.name,
+            'action': 'off',
+            'reason': f'{device.priority} priority - insufficient surplus on phase {phase}',
+            'priority': device.priority
+        }
+    
     async def decide_device_action(self, 
                                    device: DeviceConfig, 
                                    remaining_power: float,
-                                   energy_data: Dict) -> Optional[Dict]:
+                                   energy_data: Dict,
+                                   current_state: Optional[str] = None) -> Optional[Dict]:
         """
         Entscheide Aktion fuer ein einzelnes Device
         
+        Args:
+            current_state: Bereits gelesener Zustand (sonst wird er abgefragt)
+        
         Returns:
             Decision dict oder None wenn keine Aenderung
         """
         device_id = device.id
         priority = device.priority
-        estimated_power = device.power_rating or 500
+        estimated_power = self.power_profiles.estimate(device)
         
         # Hole aktuellen Status (wenn moeglich)
-        current_state = await self.get_device_current_state(device)
+        if current_state is None:
+            current_state = await self.get_device_current_state(device)
         
         # Entscheidungslogik basierend auf Prioritaet
         
@@ -270,61 +470,92 @@ class EMSOptimizer:
         
         return None  # Keine Aenderung noetig
     
+    def _record_status(self, device: DeviceConfig, status: Dict) -> str:
+        """Uebernehme gelesenen Status in current_state + Power-Profil"""
+        state = status.get('state', 'unknown')
+        self.current_state[device.id] = state
+        self.power_profiles.record(device.id, state, status.get('power'))
+        if state != 'unknown' and device.ip:  # virtuelle Devices (SG-Ready) ohne Cache-Eintrag
+            self.device_states.update(device.ip, device.channel, state=state,
+                                      power=status.get('power'), source='poll')
+        return state
+    
     async def get_device_current_state(self, device: DeviceConfig) -> Optional[str]:
         """Hole aktuellen Zustand eines Devices (on/off/unknown)"""
         try:
-            if 'shelly' in device.type:
-                ip = device.connection_params.get('ip')
-                if ip:
-                    controller = ShellyController(ip, device.type)
-                    status = await controller.get_status()
-                    if status:
-                        return status.get('state', 'unknown')
+            controller = self.controllers.get(device)
+            if controller is not None and controller.supports(CAP_STATE):
+                status = await controller.get_status(fields=('state', 'power'))
+                if status:
+                    return self._record_status(device, status)
         except Exception as e:
             logger.debug(f"Could not get state for {device.id}: {e}")
         
         return 'unknown'
     
-    async def execute_decisions(self, decisions: List[Dict]):
-        """Fuehre Control-Entscheidungen aus"""
-        if not decisions:
-            logger.info("✅ No control actions needed")
-            return
+    async def sweep_device_states(self, devices: List[DeviceConfig]) -> Dict[str, str]:
+        """
+        Lese den Zustand aller Devices
         
-        logger.info(f"🎯 Executing {len(decisions)} control actions...")
+        Frische Werte aus dem State-Cache (WebSocket/CoIoT-Push) werden ohne
+        HTTP-Request uebernommen; gepollt werden nur stille Devices - jeden
+        Zyklus, eigene Poll-Werte gelten nur bis zum naechsten Zyklus.
+        Mehrkanal-Geraete (mehrere Devices mit gleicher IP) werden mit einem
+        einzigen Status-Request gelesen und auf alle Kanaele verteilt.
+        Physische Geraete werden parallel abgefragt.
+        """
+        states = {device.id: 'unknown' for device in devices}
+        units: Dict[str, List[tuple]] = {}
+        max_age = self.cycle_interval * 2
+        for device in devices:
+            controller = self.controllers.get(device)
+            if controller is None or not controller.supports(CAP_STATE):
+                continue
+            cached = self.device_states.get(device.ip, device.channel, max_age=max_age) if device.ip else None
+            if cached and cached['source'] == 'poll' and time.monotonic() - cached['updated'] >= self.cycle_interval:
+                cached = None  # Poll aus einem frueheren Zyklus -> neu lesen
+            if cached:
+                states[device.id] = cached['state']
+                self.current_state[device.id] = cached['state']
+                self.power_profiles.record(device.id, cached['state'], cached['power'])
+                continue
+            units.setdefault(controller.unit_key, []).append((device, controller))
         
-        for decision in decisions:
-            device_id = decision['device_id']
-            action = decision['action']
-            reason = decision['reason']
-            device_name = decision['device_name']
+        async def sweep_unit(unit: List[tuple]):
+            controller = unit[0][1]
+            if len(unit) == 1 or not controller.supports(CAP_BATCH_READ):
+                for device, _ in unit:
+                    states[device.id] = await self.get_device_current_state(device)
+                return
             
-            try:
-                device = self.device_manager.get_device(device_id)
-                if not device:
-                    logger.error(f"❌ Device {device_id} not found")
-                    continue
-                
-                # Execute control command
-                if 'shelly' in device.type:
-                    ip = device.connection_params.get('ip')
-                    if ip:
-                        controller = ShellyController(ip, device.type)
-                        
-                        if action == 'on':
-                            success = await controller.turn_on()
-                        elif action == 'off':
-                            success = await controller.turn_off()
-                        else:
-                            success = False
-                        
-                        if success:
-                            logger.info(f"✅ {device_name} ({device_id}) -> {action.upper()} | Reason: {reason}")
-                        else:
-                            logger.error(f"❌ {device_name} ({device_id}) -> {action.upper()} FAILED")
-                
-            except Exception as e:
-                logger.error(f"❌ Failed to control {device_name} ({device_id}): {e}")
+            unit_devices = [d for d, _ in unit]
+            statuses = await controller.read_batch({d.channel for d in unit_devices})
+            if statuses:
+                for device in unit_devices:
+                    states[device.id] = self._record_status(device, statuses[device.channel])
+        
+        await asyncio.gather(*(sweep_unit(unit) for unit in units.values()))
+        return states
+    
+    async def execute_decisions(self, decisions: List[Dict]):
+        """
+        Uebernimm Control-Entscheidungen als Soll-Zustand und gleiche ab
+        
+        Der Reconciler schaltet nur Devices, deren beobachteter Zustand vom
+        Soll abweicht und deren Retry-Backoff abgelaufen ist - auch solche,
+        deren Befehl in einem frueheren Zyklus fehlgeschlagen ist.
+        """
+        for decision in decisions:
+            # Letzte Entscheidung pro Device gewinnt
+            self.reconciler.set_desired(decision['device_id'], decision['action'], decision['reason'])
+        
+        results = await self.reconciler.reconcile()
+        self.current_state.update(self.reconciler.get_observed())
+        
+        if not results:
+            logger.info("✅ No control actions needed")
+        else:
+            logger.info(f"🎯 Executed {len(results)} control actions ({sum(results.values())} verified)")
     
     def log_cycle_summary(self, energy_data: Dict, available_power: float, decisions: List[Dict]):
         """Log Zusammenfassung des Optimierungs-Zyklus"""
@@ -333,12 +564,29 @@ class EMSOptimizer:
         logger.info(f"   PV: {energy_data['pv_power']:.0f}W | Grid: {energy_data['grid_power']:.0f}W | Battery: {energy_data['battery_power']:.0f}W ({energy_data['battery_soc']:.0f}%)")
         logger.info(f"   House: {energy_data['house_consumption']:.0f}W | Available: {available_power:.0f}W")
         logger.info(f"   Control Actions: {len(decisions)}")
+        if self.grid_guard and self.grid_guard.histogram.count:
+            reaction = self.grid_guard.histogram.to_dict()
+            logger.info(f"   Grid Guard: {reaction['count']} sheds, avg {reaction['avg_ms']}ms, max {reaction['max_ms']}ms")
+        reconciliation = self.reconciler.get_metrics()
+        logger.info(
+            f"   Reconciler: {reconciliation['drifting']}/{reconciliation['devices']} drifting, "
+            f"{reconciliation['commands_sent']} commands sent, {reconciliation['commands_failed']} failed"
+        )
+        resolver = host_resolver.get_stats()
+        if resolver['lookups']:
+            logger.info(
+                f"   Resolver: {resolver['hits']}/{resolver['lookups']} cached, "
+                f"{resolver['failures']} failures, {resolver['stale_served']} stale"
+            )
         logger.info("")
     
     def stop(self):
         """Stoppe den Optimizer"""
         logger.info("🛑 Stopping optimizer...")
         self.running = False
+        if self.grid_guard:
+            self.grid_guard.stop()
+        self.power_profiles.save_profiles(force=True)
 
 
 async def main():
@@ -346,10 +594,19 @@ async def main():
     logger.info("="*60)
     logger.info("🚀 EMS-Core v2.0 - Energy Management System")
     logger.info("="*60)
+    startup = StartupTimer(_IMPORT_STARTED)
+    startup.mark('imports')
     
-    # Initialize Components
-    device_manager = DeviceManager()
-    energy_manager = EnergySourcesManager()
+    # Initialize Components (unveraenderte Konfigurationsdateien aus dem Snapshot)
+    snapshot = ConfigSnapshot()
+    settings = load_settings(snapshot=snapshot)
+    host_resolver.configure(**settings.get('resolver', {}))
+    startup.mark('settings')
+    device_manager = DeviceManager(store=open_device_store(settings.get('device_store'), snapshot=snapshot))
+    startup.mark('devices')
+    energy_manager = EnergySourcesManager(snapshot=snapshot)
+    startup.mark('energy_sources')
+    snapshot.save()
     
     logger.info(f"✅ Loaded {len(device_manager.devices)} devices")
     logger.info(f"✅ Loaded {len(energy_manager.sources)} energy sources")
@@ -358,16 +615,115 @@ async def main():
     optimizer = EMSOptimizer(
         device_manager=device_manager,
         energy_manager=energy_manager,
-        cycle_interval=30  # 30 Sekunden zwischen Zyklen
+        cycle_interval=settings.get('optimization_interval', 30),
+        settings=settings
     )
     
-    # Run Optimizer Loop
+    startup.mark('optimizer')
+    
+    tasks = [optimizer.run()]
+    if settings.get('grid_protection', {}).get('enabled', True):
+        tasks.append(optimizer.create_grid_guard().run())
+    
+    # Erreichbarkeit/Circuit Breaker fuer die Web UI (eigener Prozess) bereitstellen
+    health_export = settings.get('health_export', {})
+    export_extra = {'energy': energy_manager.export_state}  # Messwerte/Statistiken im selben Export
+    tasks.append(health_registry.run_export(health_export.get('file', 'config/.device_health.json'),
+                                            health_export.get('interval', 5.0), export_extra))
+    
+    # Push-Empfang von Shelly Gen2 (Outbound WebSocket)
+    ws_server = None
+    ws_settings = settings.get('shelly_ws', {})
+    if ws_settings.get('enabled', False):
+        from core.integrations.shelly_ws import ShellyWebSocketServer
+        ws_server = ShellyWebSocketServer(
+            host=ws_settings.get('host', '0.0.0.0'),
+            port=ws_settings.get('port', 8765),
+            path=ws_settings.get('path', '/shelly')
+        )
+        await ws_server.start()
+    
+    # Push-Empfang von Shelly Gen1 (CoIoT Multicast)
+    coiot_listener = None
+    coiot_settings = settings.get('coiot', {})
+    if coiot_settings.get('enabled', False):
+        from core.integrations.coiot import CoIoTListener
+        coiot_listener = CoIoTListener(
+            port=coiot_settings.get('port', 5683),
+            group=coiot_settings.get('group', '224.0.1.187'),
+            connected_ttl=coiot_settings.get('connected_ttl', 45.0)
+        )
+        await coiot_listener.start()
+    
+    # Passive Discovery: mDNS-Announcements, IP-Wechsel -> Device-Konfiguration
+    mdns_listener = None
+    mdns_settings = settings.get('mdns', {})
+    if mdns_settings.get('enabled', False):
+        from core.integrations.mdns import MdnsListener
+        mdns_listener = MdnsListener(
+            device_manager=device_manager,
+            cache_file=mdns_settings.get('cache_file', 'config/device_fingerprints.json'),
+            port=mdns_settings.get('port', 5353),
+            group=mdns_settings.get('group', '224.0.0.251'),
+            controllers=optimizer.controllers,
+            resolver=host_resolver
+        )
+        await mdns_listener.start()
+    
+    # Modbus TCP Proxy: Wechselrichter nur einmal pro Intervall lesen
+    modbus_proxy = None
+    proxy_settings = settings.get('modbus_proxy', {})
+    if proxy_settings.get('enabled', False):
+        from core.integrations.modbus_proxy import ModbusProxy
+        modbus_proxy = ModbusProxy(
+            proxy_settings.get('upstreams', []),
+            host=proxy_settings.get('host', '0.0.0.0'),
+            port=proxy_settings.get('port', 5020),
+            interval=proxy_settings.get('interval', 5.0),
+            max_age=proxy_settings.get('max_age', 30.0)
+        )
+        await modbus_proxy.start()
+        energy_manager.modbus_proxy = modbus_proxy
+        export_extra['modbus_proxy'] = modbus_proxy.get_stats
+        tasks.append(modbus_proxy.run())
+    
+    # Hot Reload: geaenderte Konfigurationsdateien ohne Neustart uebernehmen
+    config_reloader = None
+    reload_settings = settings.get('hot_reload', {})
+    if reload_settings.get('enabled', True):
+        from core.config_reload import ConfigReloader
+        config_reloader = ConfigReloader(
+            device_manager=device_manager,
+            energy_manager=energy_manager,
+            on_devices_changed=optimizer.on_devices_reloaded,
+            interval=reload_settings.get('interval', 2.0),
+            debounce=reload_settings.get('debounce', 0.3),
+            use_inotify=reload_settings.get('inotify', True)
+        )
+        tasks.append(config_reloader.run())
+    
+    startup.mark('integrations')
+    startup.report(snapshot)
+    
+    # Run Optimizer Loop (+ Grid Guard parallel)
     try:
-        await optimizer.run()
+        await asyncio.gather(*tasks)
     except KeyboardInterrupt:
         logger.info("⚠️ Interrupted by user")
     finally:
         optimizer.stop()
+        if ws_server:
+            await ws_server.stop()
+        if coiot_listener:
+            coiot_listener.stop()
+        if mdns_listener:
+            mdns_listener.stop()
+        if modbus_proxy:
+            await modbus_proxy.stop()
+        if config_reloader:
+            config_reloader.stop()
+        energy_manager.close()
+        await close_session()
         logger.info("👋 EMS-Core stopped")
 
 
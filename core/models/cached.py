@@ -0,0 +1,110 @@
+"""
+EMS-Core v2.0 - Cached Models
+Basisklasse fuer kompakte Modelle (__slots__) mit gecachter JSON-Darstellung
+
+List-Endpunkte serialisieren bei jedem Request alle Geraete/Quellen. Mit
+`CachedModel` wird jedes Objekt nur nach einer Aenderung neu serialisiert,
+Listen entstehen durch Aneinanderhaengen der gecachten Fragmente.
+"""
+import itertools
+import json
+from dataclasses import fields
+from enum import Enum
+from typing import Any, Dict, Iterable, Tuple
+
+_SEPARATORS = (',', ':')
+
+# Prozessweit monoton: jede Aenderung bekommt eine neue, groessere Version
+_versions = itertools.count(1)
+
+
+def slotted(cls):
+    """
+    `__slots__` fuer eine Dataclass nachruesten (wie `@dataclass(slots=True)`,
+    das erst ab Python 3.10 existiert)
+
+    Verwendung: `@slotted` ueber `@dataclass`. Die Klasse wird mit den
+    Feldnamen als `__slots__` neu erzeugt; Defaults stehen bereits im
+    generierten `__init__`.
+    """
+    names = tuple(f.name for f in fields(cls))
+    body = {key: value for key, value in cls.__dict__.items()
+            if key not in names and key not in ('__dict__', '__weakref__')}
+    body['__slots__'] = names
+    new_cls = type(cls)(cls.__name__, cls.__bases__, body)
+    new_cls.__qualname__ = cls.__qualname__
+    return new_cls
+
+
+class CachedModel:
+    """
+    Mixin fuer Dataclass-Modelle mit `@slotted`
+
+    Jede Zuweisung an ein Feld setzt eine neue `version` (prozessweit
+    monoton) und verwirft das gecachte JSON-Fragment. In-place-Aenderungen
+    veraenderlicher Felder (z.B. ein Config-Dict) muessen mit `touch()`
+    gemeldet werden.
+    """
+
+    __slots__ = ('_version', '_json')
+
+    def __setattr__(self, name: str, value: Any):
+        object.__setattr__(self, name, value)
+        if name[0] != '_':
+            object.__setattr__(self, '_json', None)
+            object.__setattr__(self, '_version', next(_versions))
+
+    @property
+    def version(self) -> int:
+        """Version der letzten Aenderung (groesser = neuer)"""
+        return self._version
+
+    @classmethod
+    def field_names(cls) -> Tuple[str, ...]:
+        names = cls.__dict__.get('_field_names')
+        if names is None:
+            names = tuple(f.name for f in fields(cls))
+            cls._field_names = names
+        return names
+
+    def touch(self):
+        """In-place-Aenderung melden (Cache verwerfen, Version erhoehen)"""
+        object.__setattr__(self, '_json', None)
+        object.__setattr__(self, '_version', next(_versions))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Flache Kopie der Felder (Enums als Wert, Dicts kopiert)"""
+        data = {}
+        for name in self.field_names():
+            value = getattr(self, name)
+            if isinstance(value, Enum):
+                value = value.value
+            elif isinstance(value, dict):
+                value = dict(value)
+            data[name] = value
+        return data
+
+    def to_json(self) -> str:
+        """JSON-Fragment (gecacht bis zur naechsten Aenderung)"""
+        cached = self._json
+        if cached is None:
+            cached = json.dumps(self.to_dict(), separators=_SEPARATORS)
+            object.__setattr__(self, '_json', cached)
+        return cached
+
+
+def dumps_list(items: Iterable[CachedModel]) -> str:
+    """JSON-Array aus den gecachten Fragmenten"""
+    return '[' + ','.join(item.to_json() for item in items) + ']'
+
+
+def dumps_envelope(key: str, items: Iterable[CachedModel], **extra) -> str:
+    """
+    API-Antwort `{"success": true, <key>: [...], "count": n, ...}`
+
+    Die Liste wird aus Fragmenten zusammengesetzt, nur `extra` wird
+    regulaer serialisiert.
+    """
+    items = list(items)
+    head = {'success': True, 'count': len(items), **extra}
+    return json.dumps(head, separators=_SEPARATORS)[:-1] + f',"{key}":' + dumps_list(items) + '}'
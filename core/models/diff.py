@@ -0,0 +1,36 @@
+"""
+EMS-Core v2.0 - Config Diff
+Vergleich zweier Konfigurationsstaende (Hot Reload)
+"""
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Mapping
+
+
+@dataclass
+class ConfigDiff:
+    """Hinzugefuegte, entfernte und geaenderte IDs"""
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self) -> str:
+        return f"+{len(self.added)} -{len(self.removed)} ~{len(self.changed)}"
+
+
+def diff_mappings(old: Mapping[str, Any], new: Mapping[str, Any],
+                  key: Callable[[Any], Any] = lambda value: value) -> ConfigDiff:
+    """
+    Vergleiche zwei Mappings ID -> Eintrag
+
+    Args:
+        key: Vergleichswert eines Eintrags (z.B. nur Konfigurations-Felder)
+    """
+    return ConfigDiff(
+        added=[item_id for item_id in new if item_id not in old],
+        removed=[item_id for item_id in old if item_id not in new],
+        changed=[item_id for item_id, value in new.items()
+                 if item_id in old and key(old[item_id]) != key(value)]
+    )
@@ -0,0 +1,257 @@
+"""
+EMS-Core v2.0 - Versioned Registry
+Copy-on-Write-Registry fuer Geraete und Energie-Quellen
+
+Flask (threaded) aendert Geraete/Quellen, waehrend andere Threads und der
+Optimizer darueber iterieren. Die Registry veroeffentlicht bei jeder
+Aenderung einen neuen, unveraenderlichen Snapshot (atomarer Referenz-
+Tausch): Leser sperren nie und sehen immer einen vollstaendigen Stand,
+Schreiber werden ueber einen Lock serialisiert.
+
+Mit `history` fuehrt die Registry zusaetzlich ein begrenztes Aenderungs-
+protokoll (Version, Key) im Snapshot mit - Grundlage fuer den Change-Feed
+(`changes_since`), ueber den Clients nur Deltas abholen.
+"""
+import itertools
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, MutableMapping, Optional, Set, Tuple
+
+# Prozessweit monoton: Versionen aller Registries sind vergleichbar, ein
+# Client kommt mit einer einzigen `since`-Version fuer mehrere Registries aus
+_versions = itertools.count(1)
+_publish_lock = threading.Lock()
+_published = 0
+
+_MISSING = object()
+
+# Kennung dieses Prozesses - Versionen sind nur innerhalb einer Epoche gueltig
+EPOCH = uuid.uuid4().hex[:12]
+
+# Standard-Laenge des Aenderungsprotokolls der Manager (Geraete, Energie-Quellen)
+CHANGE_LOG_SIZE = 1000
+
+
+def published_version() -> int:
+    """
+    Hoechste veroeffentlichte Version (prozessweit)
+
+    Alle Aenderungen bis zu dieser Version sind in den Snapshots sichtbar -
+    vor dem Lesen mehrerer Registries abfragen und als gemeinsame
+    `since`-Version weitergeben.
+    """
+    return _published
+
+
+@dataclass(frozen=True)
+class RegistrySnapshot:
+    """Unveraenderlicher Stand einer Registry"""
+    version: int                # steigt mit jeder veroeffentlichten Aenderung
+    items: Mapping[str, Any]    # read-only (MappingProxyType)
+    changes: Tuple[Tuple[int, str], ...] = ()  # (Version, Key), aelteste zuerst
+    floor: int = 0              # Protokoll vollstaendig fuer alle Versionen > floor
+
+
+@dataclass
+class RegistryChanges:
+    """Delta seit einer Version (oder kompletter Stand bei `full`)"""
+    version: int
+    changed: List[Any] = field(default_factory=list)   # aktuelle Eintraege
+    removed: List[str] = field(default_factory=list)   # Keys
+    full: bool = False
+
+
+class VersionedRegistry(MutableMapping):
+    """
+    Dict-kompatible Copy-on-Write-Registry
+
+    - Lesen (`[]`, `get`, Iteration, `values()`) greift auf den aktuellen
+      Snapshot zu - ohne Lock, Iteration laeuft ueber einen festen Stand
+    - Jede Schreiboperation kopiert den Stand und veroeffentlicht ihn als
+      neuen Snapshot mit hoeherer Version
+    - `batch()` buendelt Schreibvorgaenge: eine Kopie, ein Snapshot am Ende,
+      bei einer Exception wird nichts veroeffentlicht. Der schreibende
+      Thread sieht seine offenen Aenderungen, alle anderen den letzten Snapshot.
+    - Versionen kommen aus einem prozessweiten Zaehler (monoton, aber mit
+      Luecken zwischen den Snapshots einer Registry)
+    """
+
+    def __init__(self, items: Optional[Mapping[str, Any]] = None,
+                 lock: Optional[threading.RLock] = None,
+                 history: int = 0):
+        """
+        Args:
+            items: Anfangsbestand
+            lock: Schreib-Lock (gemeinsam fuer mehrere Registries eines Managers)
+            history: Anzahl protokollierter Aenderungen fuer `changes_since` (0 = aus)
+        """
+        self.lock = lock or threading.RLock()
+        self.history = history
+        self._snapshot = RegistrySnapshot(0, MappingProxyType(dict(items or {})))
+        self._pending: Optional[Dict[str, Any]] = None
+        self._owner: Optional[int] = None
+        self._depth = 0
+        self._dirty = False
+        self._touched: Set[str] = set()
+
+    # ------------------------------------------------------------------
+    # Lesen (ohne Lock)
+    # ------------------------------------------------------------------
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def snapshot(self) -> RegistrySnapshot:
+        """Zuletzt veroeffentlichter Stand (fuer mehrere konsistente Lesezugriffe)"""
+        return self._snapshot
+
+    def view(self) -> Mapping[str, Any]:
+        """Fuer den Aufrufer sichtbarer Stand (eigene offene Aenderungen eingeschlossen)"""
+        pending = self._pending
+        if pending is not None and self._owner == threading.get_ident():
+            return pending
+        return self._snapshot.items
+
+    def __getitem__(self, key: str) -> Any:
+        return self.view()[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.view())
+
+    def __len__(self) -> int:
+        return len(self.view())
+
+    def __contains__(self, key) -> bool:
+        return key in self.view()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.view().get(key, default)
+
+    def keys(self):
+        return self.view().keys()
+
+    def values(self):
+        return self.view().values()
+
+    def items(self):
+        return self.view().items()
+
+    def changes_since(self, since: int) -> RegistryChanges:
+        """
+        Aenderungen nach Version `since` (ohne Lock, aus einem Snapshot)
+
+        Ist `since` aelter als das Protokoll, wird der komplette Stand mit
+        `full=True` geliefert. Versionen aus einem anderen Prozess (siehe
+        `EPOCH`) sind ungueltig - dann mit `since=-1` den kompletten Stand holen.
+        """
+        snapshot = self._snapshot
+        items = snapshot.items
+        if since >= snapshot.version:
+            return RegistryChanges(snapshot.version)
+        if since < snapshot.floor:
+            return RegistryChanges(snapshot.version, list(items.values()), full=True)
+
+        keys = {}  # zuletzt geaenderte zuerst, je Key einmal
+        for version, key in reversed(snapshot.changes):
+            if version <= since:
+                break
+            keys[key] = None
+        changes = RegistryChanges(snapshot.version)
+        for key in reversed(keys):
+            if key in items:
+                changes.changed.append(items[key])
+            else:
+                changes.removed.append(key)
+        return changes
+
+    def __repr__(self) -> str:
+        return f"VersionedRegistry(version={self.version}, items={dict(self.view())!r})"
+
+    # ------------------------------------------------------------------
+    # Schreiben (serialisiert)
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def batch(self):
+        """Schreibvorgaenge buendeln (verschachtelbar, ein Snapshot am Ende)"""
+        with self.lock:
+            if self._depth == 0:
+                self._pending = dict(self._snapshot.items)
+                self._owner = threading.get_ident()
+                self._dirty = False
+                self._touched = set()
+            self._depth += 1
+            failed = False
+            try:
+                yield self
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    pending, self._pending, self._owner = self._pending, None, None
+                    if self._dirty and not failed:
+                        self._publish(pending)
+                    self._dirty = False
+
+    def _publish(self, items: Dict[str, Any]):
+        global _published
+        previous = self._snapshot
+        touched = []
+        if self.history:
+            old = previous.items
+            touched = [key for key in self._touched
+                       if old.get(key, _MISSING) is not items.get(key, _MISSING)]
+        with _publish_lock:
+            version = next(_versions)
+            changes, floor = previous.changes, previous.floor
+            if touched:
+                changes = changes + tuple((version, key) for key in touched)
+                if len(changes) > self.history:
+                    dropped = len(changes) - self.history
+                    floor = changes[dropped - 1][0]
+                    changes = changes[dropped:]
+            self._snapshot = RegistrySnapshot(version, MappingProxyType(items), changes, floor)
+            _published = version
+
+    def __setitem__(self, key: str, value: Any):
+        with self.batch():
+            self._pending[key] = value
+            self._touch(key)
+
+    def __delitem__(self, key: str):
+        with self.batch():
+            del self._pending[key]
+            self._touch(key)
+
+    def _touch(self, key: str):
+        self._dirty = True
+        if self.history:
+            self._touched.add(key)
+
+    def update(self, other=(), **kwargs):
+        items = dict(other, **kwargs)
+        with self.batch():
+            self._pending.update(items)
+            self._dirty = True
+            if self.history:
+                self._touched.update(items)
+
+    def replace_all(self, items: Mapping[str, Any]):
+        """Kompletten Bestand ersetzen (Laden, Reload)"""
+        with self.batch():
+            if self.history:
+                self._touched.update(self._pending)
+                self._touched.update(items)
+            self._pending.clear()
+            self._pending.update(items)
+            self._dirty = True
+
+    def clear(self):
+        self.replace_all({})
+
@@ -1,5 +1,7 @@
 """EMS Optimizer Module"""
 from .scheduler import Scheduler
 from .prioritizer import Prioritizer, Device, Priority
+from .power_profile import PowerProfileManager, PowerProfile
+from .reconciler import Reconciler
 
-__all__ = ['Scheduler', 'Prioritizer', 'Device', 'Priority']
+__all__ = ['Scheduler', 'Prioritizer', 'Device', 'Priority', 'PowerProfileManager', 'PowerProfile', 'Reconciler']
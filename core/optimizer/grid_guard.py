@@ -0,0 +1,223 @@
+"""
+EMS-Core v2.0 - Grid Guard
+Schneller Schutz-Loop fuer Netzbezugs-/Einspeise-Grenzen (grid.max_import / grid.max_export)
+
+Laeuft unabhaengig vom Optimierungs-Zyklus im Sub-Sekunden-Takt und wirft bei
+Ueberschreitung Lasten in umgekehrter Prioritaets-Reihenfolge ab.
+"""
+import asyncio
+import bisect
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Abwurf-Reihenfolge: OPTIONAL zuerst, CRITICAL nie
+SHED_ORDER = {'OPTIONAL': 0, 'LOW': 1, 'MEDIUM': 2, 'HIGH': 3}
+
+
+class ReactionHistogram:
+    """Histogramm der Reaktionszeiten (Ueberschreitung erkannt -> Lastabwurf ausgefuehrt)"""
+
+    BUCKETS_MS = (50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        """Erfasse eine Reaktionszeit"""
+        index = bisect.bisect_left(self.BUCKETS_MS, seconds * 1000)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def to_dict(self) -> Dict:
+        labels = [f"<={b}ms" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 1)
+        }
+
+
+class GridGuard:
+    """
+    Schutz-Loop fuer Netzgrenzen
+
+    - Netzbezug > max_import: Lasten abwerfen (OPTIONAL -> LOW -> MEDIUM -> HIGH),
+      bis die geschaetzte Ueberschreitung gedeckt ist
+    - Einspeisung > max_export: Optimizer sofort anstossen (on_export_exceeded)
+    - Grenzwert 0 = Ueberwachung deaktiviert
+    """
+
+    def __init__(self,
+                 read_grid_power: Callable[[], Awaitable[Optional[float]]],
+                 get_candidates: Callable[[], List[Tuple[object, float]]],
+                 shed_device: Callable[[object], Awaitable[bool]],
+                 max_import: float = 0,
+                 max_export: float = 0,
+                 interval: float = 0.5,
+                 max_reaction: float = 2.0,
+                 shed_hold: float = 300,
+                 settle_time: float = 3.0,
+                 on_export_exceeded: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            read_grid_power: Liefert aktuelle Netzleistung (W, positiv = Bezug)
+            get_candidates: Laufende Geraete als [(DeviceConfig, Leistung in W)]
+            shed_device: Schaltet ein Geraet aus
+            max_import: Maximaler Netzbezug in W
+            max_export: Maximale Einspeisung in W
+            interval: Sekunden zwischen Messungen
+            max_reaction: Latenz-Budget in Sekunden fuer einen Lastabwurf
+            shed_hold: Sekunden, die abgeworfene Geraete gesperrt bleiben
+            settle_time: Sekunden nach einem Abwurf, bis der Zaehler ihn zeigt
+                (3EM/Modbus liefern verzoegert - sonst kaskadierende Abwuerfe)
+            on_export_exceeded: Callback bei Einspeise-Ueberschreitung
+        """
+        self.read_grid_power = read_grid_power
+        self.get_candidates = get_candidates
+        self.shed_device = shed_device
+        self.max_import = max_import
+        self.max_export = max_export
+        self.interval = interval
+        self.max_reaction = max_reaction
+        self.shed_hold = shed_hold
+        self.settle_time = settle_time
+        self.on_export_exceeded = on_export_exceeded
+
+        self.running = False
+        self.histogram = ReactionHistogram()
+        self.shed_until: Dict[str, float] = {}  # device_id -> monotonic Zeit
+        self.violation_since: Optional[float] = None
+        self.settle_until = 0.0
+        self.last_grid_power: Optional[float] = None
+        self.bound_violations = 0
+
+    def is_shed(self, device_id: str) -> bool:
+        """Ist das Geraet aktuell durch den Schutz-Loop gesperrt?"""
+        until = self.shed_until.get(device_id)
+        return until is not None and time.monotonic() < until
+
+    async def run(self):
+        """Schutz-Loop - laeuft parallel zum Optimizer"""
+        if self.max_import <= 0 and self.max_export <= 0:
+            logger.info("Grid guard disabled (no import/export limit configured)")
+            return
+
+        self.running = True
+        logger.info(f"🛡️ Grid guard started (max_import={self.max_import}W, "
+                    f"max_export={self.max_export}W, interval={self.interval}s)")
+
+        while self.running:
+            started = time.monotonic()
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Grid guard check failed: {e}")
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, self.interval - elapsed))
+
+    async def check(self):
+        """Eine Messung + ggf. Reaktion"""
+        sampled_at = time.monotonic()
+        try:
+            grid_power = await asyncio.wait_for(self.read_grid_power(), timeout=self.max_reaction / 2)
+        except asyncio.TimeoutError:
+            logger.warning("Grid guard: meter read timed out")
+            return
+        if grid_power is None:
+            return
+        self.last_grid_power = grid_power
+
+        # Einspeisung
+        if self.max_export > 0 and -grid_power > self.max_export and self.on_export_exceeded:
+            self.on_export_exceeded()
+
+        # Netzbezug
+        if self.max_import <= 0 or grid_power <= self.max_import:
+            self.violation_since = None
+            return
+
+        if self.violation_since is None:
+            self.violation_since = sampled_at
+
+        # Letzter Abwurf muss erst im Messwert sichtbar werden
+        if sampled_at < self.settle_until:
+            return
+
+        await self.shed(grid_power - self.max_import)
+
+    async def shed(self, excess: float):
+        """Wirf Lasten ab bis `excess` Watt gedeckt sind"""
+        candidates = [
+            (device, power) for device, power in self.get_candidates()
+            if device.priority in SHED_ORDER and not self.is_shed(device.id)
+        ]
+        # Niedrigste Prioritaet zuerst, innerhalb gleicher Prioritaet groesste Last zuerst
+        candidates.sort(key=lambda c: (SHED_ORDER[c[0].priority], -c[1]))
+
+        selected = []
+        covered = 0.0
+        for device, power in candidates:
+            if covered >= excess:
+                break
+            selected.append(device)
+            covered += power
+
+        if not selected:
+            logger.warning(f"⚠️ Grid import exceeds limit by {excess:.0f}W - nothing left to shed")
+            return
+
+        results = await asyncio.gather(
+            *(self.shed_device(device) for device in selected), return_exceptions=True
+        )
+
+        now = time.monotonic()
+        shed = []
+        for device, result in zip(selected, results):
+            if result is True:
+                self.shed_until[device.id] = now + self.shed_hold
+                shed.append(device)
+            elif isinstance(result, Exception):
+                logger.error(f"✗ Grid guard could not shed {device.id}: {result}")
+
+        if not shed:
+            # violation_since bleibt - die naechste Messung versucht es erneut
+            logger.warning(f"⚠️ Grid import exceeds limit by {excess:.0f}W - shedding "
+                           f"{', '.join(d.id for d in selected)} failed")
+            return
+
+        reaction = now - self.violation_since
+        self.histogram.record(reaction)
+        if reaction > self.max_reaction:
+            self.bound_violations += 1
+            logger.warning(f"⚠️ Grid guard reaction {reaction * 1000:.0f}ms exceeded "
+                           f"bound of {self.max_reaction * 1000:.0f}ms")
+
+        logger.warning(f"⚡ Grid import exceeds limit by {excess:.0f}W - shed "
+                       f"{', '.join(d.id for d in shed)} in {reaction * 1000:.0f}ms")
+
+        self.violation_since = None
+        self.settle_until = now + self.settle_time
+
+    def get_stats(self) -> Dict:
+        """Statistiken fuer Logging/API"""
+        return {
+            'last_grid_power': self.last_grid_power,
+            'max_import': self.max_import,
+            'max_export': self.max_export,
+            'shed_devices': [d for d in self.shed_until if self.is_shed(d)],
+            'reaction_time': self.histogram.to_dict(),
+            'bound_violations': self.bound_violations
+        }
+
+    def stop(self):
+        """Stoppe den Schutz-Loop"""
+        self.running = False
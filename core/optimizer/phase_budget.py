@@ -0,0 +1,72 @@
+"""
+EMS-Core v2.0 - Phase Budget
+Phasen-genaue Ueberschuss-Pruefung fuer die Allokation
+
+Bei phasen-genauer (nicht saldierender) Messung darf ein einphasiger
+Verbraucher nur zugeschaltet werden, wenn seine Phase selbst einspeist -
+auch wenn die Summe ueber alle Phasen Ueberschuss zeigt. Opt-in ueber
+`grid.per_phase_balance` in settings.yaml.
+"""
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('A', 'B', 'C')
+
+
+class PhaseBudget:
+    """
+    Verbleibender Ueberschuss je Phase (W, positiv = Einspeisung)
+
+    Nur Devices mit expliziter Phase (DeviceConfig.phase = A/B/C) werden
+    geprueft und belasten ihre Phase; Devices ohne Phase (phase = "") gelten
+    als nicht phasen-beschraenkt.
+    """
+
+    def __init__(self, surplus: Dict[str, float]):
+        self.remaining = {phase: surplus.get(phase, 0.0) for phase in PHASES}
+
+    @classmethod
+    def from_energy_data(cls, energy_data: Dict, reserve: float = 0.0) -> Optional['PhaseBudget']:
+        """
+        Erzeuge Budget aus current_data (grid_phase_a/b/c)
+
+        Args:
+            reserve: Sicherheitspuffer, gleichmaessig auf die Phasen verteilt
+
+        Returns:
+            None wenn keine Phasen-Messwerte vorliegen
+        """
+        values = {phase: energy_data.get(f'grid_phase_{phase.lower()}') for phase in PHASES}
+        if any(v is None for v in values.values()):
+            return None
+        share = reserve / len(PHASES)
+        return cls({phase: -power - share for phase, power in values.items()})
+
+    def _load(self, device, power: float) -> Dict[str, float]:
+        phase = (getattr(device, 'phase', '') or '').upper()
+        if phase in PHASES:
+            return {phase: power}
+        return {}
+
+    def fits(self, device, power: float) -> bool:
+        """Passt die Last auf alle betroffenen Phasen?"""
+        return all(self.remaining[p] >= load for p, load in self._load(device, power).items())
+
+    def consume(self, device, power: float):
+        """Last verbuchen"""
+        for p, load in self._load(device, power).items():
+            self.remaining[p] -= load
+
+    def release(self, device, power: float):
+        """Last freigeben (laufendes Device steht zur Neuverteilung)"""
+        for p, load in self._load(device, power).items():
+            self.remaining[p] += load
+
+    def limiting_phase(self, device, power: float) -> Optional[str]:
+        """Erste Phase, auf der die Last nicht passt"""
+        for p, load in self._load(device, power).items():
+            if self.remaining[p] < load:
+                return p
+        return None
@@ -0,0 +1,262 @@
+"""
+EMS-Core v2.0 - Power Profiles
+Gelernte Leistungsaufnahme pro Verbraucher aus gemessenen Status-Werten
+"""
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fallback wenn weder Messwerte noch Nennleistung bekannt sind
+DEFAULT_POWER = 500.0
+
+
+class P2Quantile:
+    """
+    Streaming-Quantil nach dem P²-Algorithmus (Jain & Chlamtac)
+
+    Haelt nur 5 Marker (Hoehen + Positionen) - konstanter Speicher
+    unabhaengig von der Anzahl der Messwerte.
+    """
+
+    def __init__(self, p: float = 0.9):
+        self.p = p
+        self.heights: List[float] = []
+        self.positions = [0.0, 1.0, 2.0, 3.0, 4.0]
+        self.desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x: float):
+        """Fuege Messwert hinzu"""
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.positions
+
+        # Zelle k finden und Extremwerte nachziehen
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while k < 3 and x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Mittlere Marker anpassen
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = self._parabolic(i, d)
+                if q[i - 1] < candidate < q[i + 1]:
+                    q[i] = candidate
+                else:
+                    q[i] = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q = self.heights
+        n = self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        """Aktueller Schaetzwert des Quantils"""
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            index = int(round(self.p * (len(self.heights) - 1)))
+            return self.heights[index]
+        return self.heights[2]
+
+    def to_dict(self) -> Dict:
+        return {
+            'p': self.p,
+            'heights': self.heights,
+            'positions': self.positions,
+            'desired': self.desired
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'P2Quantile':
+        estimator = cls(data.get('p', 0.9))
+        estimator.heights = list(data.get('heights', []))
+        estimator.positions = list(data.get('positions', estimator.positions))
+        estimator.desired = list(data.get('desired', estimator.desired))
+        return estimator
+
+
+class PowerProfile:
+    """Rollierende Statistik der Leistungsaufnahme eines Geraets"""
+
+    def __init__(self, device_id: str, window: int = 500):
+        self.device_id = device_id
+        self.window = window  # Effektive Fenstergroesse des gleitenden Mittels
+        self.samples = 0
+        self.mean = 0.0
+        self.p90 = P2Quantile(0.9)
+        self.startup_peak = 0.0
+        self.last_power = 0.0
+        self.last_state: Optional[str] = None
+        self.on_since: Optional[float] = None
+        self.last_update: Optional[float] = None
+
+    def record(self, state: str, power: float, timestamp: float,
+               startup_window: float = 60.0, min_power: float = 5.0):
+        """Verarbeite einen Messwert aus dem Status-Sweep"""
+        if state == 'on' and self.last_state != 'on':
+            self.on_since = timestamp
+        elif state != 'on':
+            self.on_since = None
+
+        self.last_state = state
+        self.last_power = power
+        self.last_update = timestamp
+
+        if state != 'on' or power < min_power:
+            return
+
+        # Anlaufspitze separat erfassen, nicht in die Dauerlast einrechnen
+        if self.on_since is not None and timestamp - self.on_since < startup_window:
+            self.startup_peak = max(self.startup_peak, power)
+            if self.samples > 0:
+                return
+
+        self.samples += 1
+        # Laufender Mittelwert, ab `window` Werten exponentiell gewichtet
+        alpha = max(1.0 / self.samples, 1.0 / self.window)
+        self.mean += alpha * (power - self.mean)
+        self.p90.add(power)
+
+    def to_dict(self) -> Dict:
+        return {
+            'samples': self.samples,
+            'mean': round(self.mean, 2),
+            'p90': self.p90.to_dict(),
+            'startup_peak': self.startup_peak,
+            'last_power': self.last_power,
+            'last_update': self.last_update
+        }
+
+    @classmethod
+    def from_dict(cls, device_id: str, data: Dict) -> 'PowerProfile':
+        profile = cls(device_id)
+        profile.samples = data.get('samples', 0)
+        profile.mean = data.get('mean', 0.0)
+        profile.p90 = P2Quantile.from_dict(data.get('p90', {}))
+        profile.startup_peak = data.get('startup_peak', 0.0)
+        profile.last_power = data.get('last_power', 0.0)
+        profile.last_update = data.get('last_update')
+        return profile
+
+
+class PowerProfileManager:
+    """Verwaltet und persistiert Power-Profile aller Geraete"""
+
+    def __init__(self,
+                 profiles_file: str = "config/power_profiles.json",
+                 min_samples: int = 5,
+                 save_interval: float = 300.0):
+        """
+        Args:
+            profiles_file: JSON-Datei fuer die gelernten Profile
+            min_samples: Messwerte bevor das Profil die Nennleistung ersetzt
+            save_interval: Mindestabstand zwischen zwei Speichervorgaengen (Sekunden)
+        """
+        self.profiles_file = Path(profiles_file)
+        self.min_samples = min_samples
+        self.save_interval = save_interval
+        self.profiles: Dict[str, PowerProfile] = {}
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.load_profiles()
+
+    def load_profiles(self):
+        """Lade Profile aus JSON"""
+        try:
+            if self.profiles_file.exists():
+                with open(self.profiles_file, 'r') as f:
+                    data = json.load(f)
+                for device_id, profile_data in data.items():
+                    self.profiles[device_id] = PowerProfile.from_dict(device_id, profile_data)
+                logger.info(f"Loaded {len(self.profiles)} power profiles")
+        except Exception as e:
+            logger.error(f"Failed to load power profiles: {e}")
+            self.profiles = {}
+
+    def save_profiles(self, force: bool = False) -> bool:
+        """
+        Speichere Profile als JSON (atomar: Temp-Datei + rename)
+
+        Nur bei neuen Messwerten und hoechstens alle `save_interval` Sekunden;
+        `force` speichert sofort (z.B. beim Beenden).
+
+        Returns:
+            True wenn geschrieben wurde
+        """
+        if not self._dirty or (not force and time.monotonic() - self._last_save < self.save_interval):
+            return False
+        from core.device_store import atomic_write
+        try:
+            data = {device_id: p.to_dict() for device_id, p in self.profiles.items()}
+            atomic_write(self.profiles_file, json.dumps(data, indent=2))
+            self._dirty = False
+            self._last_save = time.monotonic()
+            return True
+        except Exception as e:
+            logger.error(f"Failed to save power profiles: {e}")
+            return False
+
+    def record(self, device_id: str, state: str, power: Optional[float],
+               timestamp: Optional[float] = None):
+        """Erfasse Messwert eines Geraets"""
+        if power is None:
+            return
+        profile = self.profiles.get(device_id)
+        if profile is None:
+            profile = PowerProfile(device_id)
+            self.profiles[device_id] = profile
+        profile.record(state, float(power), timestamp if timestamp is not None else time.time())
+        self._dirty = True
+
+    def get_profile(self, device_id: str) -> Optional[PowerProfile]:
+        """Hole Profil eines Geraets"""
+        return self.profiles.get(device_id)
+
+    def estimate(self, device) -> float:
+        """
+        Geschaetzte Leistungsaufnahme fuer die Allokation
+
+        Reihenfolge: gelerntes P90 -> Nennleistung (DeviceConfig.power) -> DEFAULT_POWER
+        """
+        profile = self.profiles.get(device.id)
+        if profile and profile.samples >= self.min_samples:
+            p90 = profile.p90.value()
+            if p90:
+                return max(p90, profile.mean)
+        if device.power:
+            return float(device.power)
+        return DEFAULT_POWER
+
+    def measured_power(self, device_id: str) -> Optional[float]:
+        """Zuletzt gemessene Leistung (None wenn unbekannt)"""
+        profile = self.profiles.get(device_id)
+        if profile and profile.last_update is not None:
+            return profile.last_power
+        return None
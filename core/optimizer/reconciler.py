@@ -0,0 +1,260 @@
+"""
+EMS-Core v2.0 - Reconciler
+Soll-/Ist-Abgleich der Device-Zustaende: Schaltbefehle nur bei Abweichung,
+Verifikation ueber gepushten/gepollten Zustand, Retry mit Backoff
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from core.controllers.base import CAP_SWITCH
+from core.controllers.registry import ControllerRegistry, controller_registry
+from core.integrations.state_cache import DeviceStateCache, state_cache
+
+logger = logging.getLogger(__name__)
+
+KNOWN_STATES = ('on', 'off')
+
+
+@dataclass
+class DeviceTarget:
+    """Soll- und Ist-Zustand eines Devices"""
+    device_id: str
+    desired: Optional[str] = None
+    reason: str = ""
+    observed: Optional[str] = None
+    observed_at: float = 0.0
+    attempts: int = 0             # Fehlversuche in Folge
+    next_attempt: float = 0.0     # Backoff bis (monotonic)
+    drift_since: Optional[float] = None
+    last_error: Optional[str] = None
+
+    @property
+    def drifting(self) -> bool:
+        return self.desired is not None and self.observed != self.desired
+
+
+class Reconciler:
+    """
+    Haelt pro Device den gewuenschten Zustand und gleicht ihn mit dem
+    beobachteten ab
+
+    - Befehle nur bei Abweichung (unbekannter Zustand nach bestaetigtem
+      Befehl loest keinen neuen Befehl aus)
+    - Verifikation: Push-Update im State-Cache (WebSocket/CoIoT) oder
+      ein Status-Poll direkt nach dem Befehl
+    - Fehler/nicht bestaetigte Befehle: Retry mit exponentiellem Backoff
+    """
+
+    def __init__(self,
+                 get_device: Callable[[str], object],
+                 controllers: Optional[ControllerRegistry] = None,
+                 cache: Optional[DeviceStateCache] = None,
+                 verify_timeout: float = 3.0,
+                 base_backoff: float = 5.0,
+                 max_backoff: float = 300.0,
+                 observed_max_age: float = 300.0):
+        """
+        Args:
+            get_device: device_id -> DeviceConfig (z.B. DeviceManager.get_device)
+            controllers: Controller-Registry
+            cache: State-Cache fuer Push-Verifikation
+            verify_timeout: Max. Wartezeit auf Push-Bestaetigung (Sekunden)
+            base_backoff: Erster Retry-Abstand (verdoppelt sich je Fehlversuch)
+            max_backoff: Obergrenze des Retry-Abstands
+            observed_max_age: Sekunden, die der letzte bekannte Zustand eines
+                nicht erreichbaren Devices gilt (danach unbekannt)
+        """
+        self.get_device = get_device
+        self.controllers = controllers or controller_registry
+        self.cache = cache or state_cache
+        self.verify_timeout = verify_timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.observed_max_age = observed_max_age
+
+        self.targets: Dict[str, DeviceTarget] = {}
+        self.stats = {
+            'commands_sent': 0,
+            'commands_verified': 0,
+            'commands_failed': 0,
+            'retries': 0,
+            'in_sync': 0,        # Abgleiche ohne Befehl
+            'backoff_skips': 0,  # Abweichung, aber Retry noch nicht faellig
+        }
+
+    def _target(self, device_id: str) -> DeviceTarget:
+        target = self.targets.get(device_id)
+        if target is None:
+            target = self.targets[device_id] = DeviceTarget(device_id)
+        return target
+
+    def set_desired(self, device_id: str, state: str, reason: Optional[str] = None):
+        """Setze gewuenschten Zustand (on/off); reason=None behaelt den bisherigen Grund"""
+        target = self._target(device_id)
+        if target.desired != state:
+            target.attempts = 0
+            target.next_attempt = 0.0
+            target.last_error = None
+        target.desired = state
+        if reason is not None:
+            target.reason = reason
+        self._update_drift(target)
+
+    def observe(self, device_id: str, state: Optional[str]) -> Optional[str]:
+        """
+        Uebernimm beobachteten Zustand
+
+        'unknown'/None ueberschreibt den letzten bekannten Zustand nicht,
+        solange er juenger als `observed_max_age` ist.
+
+        Returns:
+            Effektiver Ist-Zustand (letzter bekannter, sonst None)
+        """
+        target = self._target(device_id)
+        now = time.monotonic()
+        if state in KNOWN_STATES:
+            if target.observed != state and target.observed is not None:
+                logger.debug(f"Reconciler {device_id}: observed {target.observed} -> {state}")
+            target.observed = state
+            target.observed_at = now
+            self._update_drift(target)
+        elif target.observed is not None and now - target.observed_at > self.observed_max_age:
+            logger.warning(f"Reconciler {device_id}: no state for {now - target.observed_at:.0f}s "
+                           f"- last known '{target.observed}' expired")
+            target.observed = None
+            self._update_drift(target)
+        return target.observed
+
+    def get_observed(self) -> Dict[str, str]:
+        """Letzter bekannter Zustand aller Devices"""
+        return {t.device_id: t.observed for t in self.targets.values() if t.observed}
+
+    def forget(self, device_id: str):
+        """Device entfernt"""
+        self.targets.pop(device_id, None)
+
+    def _update_drift(self, target: DeviceTarget):
+        if target.drifting:
+            if target.drift_since is None:
+                target.drift_since = time.monotonic()
+        else:
+            target.drift_since = None
+
+    async def reconcile(self, device_ids: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """
+        Gleiche Soll und Ist ab
+
+        Die Kanaele eines physischen Geraets werden nacheinander geschaltet,
+        verschiedene Geraete parallel.
+
+        Returns:
+            {device_id: Erfolg} fuer alle Devices, an die ein Befehl ging
+        """
+        now = time.monotonic()
+        ids = list(device_ids) if device_ids is not None else list(self.targets)
+        units: Dict[str, List[tuple]] = {}
+
+        for device_id in ids:
+            target = self.targets.get(device_id)
+            if target is None or target.desired is None:
+                continue
+            if not target.drifting:
+                self.stats['in_sync'] += 1
+                continue
+            if now < target.next_attempt:
+                self.stats['backoff_skips'] += 1
+                continue
+            device = self.get_device(device_id)
+            controller = self.controllers.get(device) if device else None
+            if controller is None or not controller.supports(CAP_SWITCH):
+                continue
+            units.setdefault(controller.unit_key, []).append((target, device, controller))
+
+        results: Dict[str, bool] = {}
+
+        async def apply_unit(unit: List[tuple]):
+            for target, device, controller in unit:
+                results[target.device_id] = await self._apply(target, device, controller)
+
+        await asyncio.gather(*(apply_unit(unit) for unit in units.values()))
+        return results
+
+    async def _apply(self, target: DeviceTarget, device, controller) -> bool:
+        """Sende Befehl und verifiziere ihn"""
+        action = target.desired
+        if target.attempts:
+            self.stats['retries'] += 1
+        self.stats['commands_sent'] += 1
+        sent_at = time.monotonic()
+
+        try:
+            if action == 'on':
+                success = await controller.turn_on()
+            else:
+                success = await controller.turn_off()
+            verified = success and await self._verify(device, controller, action, sent_at)
+        except Exception as e:
+            success = verified = False
+            target.last_error = str(e)
+
+        if verified:
+            self.stats['commands_verified'] += 1
+            target.attempts = 0
+            target.next_attempt = 0.0
+            target.last_error = None
+            self.observe(target.device_id, action)
+            logger.info(f"✅ {device.name} ({device.id}) -> {action.upper()} | Reason: {target.reason}")
+            return True
+
+        self.stats['commands_failed'] += 1
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** target.attempts))
+        target.attempts += 1
+        target.next_attempt = time.monotonic() + backoff
+        if target.last_error is None:
+            target.last_error = 'command failed' if not success else 'not verified'
+        logger.error(
+            f"❌ {device.name} ({device.id}) -> {action.upper()} FAILED "
+            f"({target.last_error}), retry in {backoff:.0f}s"
+        )
+        return False
+
+    async def _verify(self, device, controller, action: str, sent_at: float) -> bool:
+        """Bestaetigung per Push (falls verbunden), sonst per Status-Poll"""
+        if device.ip and self.cache.is_connected(device.ip):
+            deadline = sent_at + self.verify_timeout
+            while time.monotonic() < deadline:
+                entry = self.cache.get(device.ip, device.channel)
+                if entry and entry['updated'] >= sent_at and entry['state'] == action:
+                    return True
+                await asyncio.sleep(0.05)
+            # Kein Push angekommen - auf Poll zurueckfallen
+
+        state = await controller.get_state()
+        if state in KNOWN_STATES and device.ip:
+            self.cache.update(device.ip, device.channel, state=state, source='poll')
+        return state == action
+
+    def get_metrics(self) -> Dict:
+        """Drift-Metriken fuer Logging/API"""
+        now = time.monotonic()
+        drift = {}
+        for target in self.targets.values():
+            if not target.drifting:
+                continue
+            drift[target.device_id] = {
+                'desired': target.desired,
+                'observed': target.observed,
+                'attempts': target.attempts,
+                'drift_seconds': round(now - target.drift_since, 1) if target.drift_since else 0.0,
+                'next_attempt_in': round(max(0.0, target.next_attempt - now), 1),
+                'last_error': target.last_error
+            }
+        return {
+            **self.stats,
+            'devices': len(self.targets),
+            'drifting': len(drift),
+            'drift': drift
+        }
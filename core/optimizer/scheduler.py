@@ -8,6 +8,8 @@ from datetime import datetime, time, timedelta
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+from core.models.diff import ConfigDiff, diff_mappings
+
 logger = logging.getLogger(__name__)
 
 
@@ -33,6 +35,24 @@ class Scheduler:
             logger.error(f"Failed to load schedules: {e}")
             self.schedules = {}
     
+    def reload_schedules(self) -> ConfigDiff:
+        """
+        schedules.json neu lesen, nur geaenderte Zeitplaene ersetzen (Hot Reload)
+        
+        Raises:
+            Exception: Datei nicht lesbar (bisherige Zeitplaene bleiben aktiv)
+        """
+        with open(self.config_path, 'r') as f:
+            loaded = json.load(f)
+        diff = diff_mappings(self.schedules, loaded)
+        for device_id in diff.removed:
+            del self.schedules[device_id]
+        for device_id in diff.added + diff.changed:
+            self.schedules[device_id] = loaded[device_id]
+        if diff:
+            logger.info(f"♻️ Schedules reloaded: {diff}")
+        return diff
+    
     def save_schedules(self):
         """Speichere Zeitpläne in JSON"""
         try:
@@ -0,0 +1,104 @@
+"""
+EMS-Core v2.0 - Async Bridge
+Langlebiger Event-Loop in einem Hintergrund-Thread fuer synchronen Code (Flask)
+
+Flask-Worker-Threads reichen Coroutinen per `run_sync()` ein, statt pro Request
+einen eigenen Event-Loop (und eine eigene HTTP-Session) aufzubauen.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Awaitable, Optional
+
+from core.utils.http import close_session
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBridge:
+    """Event-Loop-Thread mit thread-sicherer Submit-API"""
+
+    def __init__(self, name: str = "ems-async-bridge"):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """Starte den Loop-Thread (idempotent)"""
+        with self._lock:
+            if self.running:
+                return
+            self._ready.clear()
+            self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self.thread.start()
+        self._ready.wait()
+        logger.info(f"Async bridge '{self.name}' started")
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.run_until_complete(close_session())
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+            self.loop.close()
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Reiche Coroutine ein, liefert ein concurrent.futures.Future"""
+        if not self.running:
+            self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = 30) -> Any:
+        """
+        Fuehre Coroutine aus und warte auf das Ergebnis
+
+        Raises:
+            TimeoutError: Ergebnis nicht innerhalb von `timeout` Sekunden
+        """
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Async bridge call timed out after {timeout}s")
+
+    def stop(self, timeout: float = 5):
+        """Stoppe den Loop und schliesse die geteilte HTTP-Session"""
+        with self._lock:
+            if not self.running:
+                return
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+            self.thread = None
+        logger.info(f"Async bridge '{self.name}' stopped")
+
+
+_bridge: Optional[AsyncBridge] = None
+_bridge_lock = threading.Lock()
+
+
+def get_bridge() -> AsyncBridge:
+    """Prozessweite Bridge (wird beim ersten Zugriff gestartet)"""
+    global _bridge
+    if _bridge is None:
+        with _bridge_lock:
+            if _bridge is None:
+                _bridge = AsyncBridge()
+    if not _bridge.running:
+        _bridge.start()
+    return _bridge
+
+
+def run_sync(coro: Awaitable, timeout: Optional[float] = 30) -> Any:
+    """Fuehre Coroutine synchron auf der Hintergrund-Bridge aus"""
+    return get_bridge().run(coro, timeout)
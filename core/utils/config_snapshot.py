@@ -0,0 +1,127 @@
+"""
+EMS-Core v2.0 - Config Snapshot
+Schneller Start: YAML mit C-Loader, geparste Konfiguration als Binaer-Snapshot
+
+Jede Konfigurationsdatei wird einmal geparst und validiert; das Ergebnis
+landet zusammen mit mtime/Groesse/Hash der Datei in einem Pickle. Beim
+naechsten Start werden nur geaenderte Dateien neu geparst.
+"""
+import hashlib
+import logging
+import pickle
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# libyaml (C) wenn vorhanden - um ein Vielfaches schneller als der reine Python-Loader
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_yaml(stream) -> Any:
+    """yaml.safe_load mit C-Loader (falls verfuegbar)"""
+    return yaml.load(stream, Loader=YamlLoader)
+
+
+class ConfigSnapshot:
+    """
+    Pickle-Cache geparster Konfigurationsdateien
+
+    Schluessel pro Datei: (mtime_ns, Groesse); weicht er ab, entscheidet der
+    SHA1 des Inhalts (z.B. nach `touch`), ob neu geparst werden muss.
+    Parser validieren (Exception = kein Snapshot-Eintrag).
+    """
+
+    def __init__(self, snapshot_file: str = "config/.config_snapshot.pickle"):
+        self.snapshot_file = Path(snapshot_file)
+        self.entries: Optional[Dict[str, Tuple[tuple, str, Any]]] = None
+        self.stats = {'hits': 0, 'parsed': 0}
+        self._dirty = False
+
+    def _load(self):
+        self.entries = {}
+        try:
+            if self.snapshot_file.exists():
+                with open(self.snapshot_file, 'rb') as f:
+                    version, entries = pickle.load(f)
+                if version == SNAPSHOT_VERSION:
+                    self.entries = entries
+        except Exception as e:
+            logger.warning(f"Config snapshot unreadable, rebuilding: {e}")
+
+    def read(self, path, parser: Callable[[bytes], Any], name: Optional[str] = None) -> Any:
+        """
+        Geparster Inhalt einer Datei (aus dem Snapshot oder frisch geparst)
+
+        Args:
+            path: Konfigurationsdatei
+            parser: bytes -> validierte Daten
+            name: Eintrag im Snapshot (Standard: Pfad + Parser-Name)
+
+        Raises:
+            FileNotFoundError: Datei fehlt
+        """
+        if self.entries is None:
+            self._load()
+        path = Path(path)
+        name = name or f"{path.resolve()}:{getattr(parser, '__qualname__', parser)}"
+        stat = path.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        cached = self.entries.get(name)
+        if cached is not None and cached[0] == key:
+            self.stats['hits'] += 1
+            return cached[2]
+
+        raw = path.read_bytes()
+        digest = hashlib.sha1(raw).hexdigest()
+        if cached is not None and cached[1] == digest:
+            data = cached[2]
+            self.stats['hits'] += 1
+        else:
+            data = parser(raw)
+            self.stats['parsed'] += 1
+        self.entries[name] = (key, digest, data)
+        self._dirty = True
+        return data
+
+    def save(self):
+        """Snapshot schreiben (atomar), falls sich etwas geaendert hat"""
+        if not self._dirty:
+            return
+        from core.device_store import atomic_write  # device_store importiert dieses Modul
+        try:
+            atomic_write(self.snapshot_file, pickle.dumps((SNAPSHOT_VERSION, self.entries),
+                                                          protocol=pickle.HIGHEST_PROTOCOL))
+            self._dirty = False
+        except Exception as e:
+            logger.error(f"Failed to save config snapshot: {e}")
+
+
+class StartupTimer:
+    """Zeitmessung der Start-Phasen (Imports, Settings, Devices, ...)"""
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self._last = self.started
+
+    def mark(self, phase: str):
+        """Phase seit der letzten Markierung abgeschlossen"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def report(self, snapshot: Optional[ConfigSnapshot] = None) -> Dict:
+        total = self._last - self.started
+        breakdown = " | ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        extra = f" (config snapshot: {snapshot.stats['hits']} cached, {snapshot.stats['parsed']} parsed)" \
+            if snapshot else ""
+        logger.info(f"⏱ Startup {total * 1000:.0f}ms: {breakdown}{extra}")
+        return {'total_ms': round(total * 1000, 1),
+                'phases': {name: round(seconds * 1000, 1) for name, seconds in self.phases}}
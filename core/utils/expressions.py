@@ -0,0 +1,305 @@
+"""
+EMS-Core v2.0 - Expressions
+Sichere Rechenausdruecke fuer berechnete Energie-Quellen (ohne eval)
+
+Erlaubt: Zahlen, Variablen, + - * / % **, Vergleiche, `a if b else c`,
+min/max/abs/round/clamp/avg. Ein fehlender Eingangswert (None) ergibt None.
+"""
+import ast
+import logging
+import operator
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_EXPRESSION_LENGTH = 500
+
+Value = Optional[float]
+
+
+class ExpressionError(ValueError):
+    """Ungueltiger Ausdruck oder zyklische Abhaengigkeit"""
+
+
+def _div(a, b):
+    return None if b == 0 else a / b
+
+
+def _mod(a, b):
+    return None if b == 0 else a % b
+
+
+def _pow(a, b):
+    if abs(b) > 8:
+        raise ExpressionError("exponent too large")
+    return a ** b
+
+
+def _round(value, ndigits=None):
+    if ndigits is None:
+        return round(value)
+    if ndigits != int(ndigits):
+        raise ExpressionError("round() ndigits must be an integer")
+    return round(value, int(ndigits))
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def _avg(*values):
+    """Mittelwert der vorhandenen Werte (None wird ignoriert, leer = 0)"""
+    present = [v for v in values if v is not None]
+    return sum(present) / len(present) if present else 0.0
+
+
+_BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: _div,
+    ast.Mod: _mod,
+    ast.Pow: _pow,
+}
+
+_UNARY_OPS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+_COMPARE_OPS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+# Name -> (Funktion, min. Argumente, max. Argumente, None-tolerant)
+_FUNCTIONS: Dict[str, Tuple[Callable, int, Optional[int], bool]] = {
+    'min': (min, 2, None, False),
+    'max': (max, 2, None, False),
+    'abs': (abs, 1, 1, False),
+    'round': (_round, 1, 2, False),
+    'clamp': (_clamp, 3, 3, False),
+    'avg': (_avg, 0, None, True),
+}
+
+Evaluator = Callable[[Dict[str, Value]], Value]
+
+
+class Expression:
+    """Einmal kompilierter Ausdruck"""
+
+    def __init__(self, text: str, evaluator: Evaluator, variables: Tuple[str, ...]):
+        self.text = text
+        self.variables = variables
+        self._evaluator = evaluator
+
+    def __call__(self, values: Dict[str, Value]) -> Value:
+        try:
+            result = self._evaluator(values)
+            return None if result is None else float(result)
+        except (ArithmeticError, TypeError, ValueError) as e:  # inkl. ExpressionError, OverflowError
+            logger.debug(f"Expression '{self.text}' failed: {e}")
+            return None
+
+    def __repr__(self):
+        return f"Expression({self.text!r})"
+
+
+def compile_expression(text: str) -> Expression:
+    """
+    Parse und kompiliere einen Ausdruck
+
+    Raises:
+        ExpressionError: Syntaxfehler oder nicht erlaubtes Konstrukt
+    """
+    if not isinstance(text, str) or not text.strip():
+        raise ExpressionError("empty expression")
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ExpressionError(f"syntax error: {e.msg}") from None
+
+    variables: List[str] = []
+    evaluator = _compile_node(tree.body, variables)
+    return Expression(text.strip(), evaluator, tuple(dict.fromkeys(variables)))
+
+
+def _compile_node(node: ast.AST, variables: List[str]) -> Evaluator:
+    """Uebersetze einen AST-Knoten in eine Closure (Whitelist)"""
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ExpressionError(f"unsupported constant {node.value!r}")
+        try:
+            value = float(node.value)  # float statt int: keine unbegrenzt grossen Ganzzahlen bei **
+        except OverflowError:
+            raise ExpressionError(f"constant too large: {node.value}") from None
+        return lambda values: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in _FUNCTIONS:
+            raise ExpressionError(f"function '{name}' used as value")
+        variables.append(name)
+        return lambda values: values.get(name)
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+        op = _BINARY_OPS[type(node.op)]
+        left, right = _compile_node(node.left, variables), _compile_node(node.right, variables)
+
+        def binary(values):
+            a, b = left(values), right(values)
+            return None if a is None or b is None else op(a, b)
+        return binary
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+        op = _UNARY_OPS[type(node.op)]
+        operand = _compile_node(node.operand, variables)
+
+        def unary(values):
+            a = operand(values)
+            return None if a is None else op(a)
+        return unary
+
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE_OPS:
+        op = _COMPARE_OPS[type(node.ops[0])]
+        left, right = _compile_node(node.left, variables), _compile_node(node.comparators[0], variables)
+
+        def compare(values):
+            a, b = left(values), right(values)
+            return None if a is None or b is None else (1.0 if op(a, b) else 0.0)
+        return compare
+
+    if isinstance(node, ast.IfExp):
+        test = _compile_node(node.test, variables)
+        body, orelse = _compile_node(node.body, variables), _compile_node(node.orelse, variables)
+
+        def conditional(values):
+            condition = test(values)
+            if condition is None:
+                return None
+            return body(values) if condition else orelse(values)
+        return conditional
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS:
+        name = node.func.id
+        func, min_args, max_args, none_tolerant = _FUNCTIONS[name]
+        if node.keywords:
+            raise ExpressionError(f"{name}() takes no keyword arguments")
+        if len(node.args) < min_args or (max_args is not None and len(node.args) > max_args):
+            raise ExpressionError(f"wrong number of arguments for {name}()")
+        args = [_compile_node(arg, variables) for arg in node.args]
+
+        def call(values):
+            evaluated = [arg(values) for arg in args]
+            if not none_tolerant and any(v is None for v in evaluated):
+                return None
+            return func(*evaluated)
+        return call
+
+    raise ExpressionError(f"unsupported syntax: {type(node).__name__}")
+
+
+class ExpressionGraph:
+    """
+    Benannte Ausdruecke mit Abhaengigkeiten untereinander
+
+    Auswertung in topologischer Reihenfolge; ein Knoten wird nur neu
+    berechnet, wenn sich einer seiner Eingangswerte geaendert hat.
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, Expression] = {}
+        self._order: Optional[List[str]] = None
+        self._cache: Dict[str, Tuple[tuple, Value]] = {}
+        self.evaluations = 0
+
+    def add(self, name: str, expression):
+        """Fuege Knoten hinzu (Text oder Expression)"""
+        if isinstance(expression, str):
+            expression = compile_expression(expression)
+        self.nodes[name] = expression
+        self._order = None
+        self._cache.pop(name, None)
+
+    def remove(self, name: str):
+        self.nodes.pop(name, None)
+        self._order = None
+        self._cache.pop(name, None)
+
+    def order(self) -> List[str]:
+        """
+        Topologische Reihenfolge (Kahn)
+
+        Raises:
+            ExpressionError: Zyklus (Knoten im Zyklus stehen in `cycle`, Knoten,
+                die nur von ihm abhaengen, nicht)
+        """
+        if self._order is not None:
+            return self._order
+
+        dependents: Dict[str, List[str]] = {name: [] for name in self.nodes}
+        pending = {}
+        for name, expression in self.nodes.items():
+            deps = [v for v in expression.variables if v in self.nodes]
+            pending[name] = len(deps)
+            for dep in deps:
+                dependents[dep].append(name)
+
+        ready = [name for name, count in pending.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for dependent in dependents[name]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) != len(self.nodes):
+            cycle = self._cycle_nodes([name for name, count in pending.items() if count > 0])
+            error = ExpressionError(f"cyclic dependency between: {', '.join(cycle)}")
+            error.cycle = cycle
+            raise error
+
+        self._order = order
+        return order
+
+    def _cycle_nodes(self, blocked: List[str]) -> List[str]:
+        """Knoten, die von sich selbst aus erreichbar sind (unter den nicht sortierbaren)"""
+        blocked_set = set(blocked)
+        deps = {name: [v for v in self.nodes[name].variables if v in blocked_set] for name in blocked}
+        cycle = []
+        for name in blocked:
+            stack, seen = list(deps[name]), set()
+            while stack:
+                current = stack.pop()
+                if current == name:
+                    cycle.append(name)
+                    break
+                if current not in seen:
+                    seen.add(current)
+                    stack.extend(deps[current])
+        return sorted(cycle)
+
+    def evaluate(self, inputs: Dict[str, Value]) -> Dict[str, Value]:
+        """Werte alle Knoten aus -> {Name: Wert}"""
+        values = dict(inputs)
+        results = {}
+        for name in self.order():
+            expression = self.nodes[name]
+            key = tuple(values.get(v) for v in expression.variables)
+            cached = self._cache.get(name)
+            if cached is not None and cached[0] == key:
+                value = cached[1]
+            else:
+                value = expression(values)
+                self._cache[name] = (key, value)
+                self.evaluations += 1
+            values[name] = results[name] = value
+        return results
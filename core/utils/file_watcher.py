@@ -0,0 +1,189 @@
+"""
+EMS-Core v2.0 - File Watcher
+Aenderungen an Konfigurationsdateien erkennen (inotify, sonst mtime-Polling)
+
+inotify wird per ctypes angesprochen (keine Zusatz-Abhaengigkeit) und
+beobachtet die Verzeichnisse der Dateien - Editoren und atomic_write
+ersetzen Dateien per rename. Ob sich eine Datei wirklich geaendert hat,
+entscheidet immer der Vergleich von mtime/Groesse/Inode.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len (+ name)
+
+
+def file_key(path: Path) -> Optional[Tuple[int, int, int]]:
+    """(mtime_ns, Groesse, Inode) oder None, wenn die Datei fehlt"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class Inotify:
+    """Minimaler inotify-Zugriff (Linux) ueber die libc"""
+
+    def __init__(self, directories: Iterable[Path]):
+        """
+        Raises:
+            OSError: inotify nicht verfuegbar (anderes OS, Limit erreicht)
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify unavailable: {e}") from None
+
+        self.fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, Path] = {}
+        for directory in directories:
+            wd = add_watch(self.fd, os.fsencode(str(directory)), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                self.close()
+                raise OSError(error, f"inotify_add_watch failed for {directory}")
+            self.watches[wd] = directory
+
+    def read(self) -> Set[Path]:
+        """Pfade aller anstehenden Events (nicht blockierend)"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        paths = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+            directory = self.watches.get(wd)
+            if directory is not None and name:
+                paths.add(directory / os.fsdecode(name))
+        return paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class FileWatcher:
+    """
+    Beobachtet Dateien und meldet geaenderte Pfade (entprellt)
+
+    Mit inotify reagiert der Watcher sofort; ohne (oder bei Fehlern)
+    vergleicht er alle `interval` Sekunden mtime/Groesse.
+    """
+
+    def __init__(self,
+                 paths: Iterable,
+                 callback: Callable[[List[Path]], None],
+                 interval: float = 2.0,
+                 debounce: float = 0.3,
+                 use_inotify: bool = True):
+        """
+        Args:
+            paths: Zu beobachtende Dateien
+            callback: Wird mit den geaenderten Pfaden aufgerufen
+            interval: Polling-Intervall ohne inotify (Sekunden)
+            debounce: Wartezeit nach einem Event, um Folge-Events zu sammeln
+            use_inotify: False = immer Polling
+        """
+        self.paths = [Path(p).absolute() for p in paths]
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        self.backend = 'poll'
+        self.running = False
+        self.keys = {path: file_key(path) for path in self.paths}
+        self._inotify: Optional[Inotify] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def check(self) -> List[Path]:
+        """Geaenderte Dateien seit dem letzten Aufruf (mtime/Groesse/Inode)"""
+        changed = []
+        for path in self.paths:
+            key = file_key(path)
+            if key != self.keys.get(path):
+                self.keys[path] = key
+                changed.append(path)
+        return changed
+
+    def _start_inotify(self):
+        if not self.use_inotify:
+            return
+        try:
+            self._inotify = Inotify({path.parent for path in self.paths if path.parent.is_dir()})
+            self._loop.add_reader(self._inotify.fd, self._on_inotify)
+            self.backend = 'inotify'
+        except Exception as e:
+            logger.warning(f"File watcher: inotify unavailable ({e}), polling every {self.interval}s")
+            if self._inotify:
+                self._inotify.close()
+            self._inotify = None
+
+    def _on_inotify(self):
+        if self._inotify and self._inotify.read() & set(self.paths):
+            self._wakeup.set()
+
+    async def run(self):
+        """Beobachten bis stop()"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.running = True
+        self._start_inotify()
+        logger.info(f"👀 Watching {len(self.paths)} config files ({self.backend})")
+
+        while self.running:
+            try:
+                if self.backend == 'inotify':
+                    await self._wakeup.wait()
+                else:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self.running:
+                break
+            if self._wakeup.is_set():
+                await asyncio.sleep(self.debounce)  # Folge-Events (Temp-Datei, rename) abwarten
+                self._wakeup.clear()
+
+            changed = self.check()
+            if changed:
+                try:
+                    self.callback(changed)
+                except Exception as e:
+                    logger.error(f"✗ File watcher callback failed: {e}", exc_info=True)
+
+    def stop(self):
+        self.running = False
+        if self._inotify:
+            if self._loop and not self._loop.is_closed():
+                self._loop.remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        if self._wakeup:
+            self._wakeup.set()
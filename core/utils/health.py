@@ -0,0 +1,250 @@
+"""
+EMS-Core v2.0 - Endpoint Health
+Latenz-Statistik, adaptive Timeouts und Circuit Breaker pro Endpoint (IP / Host:Port)
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from enum import Enum
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class CircuitState(Enum):
+    """Zustand des Circuit Breakers"""
+    CLOSED = "closed"          # Normalbetrieb
+    OPEN = "open"              # Endpoint wird nicht kontaktiert
+    HALF_OPEN = "half_open"    # Ein Probe-Request ist unterwegs
+
+
+class CircuitOpenError(Exception):
+    """Endpoint ist gesperrt (Circuit Breaker offen)"""
+
+
+class ServerError(Exception):
+    """Endpoint antwortet mit HTTP 5xx (zaehlt als Fehler, 4xx nicht)"""
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class EndpointHealth:
+    """
+    Gesundheitszustand eines Endpoints
+
+    - Timeout = p95 der letzten Latenzen * timeout_factor (begrenzt auf min/max)
+    - Nach `failure_threshold` Fehlern in Folge oeffnet der Breaker, danach
+      wird mit exponentiellem Backoff genau ein Probe-Request zugelassen
+    """
+
+    def __init__(self,
+                 endpoint: str,
+                 min_timeout: float = 0.5,
+                 max_timeout: float = 5.0,
+                 timeout_factor: float = 3.0,
+                 failure_threshold: int = 3,
+                 base_backoff: float = 10.0,
+                 max_backoff: float = 600.0,
+                 window: int = 50):
+        self.endpoint = endpoint
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.latencies = deque(maxlen=window)
+        self.state = CircuitState.CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0  # Anzahl Oeffnungen in Folge (fuer Backoff)
+        self.next_probe = 0.0
+        self.probe_started = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+        self.skipped_requests = 0
+        self.last_error: Optional[str] = None
+        self.last_success: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latenz-Perzentil in Sekunden (None ohne Messwerte)"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def timeout(self) -> float:
+        """Adaptiver Timeout fuer den naechsten Request"""
+        if len(self.latencies) < 5:
+            return self.max_timeout
+        p95 = self.percentile(95)
+        return max(self.min_timeout, min(self.max_timeout, p95 * self.timeout_factor))
+
+    def allow_request(self) -> bool:
+        """Darf der Endpoint kontaktiert werden?"""
+        with self._lock:
+            if self.state == CircuitState.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == CircuitState.OPEN and now >= self.next_probe:
+                self.state = CircuitState.HALF_OPEN
+                self.probe_started = now
+                logger.info(f"Circuit {self.endpoint}: probing")
+                return True
+            if self.state == CircuitState.HALF_OPEN and now - self.probe_started > 2 * self.max_timeout:
+                # Probe wurde nie abgeschlossen (z.B. abgebrochen) - neuer Versuch
+                self.probe_started = now
+                return True
+            self.skipped_requests += 1
+            return False
+
+    def record_success(self, latency: float):
+        """Erfolgreicher Request"""
+        with self._lock:
+            self.latencies.append(latency)
+            self.total_requests += 1
+            self.consecutive_failures = 0
+            self.last_success = time.time()
+            if self.state != CircuitState.CLOSED:
+                logger.info(f"✓ Circuit {self.endpoint}: closed (device reachable again)")
+            self.state = CircuitState.CLOSED
+            self.open_count = 0
+
+    def record_failure(self, error: str = ""):
+        """Fehlgeschlagener Request (Timeout, Verbindungsfehler)"""
+        with self._lock:
+            self.total_requests += 1
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+
+            if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                backoff = min(self.max_backoff, self.base_backoff * (2 ** self.open_count))
+                self.open_count += 1
+                self.next_probe = time.monotonic() + backoff
+                if self.state != CircuitState.OPEN:
+                    logger.warning(f"✗ Circuit {self.endpoint}: open, next probe in {backoff:.0f}s ({error})")
+                self.state = CircuitState.OPEN
+
+    def to_dict(self) -> Dict:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        return {
+            'endpoint': self.endpoint,
+            'state': self.state.value,
+            'timeout': round(self.timeout(), 3),
+            'latency_p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'latency_p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            'consecutive_failures': self.consecutive_failures,
+            'total_requests': self.total_requests,
+            'total_failures': self.total_failures,
+            'skipped_requests': self.skipped_requests,
+            'next_probe_in': (
+                round(max(0.0, self.next_probe - time.monotonic()), 1)
+                if self.state == CircuitState.OPEN else None
+            ),
+            'last_error': self.last_error,
+            'last_success': self.last_success
+        }
+
+
+class HealthRegistry:
+    """Registry aller Endpoints (thread-safe, ein Eintrag pro Endpoint)"""
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self.endpoints: Dict[str, EndpointHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str) -> EndpointHealth:
+        """Hole (oder erzeuge) Health-Eintrag"""
+        health = self.endpoints.get(endpoint)
+        if health is None:
+            with self._lock:
+                health = self.endpoints.setdefault(endpoint, EndpointHealth(endpoint, **self.defaults))
+        return health
+
+    async def call(self, endpoint: str, func: Callable[[float], Awaitable[T]]) -> T:
+        """
+        Fuehre `func(timeout)` mit Breaker-Pruefung und Latenz-Messung aus
+
+        Jede Exception aus `func` zaehlt als Fehler - HTTP-Aufrufe werfen bei
+        5xx `ServerError`, statt den Status zurueckzugeben.
+
+        Raises:
+            CircuitOpenError: Endpoint ist gesperrt
+        """
+        health = self.get(endpoint)
+        if not health.allow_request():
+            raise CircuitOpenError(f"Circuit open for {endpoint}")
+
+        started = time.perf_counter()
+        try:
+            result = await func(health.timeout())
+        except Exception as e:
+            health.record_failure(f"{type(e).__name__}: {e}")
+            raise
+        health.record_success(time.perf_counter() - started)
+        return result
+
+    def get_all(self) -> List[Dict]:
+        """Status aller Endpoints"""
+        return [h.to_dict() for h in list(self.endpoints.values())]
+
+    def export(self, path: Path, extra: Optional[Dict[str, Callable[[], Dict]]] = None):
+        """
+        Status aller Endpoints fuer andere Prozesse (Web UI) schreiben
+
+        Args:
+            extra: Weitere Abschnitte {Name: Statistik-Funktion}, z.B. Modbus-Proxy
+        """
+        from core.device_store import atomic_write
+        data = {'updated': time.time(), 'endpoints': self.get_all()}
+        for name, get_stats in (extra or {}).items():
+            data[name] = get_stats()
+        atomic_write(Path(path), json.dumps(data))
+
+    async def run_export(self, path: Path, interval: float = 5.0,
+                         extra: Optional[Dict[str, Callable[[], Dict]]] = None):
+        """Export alle `interval` Sekunden (laeuft im pollenden EMS-Prozess)"""
+        while True:
+            try:
+                self.export(path, extra)
+            except Exception as e:
+                logger.error(f"Health export to {path} failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def read_health_export(path: Path, max_age: float = 60.0) -> Optional[Dict]:
+    """
+    Export des EMS-Prozesses lesen
+
+    Returns:
+        {'updated', 'age', 'endpoints': {Endpoint: Status}, ...weitere Abschnitte}
+        oder None (fehlt, veraltet, ungueltig)
+    """
+    try:
+        data = json.loads(Path(path).read_text())
+        age = time.time() - data['updated']
+        if age > max_age:
+            return None
+        return dict(data, age=round(age, 1), endpoints={e['endpoint']: e for e in data['endpoints']})
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.debug(f"Health export {path} unreadable: {e}")
+        return None
+
+
+# Prozessweite Registry
+health_registry = HealthRegistry()
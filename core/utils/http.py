@@ -0,0 +1,40 @@
+"""
+EMS-Core v2.0 - HTTP Sessions
+Geteilte aiohttp-Session pro Event-Loop (Connection-Pooling / Keep-Alive)
+"""
+import asyncio
+import logging
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Event-Loop -> ClientSession (aiohttp-Sessions sind an ihren Loop gebunden)
+_sessions = weakref.WeakKeyDictionary()
+
+
+def get_session():
+    """
+    Hole die geteilte ClientSession des laufenden Event-Loops
+
+    Muss aus einer Coroutine heraus aufgerufen werden.
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        from core.utils.resolver import AiohttpResolver, host_resolver
+        # Namensaufloesung ueber den gemeinsamen Resolver-Cache (statt aiohttp-eigenem DNS-Cache)
+        connector = aiohttp.TCPConnector(limit=64, limit_per_host=4, use_dns_cache=False,
+                                         resolver=AiohttpResolver(host_resolver))
+        session = aiohttp.ClientSession(connector=connector)
+        _sessions[loop] = session
+        logger.debug("Created shared HTTP session")
+    return session
+
+
+async def close_session():
+    """Schliesse die Session des laufenden Event-Loops"""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
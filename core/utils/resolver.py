@@ -0,0 +1,273 @@
+"""
+EMS-Core v2.0 - Resolver Cache
+Namensaufloesung mit Cache fuer alle HTTP- und Modbus-Clients
+
+`.local`-Namen (mDNS) kosten ueber den System-Resolver oft hunderte
+Millisekunden oder laufen in Timeouts. Der Cache liefert aufgeloeste
+Adressen bis zum Ablauf der TTL, merkt sich Fehlschlaege (negative TTL),
+erneuert Eintraege kurz vor Ablauf im Hintergrund und erlaubt feste
+Zuordnungen (Pinning).
+"""
+import asyncio
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResolveError(OSError):
+    """Name konnte nicht aufgeloest werden (auch aus dem negativen Cache)"""
+
+
+@dataclass
+class CacheEntry:
+    """Aufloesung eines Hostnamens"""
+    addresses: List[str]
+    expires: float                  # monotonic; inf = gepinnt
+    error: Optional[str] = None     # gesetzt = negativer Eintrag
+    source: str = 'dns'             # dns, mdns, pinned
+
+    @property
+    def pinned(self) -> bool:
+        return self.expires == float('inf')
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+class HostResolver:
+    """
+    Caching-Resolver (thread-safe, nutzbar aus mehreren Event-Loops)
+
+    - Treffer innerhalb der TTL: keine Aufloesung
+    - Im letzten `refresh_ahead`-Anteil der TTL: gecachte Adresse sofort,
+      Erneuerung im Hintergrund
+    - Fehlschlag: gecachter Fehler fuer `negative_ttl`; war vorher eine
+      Adresse bekannt, wird sie weiter ausgeliefert (stale)
+    - Gleichzeitige Anfragen fuer denselben Namen teilen sich eine Aufloesung
+    """
+
+    def __init__(self,
+                 ttl: float = 300.0,
+                 negative_ttl: float = 30.0,
+                 refresh_ahead: float = 0.2,
+                 timeout: float = 2.0,
+                 pinned: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            ttl: Gueltigkeit einer erfolgreichen Aufloesung (Sekunden)
+            negative_ttl: Gueltigkeit eines Fehlschlags (Sekunden)
+            refresh_ahead: Anteil der TTL vor Ablauf, ab dem im Hintergrund erneuert wird
+            timeout: Max. Dauer einer Aufloesung (Sekunden)
+            pinned: Feste Zuordnungen {Hostname: IP}
+        """
+        self.entries: Dict[str, CacheEntry] = {}
+        self.stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'negative_hits': 0,
+                      'refreshes': 0, 'failures': 0, 'stale_served': 0}
+        self.timings: Dict[str, deque] = {}  # Host -> letzte Aufloesungsdauern (Sekunden)
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.configure(ttl=ttl, negative_ttl=negative_ttl, refresh_ahead=refresh_ahead,
+                       timeout=timeout, pinned=pinned)
+
+    def configure(self, ttl: Optional[float] = None, negative_ttl: Optional[float] = None,
+                  refresh_ahead: Optional[float] = None, timeout: Optional[float] = None,
+                  pinned: Optional[Dict[str, str]] = None):
+        """Parameter setzen (z.B. aus settings.yaml `resolver`)"""
+        if ttl is not None:
+            self.ttl = ttl
+        if negative_ttl is not None:
+            self.negative_ttl = negative_ttl
+        if refresh_ahead is not None:
+            self.refresh_ahead = refresh_ahead
+        if timeout is not None:
+            self.timeout = timeout
+        for host, ip in (pinned or {}).items():
+            self.pin(host, ip)
+
+    # ------------------------------------------------------------------
+    # Cache-Pflege
+    # ------------------------------------------------------------------
+
+    def pin(self, host: str, address: str):
+        """Feste Zuordnung (laeuft nie ab, wird nie aufgeloest)"""
+        with self._lock:
+            self.entries[host.lower()] = CacheEntry([address], float('inf'), source='pinned')
+        logger.info(f"Resolver: pinned {host} -> {address}")
+
+    def unpin(self, host: str):
+        with self._lock:
+            entry = self.entries.get(host.lower())
+            if entry and entry.pinned:
+                del self.entries[host.lower()]
+
+    def learn(self, host: str, address: str, ttl: Optional[float] = None, source: str = 'mdns'):
+        """Adresse aus anderer Quelle uebernehmen (z.B. mDNS-Announcement)"""
+        host = host.lower().rstrip('.')
+        with self._lock:
+            entry = self.entries.get(host)
+            if entry and entry.pinned:
+                return
+            self.entries[host] = CacheEntry([address], time.monotonic() + (ttl or self.ttl), source=source)
+
+    def invalidate(self, host: Optional[str] = None):
+        """Eintrag (oder alle nicht gepinnten) verwerfen"""
+        with self._lock:
+            if host is not None:
+                self.entries.pop(host.lower(), None)
+            else:
+                self.entries = {h: e for h, e in self.entries.items() if e.pinned}
+
+    # ------------------------------------------------------------------
+    # Aufloesung
+    # ------------------------------------------------------------------
+
+    async def resolve_host(self, host: str) -> str:
+        """
+        Erste Adresse eines Hostnamens (IP-Literale unveraendert)
+
+        Raises:
+            ResolveError: Name nicht aufloesbar
+        """
+        return (await self.resolve_all(host))[0]
+
+    async def resolve_all(self, host: str) -> List[str]:
+        """
+        Alle Adressen eines Hostnamens
+
+        Raises:
+            ResolveError: Name nicht aufloesbar
+        """
+        if _is_ip(host):
+            return [host]
+        key = host.lower().rstrip('.')
+        self.stats['lookups'] += 1
+        now = time.monotonic()
+        entry = self.entries.get(key)
+
+        if entry is not None and now < entry.expires:
+            if entry.error is not None:
+                self.stats['negative_hits'] += 1
+                raise ResolveError(f"{host}: {entry.error} (cached)")
+            self.stats['hits'] += 1
+            if not entry.pinned and entry.expires - now < self.ttl * self.refresh_ahead:
+                self._schedule(key)
+            return entry.addresses
+
+        self.stats['misses'] += 1
+        # shield: ein abgebrochener Aufrufer (z.B. Request-Timeout) bricht nicht den gemeinsamen Lookup ab
+        entry = await asyncio.shield(self._schedule(key))
+        if entry.error is not None:
+            raise ResolveError(f"{host}: {entry.error}")
+        return entry.addresses
+
+    def _schedule(self, key: str) -> asyncio.Task:
+        """Eine Aufloesung pro Name und Event-Loop (Single-Flight)"""
+        loop = asyncio.get_running_loop()
+        task = self._pending.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            task = loop.create_task(self._lookup(key))
+            self._pending[key] = task
+        return task
+
+    async def _lookup(self, key: str) -> CacheEntry:
+        loop = asyncio.get_running_loop()
+        previous = self.entries.get(key)
+        if previous is not None and previous.error is None:
+            self.stats['refreshes'] += 1
+        started = time.perf_counter()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(key, None, family=socket.AF_INET, type=socket.SOCK_STREAM),
+                self.timeout
+            )
+            addresses = list(dict.fromkeys(info[4][0] for info in infos))
+            if not addresses:
+                raise ResolveError("no addresses")
+            entry = CacheEntry(addresses, time.monotonic() + self.ttl)
+            logger.debug(f"Resolver: {key} -> {addresses[0]} ({(time.perf_counter() - started) * 1000:.0f}ms)")
+
+        except Exception as e:
+            self.stats['failures'] += 1
+            error = 'timeout' if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            expires = time.monotonic() + self.negative_ttl
+            if previous is not None and previous.error is None:
+                # Letzte bekannte Adresse weiter nutzen statt Ausfall
+                self.stats['stale_served'] += 1
+                entry = CacheEntry(previous.addresses, expires, source=previous.source)
+                logger.warning(f"✗ Resolver: {key} failed ({error}), keeping {previous.addresses[0]}")
+            else:
+                entry = CacheEntry([], expires, error=error)
+                logger.warning(f"✗ Resolver: {key} failed ({error})")
+
+        finally:
+            self.timings.setdefault(key, deque(maxlen=50)).append(time.perf_counter() - started)
+            self._pending.pop(key, None)
+
+        with self._lock:
+            current = self.entries.get(key)
+            if current is None or not current.pinned:
+                self.entries[key] = entry
+        return entry
+
+    # ------------------------------------------------------------------
+    # Metriken
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict:
+        """Cache-Statistik und Aufloesungsdauer pro Host"""
+        now = time.monotonic()
+        hosts = {}
+        for host, entry in list(self.entries.items()):
+            timings = sorted(self.timings.get(host, ()))
+            hosts[host] = {
+                'addresses': entry.addresses,
+                'source': entry.source,
+                'error': entry.error,
+                'expires_in': None if entry.pinned else round(entry.expires - now, 1),
+                'resolutions': len(timings),
+                'resolve_avg_ms': round(sum(timings) / len(timings) * 1000, 1) if timings else None,
+                'resolve_max_ms': round(timings[-1] * 1000, 1) if timings else None,
+            }
+        lookups = self.stats['lookups']
+        return {
+            **self.stats,
+            'hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else None,
+            'hosts': hosts
+        }
+
+
+class AiohttpResolver:
+    """Adapter fuer aiohttp.TCPConnector(resolver=...)"""
+
+    def __init__(self, resolver: HostResolver):
+        self.resolver = resolver
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict]:
+        try:
+            addresses = await self.resolver.resolve_all(host)
+        except ResolveError as e:
+            raise OSError(str(e)) from None
+        return [
+            {'hostname': host, 'host': address, 'port': port, 'family': socket.AF_INET,
+             'proto': 0, 'flags': socket.AI_NUMERICHOST}
+            for address in addresses
+        ]
+
+    async def close(self):
+        pass
+
+
+# Prozessweiter Resolver
+host_resolver = HostResolver()
@@ -0,0 +1,133 @@
+"""
+EMS-Core v2.0 - Settings
+Laedt die Haupt-Konfiguration (config/settings.yaml)
+"""
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from core.utils.config_snapshot import ConfigSnapshot, load_yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    'optimization_interval': 30,
+    'hysteresis': 100,
+    'battery': {
+        'min_soc': 20,
+        'max_soc': 90,
+        'priority_soc': 50,
+    },
+    'grid': {
+        'max_import': 0,  # 0 = keine Begrenzung
+        'max_export': 0,
+        'per_phase_balance': False,  # Ueberschuss je Phase pruefen (nur Devices mit phase A/B/C)
+    },
+    'grid_protection': {
+        'enabled': True,
+        'interval': 0.5,       # Sekunden zwischen Grid-Messungen
+        'max_reaction': 2.0,   # Latenz-Budget bis Lastabwurf abgeschlossen
+        'solax_max_age': 1.0,  # Solax-Snapshot fuer den Guard wiederverwenden (Sekunden)
+        'shed_hold': 300,      # Sekunden bis abgeworfene Lasten wieder erlaubt sind
+        'settle_time': 3.0,    # Sekunden nach einem Abwurf bis zur naechsten Reaktion
+    },
+    'device_store': {
+        'backend': 'yaml',                  # yaml (devices.yaml) oder sqlite
+        'sqlite_file': 'config/devices.db',
+    },
+    'reconciliation': {
+        'verify_timeout': 3.0,  # Max. Wartezeit auf Push-Bestaetigung eines Befehls
+        'base_backoff': 5.0,    # Erster Retry-Abstand, verdoppelt sich je Fehlversuch
+        'max_backoff': 300.0,
+        'observed_max_age': 300.0,  # Letzter bekannter Zustand gilt max. so lange
+    },
+    'sg_ready': {
+        'enabled': False,
+        'device_id': 'heatpump',
+        'relay1_id': 'shelly_sg_relay1',
+        'relay2_id': 'shelly_sg_relay2',
+        'on_mode': 'recommended',   # Modus bei PV-Ueberschuss (recommended/forced)
+        'min_mode_interval': 600,   # Sekunden zwischen Moduswechseln
+    },
+    'modbus_proxy': {
+        'enabled': False,
+        'host': '0.0.0.0',
+        'port': 5020,
+        'interval': 5.0,    # Sekunden zwischen Upstream-Polls
+        'max_age': 30.0,    # Aeltere Daten werden nicht ausgeliefert
+        'upstreams': [],    # [{name, ip, port, unit_id, serve_unit, blocks: [[Start, Anzahl, Typ]]}]
+    },
+    'resolver': {
+        'ttl': 300.0,           # Gueltigkeit einer Aufloesung (Sekunden)
+        'negative_ttl': 30.0,   # Fehlschlaege werden so lange gecacht
+        'refresh_ahead': 0.2,   # Anteil der TTL vor Ablauf -> Erneuerung im Hintergrund
+        'timeout': 2.0,
+        'pinned': {},           # {Hostname: IP} - nie aufloesen
+    },
+    'shelly_ws': {
+        'enabled': False,
+        'host': '0.0.0.0',
+        'port': 8765,
+        'path': '/shelly',
+    },
+    'coiot': {
+        'enabled': False,
+        'port': 5683,
+        'group': '224.0.1.187',
+        'connected_ttl': 45.0,  # Sekunden ohne Paket bis das Device als getrennt gilt
+    },
+    'health_export': {
+        'file': 'config/.device_health.json',  # Endpoint-Status fuer die Web UI
+        'interval': 5.0,    # Sekunden zwischen Exporten
+    },
+    'mdns': {
+        'enabled': False,
+        'port': 5353,
+        'group': '224.0.0.251',
+        'cache_file': 'config/device_fingerprints.json',
+    },
+    'hot_reload': {
+        'enabled': True,
+        'inotify': True,      # False = nur mtime-Polling
+        'interval': 2.0,      # Polling-Intervall ohne inotify (Sekunden)
+        'debounce': 0.3,      # Sammelzeit fuer zusammengehoerige Datei-Events
+    },
+}
+
+
+def _merge(defaults: Dict, overrides: Dict) -> Dict:
+    """Rekursives Zusammenfuehren (overrides gewinnt)"""
+    merged = dict(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _parse_settings(raw: bytes) -> Dict[str, Any]:
+    data = load_yaml(raw) or {}
+    if not isinstance(data, dict):
+        raise ValueError("settings must be a mapping")
+    return data
+
+
+def load_settings(settings_file: str = "config/settings.yaml",
+                  snapshot: Optional[ConfigSnapshot] = None) -> Dict[str, Any]:
+    """
+    Lade settings.yaml, fehlende Werte werden mit Defaults ergaenzt
+
+    Args:
+        snapshot: Config-Snapshot (unveraenderte Datei wird nicht neu geparst)
+    """
+    path = Path(settings_file)
+    try:
+        if path.exists():
+            data = snapshot.read(path, _parse_settings) if snapshot else _parse_settings(path.read_bytes())
+            logger.info(f"Loaded settings from {path}")
+            return _merge(DEFAULT_SETTINGS, data)
+        logger.warning(f"No settings file found at {path}, using defaults")
+    except Exception as e:
+        logger.error(f"Failed to load settings: {e}")
+    return _merge(DEFAULT_SETTINGS, {})
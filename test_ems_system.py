@@ -7,6 +7,13 @@ from datetime import datetime
 
 from core.optimizer.scheduler import Scheduler
 from core.optimizer.prioritizer import Prioritizer, Device, Priority
+from core.optimizer.power_profile import PowerProfileManager, P2Quantile, DEFAULT_POWER
+from core.optimizer.grid_guard import GridGuard
+from core.optimizer.phase_budget import PhaseBudget
+from core.utils.health import HealthRegistry, CircuitOpenError
+from core.utils.async_bridge import AsyncBridge
+from core.controllers.shelly import ShellyController
+from core.device_manager import DeviceConfig
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -48,6 +55,1663 @@ def test_prioritizer():
     return len(plan) == 3
 
 
+def test_power_profile(tmp_path):
+    """Test Power-Profile: P90-Schaetzung, Anlaufspitze, Persistenz"""
+    import random
+    
+    estimator = P2Quantile(0.9)
+    rng = random.Random(42)
+    values = [rng.uniform(0, 1000) for _ in range(5000)]
+    for v in values:
+        estimator.add(v)
+    exact = sorted(values)[int(0.9 * len(values))]
+    assert abs(estimator.value() - exact) < 20
+    
+    profiles_file = tmp_path / "power_profiles.json"
+    manager = PowerProfileManager(str(profiles_file), min_samples=3)
+    device = DeviceConfig(id="heater", name="Heizstab", type="shelly_plug", ip="10.0.0.26")
+    assert manager.estimate(device) == DEFAULT_POWER
+    
+    manager.record("heater", "on", 2600, timestamp=0)    # Anlauf
+    for t in range(1, 200):
+        manager.record("heater", "on", 2000 + t % 20, timestamp=60 + t * 30)
+    profile = manager.get_profile("heater")
+    assert profile.startup_peak == 2600
+    assert 2000 < manager.estimate(device) < 2100
+    
+    assert not manager.save_profiles()  # gedrosselt (save_interval)
+    assert manager.save_profiles(force=True) and not manager.save_profiles(force=True)  # nur bei Aenderung
+    assert [p.name for p in tmp_path.iterdir()] == ["power_profiles.json"]  # keine Temp-Datei uebrig
+    reloaded = PowerProfileManager(str(profiles_file), min_samples=3)
+    assert reloaded.estimate(device) == manager.estimate(device)
+    logger.info(f"✓ Power Profile Test: {manager.estimate(device):.0f}W")
+
+
+def test_grid_guard_latency():
+    """Simulator-Test: Lastabwurf bei Netzbezug > max_import innerhalb des Latenz-Budgets"""
+    import asyncio
+    
+    devices = {
+        'wallbox': (DeviceConfig(id='wallbox', name='Wallbox', type='shelly_plug', ip='sim', priority='LOW'), 7000),
+        'heater': (DeviceConfig(id='heater', name='Heizstab', type='shelly_plug', ip='sim', priority='OPTIONAL'), 3000),
+        'fridge': (DeviceConfig(id='fridge', name='Kuehlschrank', type='shelly_plug', ip='sim', priority='CRITICAL'), 150),
+    }
+    on = {'heater', 'fridge'}  # 1000 + 3000 + 150 = 4150W Netzbezug
+    base_load = 1000
+    
+    async def read_meter():
+        await asyncio.sleep(0.01)  # Meter-Latenz
+        return base_load + sum(devices[d][1] for d in on)
+    
+    async def switch_off(device):
+        await asyncio.sleep(0.05)  # Relais-Latenz
+        on.discard(device.id)
+        return True
+    
+    async def scenario():
+        guard = GridGuard(
+            read_grid_power=read_meter,
+            get_candidates=lambda: [devices[d] for d in on],
+            shed_device=switch_off,
+            max_import=10000,
+            interval=0.02,
+            max_reaction=0.5
+        )
+        task = asyncio.create_task(guard.run())
+        await asyncio.sleep(0.1)
+        assert guard.histogram.count == 0
+        on.add('wallbox')  # Lastsprung: 11150W > 10000W
+        await asyncio.sleep(0.3)
+        guard.stop()
+        await task
+        return guard
+    
+    guard = asyncio.run(scenario())
+    stats = guard.get_stats()
+    
+    assert on == {'fridge', 'wallbox'}  # OPTIONAL zuerst, CRITICAL nie
+    assert guard.histogram.count == 1
+    assert guard.bound_violations == 0
+    assert stats['reaction_time']['max_ms'] <= 500
+
+    # Verzoegerter Zaehler: der Abwurf erscheint erst nach 0.1s im Messwert
+    lagging = {'heater', 'wallbox', 'fridge'}
+
+    async def read_lagging_meter():
+        return base_load + sum(devices[d][1] for d in lagging)
+
+    async def switch_off_lagging(device):
+        asyncio.get_running_loop().call_later(0.1, lagging.discard, device.id)
+        return True
+
+    async def lagging_scenario():
+        guard = GridGuard(read_lagging_meter, lambda: [devices[d] for d in lagging],
+                          switch_off_lagging, max_import=10000, interval=0.02, settle_time=0.2)
+        task = asyncio.create_task(guard.run())
+        await asyncio.sleep(0.3)
+        guard.stop()
+        await task
+        return guard
+
+    guard = asyncio.run(lagging_scenario())
+    assert guard.histogram.count == 1
+    assert lagging == {'wallbox', 'fridge'}  # nur der Heizstab, keine Kaskade
+
+    # Fehlgeschlagener Abwurf: kein Histogramm-Eintrag, naechste Messung versucht erneut
+    attempts = []
+
+    async def broken_switch(device):
+        attempts.append(device.id)
+        raise ConnectionError("relay offline")
+
+    async def failing_scenario():
+        guard = GridGuard(read_lagging_meter, lambda: [devices['heater']], broken_switch,
+                          max_import=1000, interval=0.02)
+        await guard.check()
+        violation_since = guard.violation_since
+        await guard.check()
+        return guard, violation_since
+
+    guard, violation_since = asyncio.run(failing_scenario())
+    assert attempts == ['heater', 'heater']
+    assert guard.histogram.count == 0 and not guard.is_shed('heater')
+    assert guard.violation_since == violation_since is not None
+    logger.info(f"✓ Grid Guard Test: reaction {stats['reaction_time']}")
+
+
+def test_phase_budget(tmp_path):
+    """Test Phasen-Budget: Gesamt-Einspeisung, aber Phase A bezieht"""
+    import asyncio
+    from core.controllers.base import CAP_STATE
+    from core.integrations.state_cache import DeviceStateCache
+    from core.main import EMSOptimizer
+    
+    energy_data = {'grid_power': -1400, 'grid_phase_a': 300, 'grid_phase_b': -900, 'grid_phase_c': -800}
+    budget = PhaseBudget.from_energy_data(energy_data)
+    
+    heater_a = DeviceConfig(id="heater", name="Heizstab", type="shelly_plug", ip="10.0.0.26", phase="A")
+    pump_b = DeviceConfig(id="pump", name="Pumpe", type="shelly_plug", ip="10.0.0.24", phase="B")
+    wallbox = DeviceConfig(id="wallbox", name="Wallbox", type="shelly_pro_1pm", ip="10.0.0.30")
+    
+    assert not budget.fits(heater_a, 500)
+    assert budget.limiting_phase(heater_a, 500) == "A"
+    assert budget.fits(pump_b, 500)
+    budget.consume(pump_b, 500)
+    assert budget.fits(wallbox, 600)  # ohne Phase: nicht phasen-beschraenkt
+    budget.consume(wallbox, 600)
+    assert budget.remaining['A'] == -300
+    assert PhaseBudget.from_energy_data({'grid_power': -1400}) is None
+    
+    # Optimizer: Phasen-Pruefung nur mit grid.per_phase_balance
+    class RunningController:
+        def __init__(self, unit_key):
+            self.unit_key = unit_key
+        
+        def supports(self, capability):
+            return capability == CAP_STATE
+        
+        def hold_remaining(self):
+            return 0.0
+        
+        async def get_status(self, fields=()):
+            return {'state': 'on', 'power': 500}
+    
+    class Controllers:
+        def get(self, device):
+            return RunningController(device.ip)
+    
+    heater_a.priority = wallbox.priority = 'LOW'
+    
+    class Devices:
+        def get_all_devices(self):
+            return [heater_a, wallbox]
+        
+        def get_device(self, device_id):
+            return {d.id: d for d in self.get_all_devices()}[device_id]
+    
+    def decide(settings):
+        optimizer = EMSOptimizer(Devices(), None, cycle_interval=30, settings=settings,
+                                 power_profiles=PowerProfileManager(str(tmp_path / "profiles.json")),
+                                 device_states=DeviceStateCache(), controllers=Controllers())
+        decisions = asyncio.run(optimizer.make_control_decisions(energy_data, 1400))
+        return {d['device_id']: d['action'] for d in decisions}
+    
+    assert decide({'grid': {}}) == {}
+    assert decide({'grid': {'per_phase_balance': True}}) == {'heater': 'off'}
+    logger.info(f"✓ Phase Budget Test: {budget.remaining}")
+
+
+def test_circuit_breaker():
+    """Test Circuit Breaker: Sperre nach Fehlern, Probe nach Backoff, adaptiver Timeout"""
+    import asyncio
+    
+    registry = HealthRegistry(base_backoff=0.05, failure_threshold=3)
+    
+    async def offline(timeout):
+        raise asyncio.TimeoutError()
+    
+    async def online(timeout):
+        await asyncio.sleep(0.001)
+        return timeout
+    
+    async def scenario():
+        for _ in range(3):
+            try:
+                await registry.call("10.0.0.99", offline)
+            except asyncio.TimeoutError:
+                pass
+        try:
+            await registry.call("10.0.0.99", offline)
+            return False
+        except CircuitOpenError:
+            pass  # gesperrt, ohne Request
+        await asyncio.sleep(0.06)
+        for _ in range(10):
+            timeout = await registry.call("10.0.0.99", online)
+        return timeout
+    
+    timeout = asyncio.run(scenario())
+    health = registry.get("10.0.0.99")
+    assert health.state.value == "closed"
+    assert health.skipped_requests == 1
+    assert timeout < health.max_timeout  # Timeout aus gemessener Latenz abgeleitet
+    
+    # HTTP 5xx oeffnet den Breaker, 4xx nicht
+    from aiohttp import web
+    from core.utils.health import health_registry
+    from core.utils.http import close_session
+    
+    statuses = [404, 503, 503, 503]
+    
+    async def respond(request):
+        return web.Response(status=statuses.pop(0))
+    
+    async def http_scenario():
+        app = web.Application()
+        app.router.add_get('/rpc/Switch.Set', respond)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        endpoint = f"127.0.0.1:{runner.addresses[0][1]}"
+        shelly = ShellyController(endpoint, "shelly_plus_1pm")
+        try:
+            assert not await shelly.turn_on()
+            states = [health_registry.get(endpoint).state.value]
+            for _ in range(3):
+                assert not await shelly.turn_on()
+            states.append(health_registry.get(endpoint).state.value)
+            return states, health_registry.get(endpoint).to_dict()
+        finally:
+            health_registry.endpoints.pop(endpoint, None)
+            await close_session()
+            await runner.cleanup()
+    
+    states, server_health = asyncio.run(http_scenario())
+    assert states == ['closed', 'open']
+    assert server_health['total_failures'] == 3 and 'HTTP 503' in server_health['last_error']
+    logger.info(f"✓ Circuit Breaker Test: {health.to_dict()}")
+
+
+def test_async_bridge():
+    """Test Async Bridge: ein Loop fuer alle Threads, Timeout, sauberes Stoppen"""
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    
+    bridge = AsyncBridge("test-bridge")
+    
+    async def current_loop():
+        await asyncio.sleep(0.001)
+        return id(asyncio.get_running_loop())
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        loops = set(pool.map(lambda _: bridge.run(current_loop()), range(32)))
+    assert len(loops) == 1
+    
+    try:
+        bridge.run(asyncio.sleep(1), timeout=0.05)
+        assert False, "expected timeout"
+    except TimeoutError:
+        pass
+    
+    bridge.stop()
+    assert not bridge.running
+    logger.info("✓ Async Bridge Test: 32 calls on one loop")
+
+
+def test_shelly_minimal_endpoints():
+    """Test Shelly: minimale Endpoints und Status-Projektion"""
+    import asyncio
+    
+    gen1 = ShellyController("10.0.0.26", "shelly_plug")
+    gen2 = ShellyController("10.0.0.27", "shelly_plus_1pm")
+    assert gen1._select_endpoint({'power'})[0] == "/meter/0"
+    assert gen1._select_endpoint({'state'})[0] == "/relay/0"
+    assert gen1._select_endpoint({'state', 'power'})[0] == "/status"
+    assert gen2._select_endpoint({'state', 'power'})[0] == "/rpc/Switch.GetStatus?id=0"
+    assert gen2._select_endpoint(None)[0] == "/rpc/Shelly.GetStatus"
+    
+    requested = []
+    
+    async def fake_request(url, action):
+        requested.append(url)
+        return {"id": 0, "output": True, "apower": 1843.3, "voltage": 231.4}
+    
+    gen2._request = fake_request
+    status = asyncio.run(gen2.get_status(fields=('power',)))
+    assert status == {'online': True, 'power': 1843.3}
+    assert requested == ["http://10.0.0.27/rpc/Switch.GetStatus?id=0"]
+    logger.info(f"✓ Shelly Endpoint Test: {status}")
+
+
+def test_shelly_multi_channel():
+    """Test Mehrkanal-Shelly: ein Request fuer alle Kanaele"""
+    import asyncio
+    
+    pro4pm = ShellyController("10.0.0.40", "shelly_pro_4pm")
+    requested = []
+    
+    async def fake_request(url, action):
+        requested.append(url)
+        return {f"switch:{i}": {"id": i, "output": i % 2 == 0, "apower": 100.0 * i} for i in range(4)}
+    
+    pro4pm._request = fake_request
+    statuses = asyncio.run(pro4pm.get_channel_statuses([0, 1, 3]))
+    
+    assert requested == ["http://10.0.0.40/rpc/Shelly.GetStatus"]
+    assert statuses[0]['state'] == 'on' and statuses[1]['state'] == 'off'
+    assert statuses[3]['power'] == 300.0
+    logger.info(f"✓ Multi-Channel Test: {len(statuses)} channels, {len(requested)} request")
+
+
+def test_controller_registry():
+    """Test Controller-Registry: Dispatch ueber Capabilities, Instanz-Cache pro Device"""
+    from core.controllers.base import CAP_SWITCH, CAP_BATCH_READ
+    from core.controllers.registry import ControllerRegistry, controller_registry
+    
+    plug = DeviceConfig(id="plug", name="Plug", type="shelly_plus_2pm", ip="10.0.0.50", channel=1)
+    first = controller_registry.get(plug)
+    assert isinstance(first, ShellyController) and first.relay_id == 1
+    assert first.supports(CAP_SWITCH) and first.supports(CAP_BATCH_READ)
+    assert controller_registry.get(plug) is first  # wiederverwendet
+    
+    plug.ip = "10.0.0.51"  # geaenderte Verbindungsdaten -> neue Instanz
+    second = controller_registry.get(plug)
+    assert second is not first and second.ip == "10.0.0.51"
+    
+    unknown = DeviceConfig(id="x", name="X", type="modbus_heater", ip="10.0.0.52")
+    assert controller_registry.get(unknown) is None
+    
+    registry = ControllerRegistry()
+    registry.register('modbus_heater', lambda d: ShellyController(d.ip, 'shelly_plug'))
+    assert registry.get(unknown) is not None
+    
+    # Factory, die selbst Controller ueber die Registry holt (kein Deadlock)
+    registry.register('relay_pair', lambda d: registry.get(unknown))
+    pair = DeviceConfig(id="pair", name="Pair", type="relay_pair", ip="10.0.0.53")
+    assert registry.get(pair) is registry.get(unknown)
+    controller_registry.invalidate("plug")
+    logger.info("✓ Controller Registry Test: cached instances, capability dispatch")
+
+
+def test_reconciler():
+    """Test Reconciler: Befehle nur bei Abweichung, Verifikation, Backoff"""
+    import asyncio
+    from core.controllers.base import BaseController, CAP_STATE, CAP_SWITCH
+    from core.controllers.registry import ControllerRegistry
+    from core.integrations.state_cache import DeviceStateCache
+    from core.optimizer.reconciler import Reconciler
+    
+    class FakeRelay(BaseController):
+        capabilities = frozenset({CAP_STATE, CAP_SWITCH})
+        
+        def __init__(self, device):
+            self.state, self.commands, self.broken = 'off', [], device.id == 'broken'
+        
+        async def get_status(self, fields=None):
+            return {'online': True, 'state': self.state}
+        
+        async def turn_on(self):
+            self.commands.append('on')
+            if not self.broken:
+                self.state = 'on'
+            return True
+    
+    registry = ControllerRegistry()
+    registry.register('fake_relay', FakeRelay)
+    devices = {
+        'heater': DeviceConfig(id="heater", name="Heater", type="fake_relay", ip="10.0.0.60"),
+        'broken': DeviceConfig(id="broken", name="Broken", type="fake_relay", ip="10.0.0.61")
+    }
+    reconciler = Reconciler(devices.get, controllers=registry, cache=DeviceStateCache(), base_backoff=60)
+    
+    async def scenario():
+        for device_id in devices:
+            reconciler.observe(device_id, 'off')
+            reconciler.set_desired(device_id, 'on', 'surplus')
+        first = await reconciler.reconcile()
+        reconciler.observe('heater', 'unknown')  # Poll-Fehler: letzter Zustand bleibt
+        second = await reconciler.reconcile()
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    heater, broken = registry.get(devices['heater']), registry.get(devices['broken'])
+    metrics = reconciler.get_metrics()
+    
+    assert first == {'heater': True, 'broken': False}  # broken: Befehl nicht verifiziert
+    assert second == {}  # heater im Soll, broken im Backoff
+    assert heater.commands == ['on'] and broken.commands == ['on']
+    assert metrics['drifting'] == 1 and metrics['drift']['broken']['attempts'] == 1
+    assert metrics['backoff_skips'] == 1 and metrics['in_sync'] == 1
+    
+    # Nicht erreichbar: letzter Zustand gilt nur observed_max_age Sekunden
+    reconciler.targets['heater'].observed_at -= reconciler.observed_max_age + 1
+    assert reconciler.observe('heater', 'unknown') is None
+    assert 'heater' not in reconciler.get_observed() and reconciler.targets['heater'].drifting
+    logger.info(f"✓ Reconciler Test: {metrics['commands_sent']} commands, {metrics['drifting']} drifting")
+
+
+def test_sg_ready_transitions():
+    """Test SG-Ready: sichere Reihenfolge, parallele Relais, Rate-Limit"""
+    import asyncio
+    from core.controllers.sg_ready import SGReadyController, SGReadyMode, plan_transition
+    from core.integrations.state_cache import DeviceStateCache
+    
+    # Hoch: erst Relay1, runter: erst Relay2, unkritisch: parallel
+    assert plan_transition((False, False), (True, True)) == [[(0, True)], [(1, True)]]
+    assert plan_transition((True, True), (False, False)) == [[(1, False)], [(0, False)]]
+    assert plan_transition((None, None), (True, False)) == [[(0, True), (1, False)]]
+    assert plan_transition((True, False), (True, False)) == []
+    
+    relays = [False, False]
+    timeline = []
+    
+    class FakeRelay:
+        ip, channel = None, 0
+        
+        def __init__(self, index):
+            self.index = index
+        
+        async def _set(self, on):
+            await asyncio.sleep(0.01)
+            relays[self.index] = on
+            timeline.append(tuple(relays))
+            return True
+        
+        async def turn_on(self):
+            return await self._set(True)
+        
+        async def turn_off(self):
+            return await self._set(False)
+        
+        async def get_state(self):
+            await asyncio.sleep(0.01)
+            return 'on' if relays[self.index] else 'off'
+    
+    sg = SGReadyController(FakeRelay(0), FakeRelay(1), min_mode_interval=600, cache=DeviceStateCache())
+    
+    async def scenario():
+        forced = await sg.set_mode(SGReadyMode.FORCED)
+        limited = await sg.turn_off()  # innerhalb min_mode_interval
+        locked = await sg.evu_lock()   # EVU-Sperre ignoriert das Rate-Limit
+        return forced, limited, locked, await sg.get_current_mode()
+    
+    forced, limited, locked, mode = asyncio.run(scenario())
+    assert forced and not limited and locked
+    assert mode == SGReadyMode.OFF and relays == [False, False]
+    assert (False, True) not in timeline
+    assert sg.hold_remaining() > 0
+    
+    # Aufloesung ueber die Registry: virtuelles Device ohne IP, Relais-Controller
+    # werden in der Factory ueber dieselbe Registry geholt
+    import threading
+    from core.controllers.registry import ControllerRegistry
+    from core.main import EMSOptimizer
+    
+    devices = {
+        'heatpump': DeviceConfig(id="heatpump", name="Waermepumpe", type="sg_ready", ip=""),
+        'relay1': DeviceConfig(id="relay1", name="SG 1", type="shelly_plus_2pm", ip="10.0.0.70", channel=0),
+        'relay2': DeviceConfig(id="relay2", name="SG 2", type="shelly_plus_2pm", ip="10.0.0.70", channel=1),
+    }
+    
+    class Devices:
+        get_device = staticmethod(devices.get)
+    
+    # Wie main: sg_ready.enabled registriert die Factory an der Registry des Optimizers
+    registry = ControllerRegistry()
+    registry.register('shelly_*', lambda d: ShellyController(d.ip, d.type, d.channel))
+    cache = DeviceStateCache()
+    optimizer = EMSOptimizer(Devices(), None, device_states=cache, controllers=registry, settings={
+        'grid': {}, 'sg_ready': {'enabled': True, 'relay1_id': 'relay1', 'relay2_id': 'relay2'}
+    })
+    
+    resolved = []
+    worker = threading.Thread(target=lambda: resolved.append(registry.get(devices['heatpump'])), daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    assert not worker.is_alive(), "registry deadlocked"
+    heatpump = resolved[0]
+    assert isinstance(heatpump, SGReadyController) and registry.get(devices['heatpump']) is heatpump
+    assert heatpump.relay1 is registry.get(devices['relay1'])
+    assert heatpump.relay2.channel == 1
+    assert registry.get(DeviceConfig(id="plug", name="Plug", type="shelly_plug", ip="")) is None
+    
+    # Virtuelles Device schreibt keinen State-Cache-Eintrag (Kollision mit Relais)
+    assert optimizer._record_status(devices['heatpump'], {'state': 'on'}) == 'on'
+    assert cache.entries == {}
+    logger.info(f"✓ SG-Ready Test: {len(timeline)} relay ops, no invalid state")
+
+
+def test_shelly_websocket_ingestion():
+    """Test Outbound-WebSocket: Fake-Shelly verbindet sich und pusht Status"""
+    import asyncio
+    import json
+    import aiohttp
+    from core.integrations.state_cache import DeviceStateCache
+    from core.integrations.shelly_ws import ShellyWebSocketServer
+    
+    cache = DeviceStateCache()
+    server = ShellyWebSocketServer(cache=cache, host="127.0.0.1", port=0)
+    
+    async def wait_for(check):
+        for _ in range(100):
+            if check():
+                return True
+            await asyncio.sleep(0.01)
+        return False
+    
+    async def scenario():
+        await server.start()
+        url = f"http://127.0.0.1:{server.port}/shelly"
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(url) as ws:
+                await ws.send_str(json.dumps({
+                    "src": "shellyplusplugs-fcb467a6d9c4", "dst": "ems", "method": "NotifyFullStatus",
+                    "params": {"ts": 1769549441.0, "switch:0": {"id": 0, "output": False, "apower": 0.0}}
+                }))
+                assert await wait_for(lambda: cache.get("127.0.0.1", 0))
+                await ws.send_str(json.dumps({
+                    "src": "shellyplusplugs-fcb467a6d9c4", "dst": "ems", "method": "NotifyStatus",
+                    "params": {"ts": 1769549442.0, "switch:0": {"id": 0, "output": True}}
+                }))
+                await ws.send_str(json.dumps({
+                    "src": "shellyplusplugs-fcb467a6d9c4", "dst": "ems", "method": "NotifyStatus",
+                    "params": {"ts": 1769549443.0, "switch:0": {"id": 0, "apower": 1843.3}}
+                }))
+                assert await wait_for(lambda: cache.get("127.0.0.1", 0)['power'] == 1843.3)
+                live = cache.get("127.0.0.1", 0, max_age=0)  # frisch durch offene Verbindung
+                clients = server.get_clients()
+            assert await wait_for(lambda: not server.get_clients())
+        stale = cache.get("127.0.0.1", 0, max_age=0)
+        await server.stop()
+        return live, clients, stale
+    
+    live, clients, stale = asyncio.run(scenario())
+    assert live['state'] == 'on' and live['power'] == 1843.3 and live['source'] == 'ws'
+    assert clients["127.0.0.1"]['src'] == "shellyplusplugs-fcb467a6d9c4"
+    assert stale is None  # nach Disconnect wieder auf Polling angewiesen
+    logger.info(f"✓ Shelly WebSocket Test: {live}")
+
+
+def test_coiot_replay():
+    """Test CoIoT: aufgezeichnete Status-Pakete ueber Loopback abspielen"""
+    import asyncio
+    import socket
+    from core.integrations.state_cache import DeviceStateCache
+    from core.integrations.coiot import CoIoTListener
+    
+    # Shelly Plug S (CoIoT v2) und Shelly 2.5 (CoIoT v1): CoAP NON 0.30, Uri-Path /cit/s
+    plug_s = bytes.fromhex(
+        "501e6f83b36369740173ed0bec035348504c472d53233641314232432332ff"
+    ) + b'{"G":[[0,9103,1],[0,1101,1],[0,4101,1843.27],[0,4103,68711],[0,3104,41.3]]}'
+    shelly_25 = bytes.fromhex("501e0001b36369740173ff") + \
+        b'{"G":[[0,111,0],[0,112,0],[0,121,512.4],[0,122,1],[0,211,48.2]]}'
+    
+    cache = DeviceStateCache()
+    listener = CoIoTListener(cache=cache, host="127.0.0.1", port=0, group=None)
+    
+    async def scenario():
+        await listener.start()
+        for source_ip, packet in (("127.0.0.2", plug_s), ("127.0.0.3", shelly_25), ("127.0.0.3", b"\xff\x00")):
+            sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sender.bind((source_ip, 0))
+            sender.sendto(packet, ("127.0.0.1", listener.port))
+            sender.close()
+        for _ in range(100):
+            if listener.packets + listener.invalid_packets >= 3:
+                break
+            await asyncio.sleep(0.01)
+        listener.stop()
+    
+    asyncio.run(scenario())
+    
+    plug = cache.get("127.0.0.2", 0, max_age=60)
+    assert plug['state'] == 'on' and plug['power'] == 1843.27 and plug['source'] == 'coiot'
+    assert cache.get("127.0.0.3", 0)['state'] == 'off'
+    assert cache.get("127.0.0.3", 1)['power'] == 512.4
+    assert listener.packets == 2 and listener.invalid_packets == 1
+    assert listener.get_devices()["127.0.0.2"]['device_id'] == "SHPLG-S#6A1B2C#2"
+    
+    # Sender gilt fuer connected_ttl als push-verbunden (Reconciler verifiziert per Push)
+    assert cache.is_connected("127.0.0.2") and cache.is_connected("127.0.0.3")
+    assert cache.get_stats()['push_connected'] == 2
+    cache.connected_until["127.0.0.2"] -= listener.connected_ttl + 1  # kein Paket mehr
+    assert not cache.is_connected("127.0.0.2")
+    assert cache.get_stats()['push_connected'] == 1
+    logger.info(f"✓ CoIoT Replay Test: {listener.get_devices()}")
+
+
+
+def test_modbus_proxy(tmp_path):
+    """Test Modbus-Proxy: Wechselrichter einmal lesen, mehrere Leser bedienen"""
+    import asyncio
+    from flask import Flask
+    from pymodbus.client import AsyncModbusTcpClient
+    from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSequentialDataBlock
+    from pymodbus.server import ModbusTcpServer
+    from core.integrations.modbus_proxy import ModbusProxy
+    
+    registers = [0] * 0xC0
+    registers[0x96], registers[0xB8] = 65536 - 1500, 77  # Battery -1500W, SOC 77%
+    inverter_requests = []
+    
+    async def scenario():
+        inverter = ModbusTcpServer(
+            ModbusServerContext(slaves={1: ModbusSlaveContext(
+                hr=ModbusSequentialDataBlock(0, registers), zero_mode=True)}, single=False),
+            address=("127.0.0.1", 0),
+            request_tracer=lambda request, *addr: inverter_requests.append(request.function_code)
+        )
+        await inverter.transport_listen()
+        inverter_port = inverter.transport.sockets[0].getsockname()[1]
+        
+        proxy = ModbusProxy([{'name': 'solax', 'ip': '127.0.0.1', 'port': inverter_port,
+                              'unit_id': 1, 'blocks': [[0, 0xC0]]}], host="127.0.0.1", port=0)
+        await proxy.start()
+        
+        stale_client = AsyncModbusTcpClient("127.0.0.1", port=proxy.port)
+        await stale_client.connect()
+        stale = await stale_client.read_holding_registers(0x96, 1, slave=1)  # noch kein Poll
+        stale_client.close()
+        
+        polled = await proxy.poll(proxy.upstreams[0])
+        values = []
+        for _ in range(3):  # drei Leser
+            client = AsyncModbusTcpClient("127.0.0.1", port=proxy.port)
+            await client.connect()
+            values.append((await client.read_holding_registers(0x96, 1, slave=1)).registers[0])
+            client.close()
+        
+        cached_soc = proxy.get_registers('127.0.0.1', inverter_port, 1, 0xB8)
+        stats = proxy.get_stats()
+        await proxy.stop()
+        await inverter.shutdown()
+        return stale, polled, values, cached_soc, stats
+    
+    stale, polled, values, cached_soc, stats = asyncio.run(scenario())
+    
+    assert stale.isError() and polled
+    assert values == [65536 - 1500] * 3 and cached_soc == [77]
+    assert len(inverter_requests) == 2  # 0xC0 Register = 2 Block-Reads, unabhaengig von der Leserzahl
+    assert stats['clients']['127.0.0.1']['requests'] == 4 and stats['clients']['127.0.0.1']['stale'] == 1
+    
+    # Statistik des EMS-Prozesses in der Web UI (ueber den Health-Export)
+    from webui.api_routes import api, init_api
+    health_file = tmp_path / "device_health.json"
+    app = Flask(__name__)
+    init_api(None, None, health_export=str(health_file))
+    app.register_blueprint(api)
+    client = app.test_client()
+    assert client.get('/api/modbus-proxy').status_code == 404  # kein Export
+    HealthRegistry().export(health_file, {'modbus_proxy': lambda: stats})
+    data = client.get('/api/modbus-proxy').get_json()
+    assert data['proxy']['clients']['127.0.0.1']['requests'] == 4
+    assert data['proxy']['upstreams'][0]['polls'] == 1
+    logger.info(f"✓ Modbus Proxy Test: {len(values)} readers, {len(inverter_requests)} inverter reads")
+
+
+def test_solax_snapshot(tmp_path):
+    """Test Solax-Snapshot: PV/Grid/Battery/Haus aus einem Durchgang"""
+    import asyncio
+    from pymodbus.datastore import ModbusServerContext, ModbusSlaveContext, ModbusSequentialDataBlock
+    from pymodbus.server import ModbusTcpServer
+    from core.energy_sources import (EnergySourcesManager, EnergySource, SourceType,
+                                     SourceProvider, plan_register_reads, SOLAX_REGISTERS)
+    
+    input_regs, holding_regs = [0] * 0x50, [0] * 0xC0
+    input_regs[0x0A], input_regs[0x0B] = 2500, 1500            # PV 4000W
+    input_regs[0x46], input_regs[0x47] = 65536 - 1200, 0xFFFF   # int32 -1200 -> 1200W Netzbezug
+    holding_regs[0x96], holding_regs[0xB8] = 65536 - 800, 64    # Battery entlaedt 800W, SOC 64%
+    inverter_requests = []
+    
+    assert len(plan_register_reads(SOLAX_REGISTERS.values())) == 2  # ein Input-, ein Holding-Block
+    
+    async def scenario():
+        inverter = ModbusTcpServer(
+            ModbusServerContext(slaves={1: ModbusSlaveContext(
+                ir=ModbusSequentialDataBlock(0, input_regs),
+                hr=ModbusSequentialDataBlock(0, holding_regs), zero_mode=True)}, single=False),
+            address=("127.0.0.1", 0),
+            request_tracer=lambda request, *addr: inverter_requests.append(request.function_code)
+        )
+        await inverter.transport_listen()
+        port = inverter.transport.sockets[0].getsockname()[1]
+        
+        manager = EnergySourcesManager(config_file=str(tmp_path / "energy_sources.json"))
+        config = {'ip': '127.0.0.1', 'port': port, 'unit_id': 1}
+        for source_type in SourceType:
+            manager.sources[source_type.value] = EnergySource(
+                id=source_type.value, name="Solax", type=source_type,
+                provider=SourceProvider.SOLAX_MODBUS, config=dict(config)
+            )
+        await manager.update_all_sources()
+        # Grid Guard parallel zum Zyklus: wartet auf den laufenden Read, nutzt dessen Snapshot
+        manager.solax_snapshots.clear()
+        guard_reads = await asyncio.gather(manager.update_all_sources(),
+                                           *(manager.read_grid_power(max_age=1.0) for _ in range(3)))
+        connections = len(inverter.active_connections)
+        assert guard_reads[1:] == [1200] * 3 and connections == 1  # eine persistente Verbindung
+        manager.close()
+        
+        # Proxy pollt den Wechselrichter: nur dessen Cache, veraltet -> keine eigene Verbindung
+        from core.integrations.modbus_proxy import ModbusProxy
+        manager.modbus_proxy = ModbusProxy([{'name': 'solax', 'ip': '127.0.0.1', 'port': port,
+                                             'blocks': [[0, 0x50, 'input'], [0, 0xC0]]}])
+        manager.solax_snapshots.clear()
+        assert await manager.read_solax_snapshot(config) is None and not manager.modbus_clients
+        assert await manager.modbus_proxy.poll(manager.modbus_proxy.upstreams[0])
+        assert (await manager.read_solax_snapshot(config))['grid_power'] == 1200 and not manager.modbus_clients
+        manager.modbus_proxy.upstreams[0].client.close()
+        await inverter.shutdown()
+        return manager.get_current_data()
+    
+    data = asyncio.run(scenario())
+    
+    assert data['pv_power'] == 4000 and data['grid_power'] == 1200
+    assert data['battery_power'] == -800 and data['battery_soc'] == 64
+    assert data['house_consumption'] == 4000 + 800 + 1200
+    assert sorted(inverter_requests) == [3, 3, 3, 3, 4, 4, 4]  # 2 Zyklen a 2 Reads + Proxy-Poll (3), Guard ohne eigene
+    logger.info(f"✓ Solax Snapshot Test: {len(inverter_requests)} reads for 4 sources")
+
+
+def test_calculated_sources(tmp_path):
+    """Test CALCULATED: sichere Ausdruecke, Abhaengigkeits-Graph, Neuberechnung nur bei Aenderung"""
+    import asyncio
+    from core.utils.expressions import compile_expression, ExpressionGraph, ExpressionError
+    from core.energy_sources import EnergySourcesManager, EnergySource, SourceType, SourceProvider
+    
+    for unsafe in ("__import__('os').system('true')", "pv.__class__", "[1, 2]", "lambda: 1", "min", "min(pv)",
+                   "1" * 400):
+        try:
+            compile_expression(unsafe)
+            assert False, unsafe
+        except ExpressionError:
+            pass
+    
+    expression = compile_expression("clamp(pv - battery + grid, 0, 5000)")
+    assert expression.variables == ('pv', 'battery', 'grid')
+    assert expression({'pv': 4000, 'battery': -800, 'grid': 1200}) == 5000
+    assert expression({'pv': 4000, 'battery': -800}) is None  # fehlender Eingang
+    
+    # Kompiliert, aber zur Laufzeit ungueltig -> None statt Exception
+    assert compile_expression("round(pv, grid)")({'pv': 1234.567, 'grid': 0.5}) is None
+    assert compile_expression("round(pv, grid)")({'pv': 1234.567, 'grid': 1}) == 1234.6
+    assert compile_expression("(99999**8)**8")({}) is None
+    assert compile_expression("pv ** 0.5")({'pv': -4}) is None  # komplexes Ergebnis
+    assert compile_expression("max(pv, 0)")({'pv': -3}) == 0
+    
+    graph = ExpressionGraph()
+    graph.add('total', "a + b")
+    graph.add('a', "x * 2")
+    graph.add('b', "max(x, 10)")
+    assert graph.order().index('total') == 2
+    graph.evaluate({'x': 3})
+    graph.evaluate({'x': 3})
+    assert graph.evaluate({'x': 3})['total'] == 16 and graph.evaluations == 3
+    graph.add('a', "total + 1")
+    try:
+        graph.order()
+        assert False
+    except ExpressionError as e:
+        assert e.cycle == ['a', 'total']
+    
+    chained = ExpressionGraph()
+    for name, text in (('a', "b"), ('b', "a"), ('c', "a + 1")):
+        chained.add(name, text)
+    try:
+        chained.order()
+        assert False
+    except ExpressionError as e:
+        assert e.cycle == ['a', 'b']  # c haengt nur vom Zyklus ab
+    
+    manager = EnergySourcesManager(config_file=str(tmp_path / "energy_sources.json"))
+    manager.sources['phase_sum'] = EnergySource(
+        id='phase_sum', name="Netz (Phasen)", type=SourceType.GRID_POWER,
+        provider=SourceProvider.CALCULATED,
+        config={'expression': "grid_phase_a + grid_phase_b + grid_phase_c"}
+    )
+    manager.sources['self_use'] = EnergySource(
+        id='self_use', name="Eigenverbrauch", type=SourceType.HOUSE_CONSUMPTION,
+        provider=SourceProvider.CALCULATED, config={'expression': "max(0, pv + battery_soc * 0)"}
+    )
+    manager.sources['loop'] = EnergySource(
+        id='loop', name="Zyklus", type=SourceType.PV_GENERATION,
+        provider=SourceProvider.CALCULATED, config={'expression': "house + 1"}
+    )
+    manager.sources['after_loop'] = EnergySource(
+        id='after_loop', name="Nach Zyklus", type=SourceType.BATTERY,
+        provider=SourceProvider.CALCULATED, config={'expression': "loop * 2"}
+    )
+    manager.sources['battery_soc'] = EnergySource(
+        id='battery_soc', name="Verdeckt Eingang", type=SourceType.BATTERY,
+        provider=SourceProvider.CALCULATED, config={'expression': "50"}
+    )
+    asyncio.run(manager.update_all_sources())
+    data = manager.get_current_data()
+    
+    house = manager.calculations.nodes['house']
+    manager.calculations.nodes['house'] = object()  # Auswertung wirft: Zyklus laeuft trotzdem durch
+    asyncio.run(manager.update_all_sources())
+    assert manager.get_current_data()['house_consumption'] == 0
+    manager.calculations.nodes['house'] = house
+    
+    assert 'loop' not in manager.calculations.nodes  # zyklische Quelle verworfen
+    assert 'after_loop' in manager.calculations.nodes  # nur abhaengig: bleibt (Wert None)
+    assert 'battery_soc' not in manager.calculations.nodes  # Eingang ist reserviert
+    assert data['grid_power'] == 0 and data['house_consumption'] == 0 and data['pv_power'] == 0
+    assert manager.get_calculation_graph() is manager.calculations  # nicht neu kompiliert
+    derived = manager.calculations.evaluate({'grid_phase_a': -900, 'grid_phase_b': 200, 'grid_phase_c': 100,
+                                             'battery': 0, 'battery_soc': 50})
+    assert derived['grid'] == -600 and derived['available'] == 600
+    logger.info(f"✓ Calculated Sources Test: order {manager.calculations.order()}")
+
+
+def test_network_discovery():
+    """Test Discovery: Connect-Probes, /shelly-Fingerprint, Modbus-Probe, Streaming"""
+    import asyncio
+    import time
+    from aiohttp import web
+    from core.integrations.discovery import DeviceDiscovery, classify_shelly
+    from core.integrations.modbus_proxy import ModbusProxy
+    
+    assert classify_shelly({'gen': 2, 'app': 'Pro4PM', 'model': 'SPSW-104PE16EU'})['channels'] == 4
+    assert classify_shelly({'type': 'SHSW-25', 'num_outputs': 2})['type'] == 'shelly_25'
+    
+    answers = {
+        '127.0.0.2': {'gen': 2, 'app': 'Plus1PM', 'model': 'SNSW-001P16EU', 'id': 'shellyplus1pm-a1', 'mac': 'A1'},
+        '127.0.0.3': {'type': 'SHPLG-S', 'mac': 'B2', 'num_outputs': 1},
+    }
+    
+    async def shelly(request):
+        return web.json_response(answers[request.transport.get_extra_info('sockname')[0]])
+    
+    async def scenario():
+        app = web.Application()
+        app.router.add_get('/shelly', shelly)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        first = web.TCPSite(runner, '127.0.0.2', 0)
+        await first.start()
+        http_port = runner.addresses[0][1]
+        await web.TCPSite(runner, '127.0.0.3', http_port).start()
+        
+        inverter = ModbusProxy([{'name': 'solax', 'ip': '127.0.0.9', 'blocks': [[0, 7]]}], host='127.0.0.4', port=0)
+        await inverter.start()
+        inverter.update(1, 0, [ord(a) << 8 | ord(b) for a, b in zip("SX123456789XYZ"[::2], "SX123456789XYZ"[1::2])])
+        inverter.upstreams[0].updated = time.monotonic()
+        
+        discovery = DeviceDiscovery(connect_timeout=0.3, http_port=http_port, modbus_port=inverter.port)
+        started = time.perf_counter()
+        streamed = []
+        async for device in discovery.scan('127.0.0.0/29'):
+            streamed.append((device, time.perf_counter() - started))
+        duration = time.perf_counter() - started
+        
+        await inverter.stop()
+        await runner.cleanup()
+        return discovery, streamed, duration
+    
+    discovery, streamed, duration = asyncio.run(scenario())
+    found = {d['ip']: d for d, _ in streamed}
+    
+    assert found['127.0.0.2']['type'] == 'shelly_plus_1pm' and found['127.0.0.2']['generation'] == 2
+    assert found['127.0.0.3']['type'] == 'shelly_plug' and found['127.0.0.3']['generation'] == 1
+    assert found['127.0.0.4']['type'] == 'solax' and found['127.0.0.4']['serial'] == 'SX123456789XYZ'
+    assert len(streamed) == 3 and discovery.get_discovered() == [d for d, _ in streamed]
+    assert discovery.last_scan['hosts'] == 6 and duration < 3
+    try:
+        discovery.scan_network('10.0.0.0/8')
+        assert False
+    except ValueError:
+        pass
+    
+    # Viele offene Hosts: Fingerprint und Modbus-Probe ebenfalls begrenzt
+    bounded = DeviceDiscovery(concurrency=3)
+    active, peak = [0], [0]
+    
+    async def open_port(ip, port, semaphore):
+        return True
+    
+    async def slow_probe(ip):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.01)
+        active[0] -= 1
+        return None
+    
+    async def slow_modbus(ip):
+        await slow_probe(ip)
+        return []
+    
+    bounded.probe_port, bounded.fingerprint_shelly, bounded.probe_modbus = open_port, slow_probe, slow_modbus
+    assert bounded.scan_network('10.9.0.0/27') == [] and peak[0] == 3
+    logger.info(f"✓ Discovery Test: {len(streamed)} devices in {duration:.2f}s")
+
+
+def test_mdns_fingerprints(tmp_path):
+    """Test mDNS: Announcement parsen, Fingerprint-Cache, IP-Wechsel -> device_mapping"""
+    import asyncio
+    import socket
+    import struct
+    from core.device_manager import DeviceManager
+    from core.integrations.mdns import MdnsListener, parse_dns, TYPE_A, TYPE_PTR, TYPE_SRV, TYPE_TXT
+    
+    def name(text):
+        return b''.join(bytes([len(label)]) + label.encode() for label in text.split('.')) + b'\x00'
+    
+    def announcement(ip):
+        instance, host = "shellyplus2pm-a8032ab12345._shelly._tcp.local", "shellyplus2pm-a8032ab12345.local"
+        txt = b''.join(bytes([len(e)]) + e for e in (b"gen=2", b"app=Plus2PM", b"ver=1.1.0"))
+        records = [
+            (name("_shelly._tcp.local"), TYPE_PTR, name(instance)),
+            (name(instance), TYPE_SRV, struct.pack('!HHH', 0, 0, 80) + name(host)),
+            (name(instance), TYPE_TXT, txt),
+            (name(host), TYPE_A, socket.inet_aton(ip)),
+        ]
+        packet = struct.pack('!6H', 0, 0x8400, 0, len(records), 0, 0)
+        for owner, rtype, rdata in records:
+            packet += owner + struct.pack('!HHIH', rtype, 1, 120, len(rdata)) + rdata
+        return packet
+    
+    assert parse_dns(b'\x00\x01garbage') is None
+    
+    manager = DeviceManager(devices_file=str(tmp_path / "devices.yaml"), mapping_file=str(tmp_path / "map.json"))
+    for channel in (0, 1):
+        manager.add_device(DeviceConfig(id=f"boiler_{channel}", name=f"Boiler {channel}", type="shelly_plus_2pm",
+                                        ip="10.0.0.50", channel=channel))
+    cache_file = str(tmp_path / "fingerprints.json")
+    webui = DeviceManager(devices_file=str(tmp_path / "devices.yaml"), mapping_file=str(tmp_path / "map.json"))
+    
+    async def scenario():
+        listener = MdnsListener(manager, cache_file=cache_file, host="127.0.0.1", port=0, group=None)
+        await listener.start()
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sender.sendto(announcement("10.0.0.50"), ("127.0.0.1", listener.port))
+        await asyncio.sleep(0.1)
+        sender.sendto(announcement("10.0.0.77"), ("127.0.0.1", listener.port))  # DHCP-Wechsel
+        await asyncio.sleep(0.1)
+        sender.close()
+        listener.stop()
+        return listener
+    
+    listener = asyncio.run(scenario())
+    fingerprint = listener.fingerprints['A8032AB12345']
+    
+    assert (fingerprint.type, fingerprint.generation, fingerprint.firmware) == ('shelly_plus_2pm', 2, '1.1.0')
+    assert fingerprint.ip == '10.0.0.77' and fingerprint.device_id in ('boiler_0', 'boiler_1')
+    assert listener.stats['ip_changes'] == 1
+    assert [manager.get_device(f"boiler_{c}").ip for c in (0, 1)] == ['10.0.0.77'] * 2
+    assert '10.0.0.50' not in manager.device_mapping and '10.0.0.77' in manager.device_mapping
+    
+    reloaded = MdnsListener(cache_file=cache_file)  # Cache ueberlebt Neustart
+    assert reloaded.lookup('10.0.0.77').mac == 'A8032AB12345'
+    
+    # Web UI (veralteter Stand) aendert ein anderes Feld - der IP-Wechsel bleibt erhalten
+    reloaded_diffs = []
+    webui.reload_listeners.append(reloaded_diffs.append)
+    assert webui.update_device('boiler_1', {'room': 'Keller'})
+    assert reloaded_diffs and reloaded_diffs[0].changed == ['boiler_0', 'boiler_1']
+    fresh = DeviceManager(devices_file=str(tmp_path / "devices.yaml"), mapping_file=str(tmp_path / "map.json"))
+    assert [fresh.get_device(f"boiler_{c}").ip for c in (0, 1)] == ['10.0.0.77'] * 2
+    assert fresh.get_device('boiler_1').room == 'Keller' and '10.0.0.77' in fresh.device_mapping
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['devices.yaml', 'fingerprints.json', 'map.json']
+    logger.info(f"✓ mDNS Test: {fingerprint.model} moved to {fingerprint.ip}")
+
+
+def test_resolver_cache(monkeypatch):
+    """Test Resolver: TTL, Single-Flight, negative Eintraege, Refresh im Hintergrund, Pinning"""
+    import asyncio
+    import socket
+    from aiohttp import web
+    from core.utils.http import get_session, close_session
+    from core.utils.resolver import HostResolver, ResolveError, host_resolver
+    
+    zone = {'ha.local': '10.0.0.5'}
+    calls = []
+    
+    async def fake_getaddrinfo(self, host, port, **kwargs):
+        calls.append(host)
+        await asyncio.sleep(0.05)  # langsamer mDNS-Lookup
+        if host not in zone:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (zone[host], 0))]
+    
+    monkeypatch.setattr(asyncio.base_events.BaseEventLoop, 'getaddrinfo', fake_getaddrinfo)
+    resolver = HostResolver(ttl=0.5, negative_ttl=5, refresh_ahead=0.5, pinned={'inverter.local': '10.0.0.100'})
+    
+    async def scenario():
+        first = await asyncio.gather(*(resolver.resolve_host('HA.local') for _ in range(5)))
+        cached = await resolver.resolve_host('ha.local')
+        await asyncio.sleep(0.3)  # letzte Haelfte der TTL -> Refresh im Hintergrund
+        zone['ha.local'] = '10.0.0.6'
+        before_refresh = await resolver.resolve_host('ha.local')
+        await asyncio.sleep(0.1)
+        after_refresh = await resolver.resolve_host('ha.local')
+        
+        errors = 0
+        for _ in range(3):
+            try:
+                await resolver.resolve_host('missing.local')
+            except ResolveError:
+                errors += 1
+        
+        del zone['ha.local']
+        resolver.entries['ha.local'].expires = 0  # abgelaufen, Aufloesung schlaegt fehl
+        stale = await resolver.resolve_host('ha.local')
+        pinned = await resolver.resolve_host('inverter.local')
+        literal = await resolver.resolve_host('10.0.0.7')
+        return first, cached, before_refresh, after_refresh, errors, stale, pinned, literal
+    
+    first, cached, before_refresh, after_refresh, errors, stale, pinned, literal = asyncio.run(scenario())
+    
+    assert first == ['10.0.0.5'] * 5 and cached == '10.0.0.5'
+    assert before_refresh == '10.0.0.5' and after_refresh == '10.0.0.6'
+    assert errors == 3 and calls.count('missing.local') == 1
+    assert stale == '10.0.0.6' and pinned == '10.0.0.100' and literal == '10.0.0.7'
+    assert calls == ['ha.local', 'ha.local', 'missing.local', 'ha.local']
+    stats = resolver.get_stats()
+    assert stats['negative_hits'] == 2 and stats['stale_served'] == 1 and stats['hosts']['ha.local']['resolutions'] == 3
+    
+    # Abgebrochener Aufrufer bricht den gemeinsamen Lookup nicht ab
+    zone['wallbox.local'] = '10.0.0.8'
+    
+    async def cancelled_scenario():
+        impatient = asyncio.create_task(resolver.resolve_host('wallbox.local'))
+        patient = asyncio.create_task(resolver.resolve_host('wallbox.local'))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient, impatient.cancelled()
+    
+    assert asyncio.run(cancelled_scenario()) == ('10.0.0.8', True)
+    assert calls.count('wallbox.local') == 1
+    
+    # HTTP-Clients loesen ueber den Cache auf
+    async def api_root(request):
+        return web.json_response({'message': 'API running.'})
+    
+    async def http_scenario():
+        app = web.Application()
+        app.router.add_get('/api/', api_root)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, '127.0.0.1', 0).start()
+        port = runner.addresses[0][1]
+        host_resolver.pin('homeassistant.local', '127.0.0.1')
+        try:
+            async with get_session().get(f"http://homeassistant.local:{port}/api/") as response:
+                data = await response.json()
+        finally:
+            host_resolver.unpin('homeassistant.local')
+            await close_session()
+            await runner.cleanup()
+        return data
+    
+    assert asyncio.run(http_scenario())['message'] == 'API running.'
+    assert 'homeassistant.local' not in calls
+    logger.info(f"✓ Resolver Test: {stats['hits']}/{stats['lookups']} hits, {len(calls)} lookups")
+
+
+def test_device_store_transactions(tmp_path):
+    """Test Device Store: ein Commit pro Import, Rollback, atomares Schreiben, SQLite-Backend"""
+    from core.config_reload import ConfigReloader
+    from core.device_manager import DeviceManager
+    from core.device_store import SqliteDeviceStore, YamlDeviceStore, open_device_store
+    
+    discovered = [{'type': 'shelly_plug', 'ip': f"10.0.1.{i}", 'name': f"Plug {i}"} for i in range(200)]
+    manager = DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    
+    assert manager.import_discovered_devices(discovered) == 200
+    assert manager.store.commits == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['devices.yaml', 'mapping.json']  # keine Temp-Dateien
+    
+    try:
+        with manager.transaction():
+            manager.remove_device('shelly_plug_10_0_1_0')
+            manager.update_device('shelly_plug_10_0_1_1', {'ip': '10.0.9.1'})
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    assert manager.store.commits == 1 and 'shelly_plug_10_0_1_0' in manager.devices
+    assert manager.get_device('shelly_plug_10_0_1_1').ip == '10.0.1.1'
+    
+    manager.update_device('shelly_plug_10_0_1_1', {'power': 2000})  # ausserhalb: sofort geschrieben
+    assert manager.store.commits == 2
+    assert DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json")).get_device(
+        'shelly_plug_10_0_1_1').power == 2000
+    
+    # SQLite: einmalige Migration aus YAML, danach nur geaenderte Zeilen
+    store = open_device_store({'backend': 'sqlite', 'sqlite_file': str(tmp_path / "devices.db")},
+                              str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    assert isinstance(store, SqliteDeviceStore)
+    sqlite_manager = DeviceManager(store=store)
+    assert len(sqlite_manager.devices) == 200 and len(sqlite_manager.device_mapping) == 200
+    with sqlite_manager.transaction():
+        sqlite_manager.remove_device('shelly_plug_10_0_1_2')
+        sqlite_manager.update_device('shelly_plug_10_0_1_3', {'room': 'Keller'})
+    reloaded = DeviceManager(store=SqliteDeviceStore(str(tmp_path / "devices.db"), seed=YamlDeviceStore(
+        str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))))
+    assert len(reloaded.devices) == 199 and reloaded.get_device('shelly_plug_10_0_1_3').room == 'Keller'
+    assert '10.0.1.2' not in reloaded.device_mapping
+    
+    # Leere Datenbank nach der Migration ist ein gueltiger Stand (kein erneuter Import)
+    with reloaded.transaction():
+        for device_id in list(reloaded.devices):
+            reloaded.remove_device(device_id)
+    restarted = DeviceManager(store=SqliteDeviceStore(str(tmp_path / "devices.db"), seed=YamlDeviceStore(
+        str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))))
+    assert len(restarted.devices) == 0 and not restarted.reload_devices()
+    
+    # Hot Reload: fehlendes WAL (letzte Verbindung geschlossen) ist kein fehlender Store
+    wal_file = tmp_path / "devices.db-wal"
+    assert not wal_file.exists()
+    diffs = ConfigReloader(sqlite_manager, use_inotify=False).reload([wal_file])
+    assert len(diffs['devices'].removed) == 199 and len(sqlite_manager.devices) == 0
+    logger.info(f"✓ Device Store Test: 200 devices imported with {manager.store.commits - 1} commit")
+
+
+def test_device_indexes(tmp_path):
+    """Test Device-Indizes: inkrementelle Pflege, Filter, Teilstring-Suche, Statistik"""
+    from core.device_manager import DeviceManager
+    
+    manager = DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    with manager.transaction():
+        for i in range(30):
+            manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Heizstab {i}" if i % 3 == 0 else f"Pumpe {i}",
+                                            type='shelly_plug' if i % 2 else 'shelly_plus_1pm',
+                                            ip=f"10.0.2.{i}", power=100, category='heating' if i % 3 == 0 else '',
+                                            enabled=i % 5 != 0))
+    
+    def linear(query):
+        return [d.id for d in manager.devices.values()
+                if any(query.lower() in v.lower() for v in (d.name, d.ip, d.type, d.id))]
+    
+    for query in ('heiz', 'HEIZSTAB 1', '10.0.2.1', 'plus', 'p', '', 'dev_2', 'xyz', 'stab 2'):
+        assert [d.id for d in manager.search_devices(query)] == linear(query), query
+    
+    assert [d.id for d in manager.filter_devices(type='shelly_plug', category='heating', enabled=True)] == \
+        ['dev_3', 'dev_9', 'dev_21', 'dev_27']
+    
+    manager.update_device('dev_3', {'name': 'Wallbox', 'category': 'ev_charging', 'power': 11000})
+    manager.remove_device('dev_9')
+    assert manager.search_devices('heizstab 3') == [] and linear('heizstab 3') == []  # umbenannt
+    assert [d.id for d in manager.search_devices('wallbox')] == ['dev_3']
+    assert [d.id for d in manager.get_devices_by_category('heating')] == ['dev_0', 'dev_6', 'dev_12', 'dev_15',
+                                                                         'dev_18', 'dev_21', 'dev_24', 'dev_27']
+    stats = manager.get_statistics()
+    assert stats['total_devices'] == 29 and stats['total_power'] == 28 * 100 + 11000
+    assert stats['by_category'] == {'heating': 8, 'ev_charging': 1} and stats['enabled_devices'] == 29 - 6
+    assert stats['by_type'] == {'shelly_plus_1pm': 15, 'shelly_plug': 14}
+    
+    reloaded = DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    assert reloaded.get_statistics() == stats  # Index nach Laden neu aufgebaut
+    logger.info(f"✓ Device Index Test: {len(manager.index.grams)} trigrams")
+
+def test_config_snapshot(tmp_path):
+    """Test Config-Snapshot: Cache-Treffer, Neu-Parsen nach Aenderung, touch ohne Aenderung"""
+    import json
+    import os
+    from core.utils.config_snapshot import ConfigSnapshot, StartupTimer
+    from core.utils.settings import load_settings
+    from core.device_manager import DeviceManager
+    from core.device_store import YamlDeviceStore
+    from core.energy_sources import EnergySourcesManager
+    
+    (tmp_path / "settings.yaml").write_text("optimization_interval: 10\n")
+    (tmp_path / "sources.json").write_text(json.dumps({'sources': [
+        {'id': 'grid', 'name': 'Netz', 'type': 'grid_power', 'provider': 'shelly', 'config': {'ip': '10.0.3.9'}}]}))
+    DeviceManager(store=YamlDeviceStore(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))) \
+        .add_device(DeviceConfig(id='plug_1', name='Plug', type='shelly_plug', ip='10.0.3.1'))
+    
+    def start():
+        snapshot = ConfigSnapshot(str(tmp_path / "snapshot.pickle"))
+        settings = load_settings(str(tmp_path / "settings.yaml"), snapshot=snapshot)
+        manager = DeviceManager(store=YamlDeviceStore(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"),
+                                                      snapshot=snapshot))
+        energy = EnergySourcesManager(str(tmp_path / "sources.json"), snapshot=snapshot)
+        snapshot.save()
+        return snapshot, settings, manager, energy
+    
+    snapshot, settings, manager, energy = start()
+    assert snapshot.stats == {'hits': 0, 'parsed': 4} and settings['optimization_interval'] == 10
+    assert list(manager.devices) == ['plug_1'] and list(energy.sources) == ['grid']
+    
+    snapshot, settings, manager, energy = start()
+    assert snapshot.stats == {'hits': 4, 'parsed': 0}
+    assert manager.get_device('plug_1').ip == '10.0.3.1' and manager.device_mapping == {'10.0.3.1': 'plug_1'}
+    
+    (tmp_path / "settings.yaml").write_text("optimization_interval: 20\n")
+    stat = (tmp_path / "sources.json").stat()
+    os.utime(tmp_path / "sources.json", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))  # touch
+    snapshot, settings, manager, energy = start()
+    assert snapshot.stats == {'hits': 3, 'parsed': 1} and settings['optimization_interval'] == 20
+    
+    (tmp_path / "sources.json").write_text(json.dumps({'sources': [{'id': 'broken'}]}))
+    snapshot, settings, manager, energy = start()
+    assert energy.sources == {}  # Validierung schlaegt fehl, kein Snapshot-Eintrag
+    
+    # Schreibfehler: alter Snapshot bleibt, keine Temp-Dateien
+    saved = (tmp_path / "snapshot.pickle").read_bytes()
+    snapshot.entries['broken'] = (None, None, lambda: None)  # nicht picklebar
+    snapshot._dirty = True
+    snapshot.save()
+    assert (tmp_path / "snapshot.pickle").read_bytes() == saved
+    assert not [p.name for p in tmp_path.iterdir() if p.name.endswith('.tmp')]
+    
+    timer = StartupTimer()
+    timer.mark('settings')
+    report = timer.report(snapshot)
+    assert list(report['phases']) == ['settings'] and report['total_ms'] >= 0
+    logger.info("✓ Config Snapshot Test: unchanged files served from snapshot")
+
+def test_cached_models(tmp_path):
+    """Test Slotted Models: gecachte JSON-Fragmente, Invalidierung bei Aenderung, API-Antworten"""
+    import json
+    from dataclasses import asdict
+    from flask import Flask
+    from core.device_manager import DeviceManager
+    from core.energy_sources import EnergySource, SourceType, SourceProvider
+    from core.models.cached import dumps_envelope
+    from webui.api_routes import api, init_api
+    
+    manager = DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    with manager.transaction():
+        for i in range(5):
+            manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Plug {i}", type='shelly_plug', ip=f"10.0.4.{i}"))
+    device = manager.get_device('dev_1')
+    assert not hasattr(device, '__dict__')
+    assert json.loads(device.to_json()) == asdict(device) == device.to_dict()
+    fragment, version = device.to_json(), device.version
+    assert device.to_json() is fragment  # gecacht
+    
+    manager.update_device('dev_1', {'name': 'Heizstab', 'version': 99})
+    updated = manager.get_device('dev_1')
+    assert updated.version > version and json.loads(updated.to_json())['name'] == 'Heizstab'
+    
+    source = EnergySource(id='pv', name='PV', type=SourceType.PV_GENERATION, provider=SourceProvider.SHELLY,
+                          config={'ip': '10.0.4.9'})
+    assert not hasattr(source, '__dict__') and source.enabled is True  # Defaults trotz __slots__
+    assert json.loads(source.to_json())['type'] == 'pv_generation'
+    source.last_value = 1234.5
+    assert json.loads(source.to_json())['last_value'] == 1234.5
+    source.config['ip'] = '10.0.4.10'
+    source.touch()
+    assert json.loads(source.to_json())['config'] == {'ip': '10.0.4.10'}
+    assert json.loads(dumps_envelope('sources', [source])) == {'success': True, 'count': 1,
+                                                               'sources': [source.to_dict()]}
+    
+    app = Flask(__name__)
+    init_api(manager, None)
+    app.register_blueprint(api)
+    client = app.test_client()
+    data = client.get('/api/devices').get_json()
+    assert data['count'] == 5 and data['devices'] == [asdict(d) for d in manager.get_all_devices()]
+    assert client.put('/api/devices/dev_2', json={'room': 'Bad'}).get_json()['device']['room'] == 'Bad'
+    assert [d['id'] for d in client.get('/api/devices/filter?room=Bad').get_json()['devices']] == ['dev_2']
+    assert client.get('/api/devices/search?q=heiz').get_json()['results'][0]['id'] == 'dev_1'
+    export = client.get('/api/devices/export').get_json()['data']
+    assert export['count'] == 5 and export['mapping']['10.0.4.2'] == 'dev_2' and len(export['devices']) == 5
+    logger.info("✓ Cached Models Test: list endpoints served from JSON fragments")
+
+def test_registry_snapshots(tmp_path):
+    """Test Copy-on-Write-Registry: unveraenderliche Snapshots, Transaktionen, parallele Leser"""
+    import threading
+    from core.device_manager import DeviceManager
+    from core.models.registry import VersionedRegistry
+    
+    registry = VersionedRegistry({'a': 1})
+    before = registry.snapshot()
+    registry['b'] = 2
+    del registry['a']
+    assert before.version == 0 and dict(before.items) == {'a': 1}  # alter Stand unveraendert
+    assert registry.version > before.version and registry == {'b': 2}
+    published = registry.version
+    try:
+        with registry.batch():
+            registry['c'] = 3
+            assert 'c' in registry  # eigene offene Aenderung sichtbar
+            raise ValueError
+    except ValueError:
+        pass
+    assert registry.version == published and 'c' not in registry
+    
+    class MemoryStore:
+        backend = 'memory'
+        commits = 0
+        
+        def load(self):
+            return [], {}
+        
+        def commit(self, devices, mapping, changed=(), removed=()):
+            self.commits += 1
+    
+    manager = DeviceManager(store=MemoryStore())
+    version = manager.devices.version
+    with manager.transaction():
+        for i in range(50):
+            manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Plug {i}", type='shelly_plug', ip=f"10.0.5.{i}"))
+    changes = manager.devices.snapshot().changes
+    assert manager.devices.version > version
+    assert len(changes) == 50 and {v for v, _ in changes} == {manager.devices.version}  # ein Snapshot pro Transaktion
+    
+    old = manager.get_device('dev_3')
+    manager.update_device('dev_3', {'power': 1500})
+    assert old.power == 0 and manager.get_device('dev_3').power == 1500  # Copy-on-Write
+    
+    errors = []
+    stop = threading.Event()
+    
+    def reader():
+        try:
+            while not stop.is_set():
+                snapshot = manager.devices.snapshot()
+                assert len(list(snapshot.items.values())) == len(snapshot.items)
+                for device in manager.devices.values():
+                    assert device.id
+                manager.search_devices('plug 1')
+                manager.filter_devices(type='shelly_plug', enabled=True)
+                manager.get_statistics()
+        except Exception as e:
+            errors.append(e)
+    
+    def writer(offset):
+        for i in range(60):
+            device_id = f"w{offset}_{i}"
+            manager.add_device(DeviceConfig(id=device_id, name=f"Neu {i}", type='shelly_plug',
+                                            ip=f"10.{offset}.6.{i}"))
+            manager.update_device(device_id, {'room': 'Keller'})
+            if i % 2:
+                manager.remove_device(device_id)
+    
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(2)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    
+    assert not errors, errors
+    assert len(manager.devices) == 50 + 2 * 30 and len(manager.index) == len(manager.devices)
+    assert sorted(manager.device_mapping.values()) == sorted(manager.devices)
+    logger.info(f"✓ Registry Snapshot Test: version {manager.devices.version}")
+
+
+def test_hot_reload(tmp_path):
+    """Test Hot Reload: inotify/Polling, Diff gegen das Live-Modell, ungueltige Dateien"""
+    import asyncio
+    import json
+    from dataclasses import replace
+    from core.config_reload import ConfigReloader
+    from core.device_manager import DeviceManager
+    from core.energy_sources import EnergySourcesManager, EnergySource, SourceType, SourceProvider
+    
+    devices_file, mapping_file = str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json")
+    sources_file, schedules_file = tmp_path / "sources.json", tmp_path / "schedules.json"
+    sources = [{'id': 'grid', 'name': 'Netz', 'type': 'grid_power', 'provider': 'shelly', 'config': {'ip': '10.0.7.9'}},
+               {'id': 'pv', 'name': 'PV', 'type': 'pv_generation', 'provider': 'shelly', 'config': {'ip': '10.0.7.8'}}]
+    sources_file.write_text(json.dumps({'sources': sources}))
+    schedules_file.write_text(json.dumps({'boiler': {'device_id': 'boiler', 'schedule': {}, 'enabled': True}}))
+    
+    manager = DeviceManager(devices_file, mapping_file)
+    with manager.transaction():
+        for i in range(3):
+            manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Plug {i}", type='shelly_plug', ip=f"10.0.7.{i}"))
+    energy = EnergySourcesManager(str(sources_file))
+    energy.sources['grid'] = replace(energy.sources['grid'], last_value=-450.0)
+    scheduler = Scheduler(str(schedules_file))
+    untouched = manager.get_device('dev_0')
+    
+    device_diffs = []
+    reloader = ConfigReloader(manager, energy, scheduler, on_devices_changed=device_diffs.append, debounce=0.05)
+    
+    async def wait_for(condition):
+        for _ in range(100):
+            if condition():
+                return True
+            await asyncio.sleep(0.05)
+        return False
+    
+    async def scenario():
+        task = asyncio.create_task(reloader.run())
+        await asyncio.sleep(0.1)
+        
+        # Zweiter Prozess (Web UI) aendert den Store
+        other = DeviceManager(devices_file, mapping_file)
+        with other.transaction():
+            other.add_device(DeviceConfig(id='wallbox', name='Wallbox', type='shelly_pro_3em', ip='10.0.7.20'))
+            other.update_device('dev_1', {'ip': '10.0.7.11'})
+            other.remove_device('dev_2')
+        assert await wait_for(lambda: device_diffs)
+        
+        sources[0]['name'] = 'Netzanschluss'
+        del sources[1]
+        sources_file.write_text(json.dumps({'sources': sources}))
+        assert await wait_for(lambda: 'energy_sources' in reloader.last_diffs)
+        
+        schedules_file.write_text('{"boiler": ')  # halb geschrieben
+        assert await wait_for(lambda: reloader.stats['errors'] == 1)
+        schedules_file.write_text(json.dumps({'boiler': {'device_id': 'boiler', 'schedule': {}, 'enabled': False}}))
+        assert await wait_for(lambda: 'schedules' in reloader.last_diffs)
+        
+        reloader.stop()
+        await task
+    
+    asyncio.run(scenario())
+    
+    assert reloader.watcher.backend == 'inotify'
+    diff = device_diffs[0]
+    assert (diff.added, diff.removed, diff.changed) == (['wallbox'], ['dev_2'], ['dev_1'])
+    assert manager.get_device('dev_0') is untouched  # unveraendert -> gleiches Objekt
+    assert manager.get_device_by_ip('10.0.7.11').id == 'dev_1' and '10.0.7.1' not in manager.device_mapping
+    assert manager.search_devices('wallbox')[0].id == 'wallbox'
+    assert list(energy.sources) == ['grid'] and energy.sources['grid'].name == 'Netzanschluss'
+    assert energy.sources['grid'].last_value == -450.0  # Messwert bleibt erhalten
+    assert scheduler.schedules['boiler']['enabled'] is False and reloader.last_diffs['schedules'].changed == ['boiler']
+    
+    # Polling-Fallback (ohne inotify)
+    polling = ConfigReloader(energy_manager=energy, use_inotify=False, interval=0.05)
+    sources_file.write_text(json.dumps({'sources': []}))
+    assert polling.watcher.check() == [sources_file.absolute()]
+    polling.reload(polling.watcher.check() or [sources_file])
+    assert len(energy.sources) == 0
+    
+    # Messzyklen schreiben die Datei nicht, Hand-Edits werden nicht ueberschrieben
+    before = sources_file.read_text()
+    asyncio.run(energy.update_all_sources())
+    assert sources_file.read_text() == before
+    sources_file.write_text(json.dumps({'sources': sources}))  # Hand-Edit, noch nicht geladen
+    assert not energy.save_sources() and json.loads(sources_file.read_text())['sources'] == sources
+    energy.add_source(EnergySource(id='pv2', name='PV Garage', type=SourceType.PV_GENERATION,
+                                   provider=SourceProvider.SHELLY_3EM, config={'ip': '10.0.7.30'}))
+    assert [s['id'] for s in json.loads(sources_file.read_text())['sources']] == ['grid', 'pv2']
+    logger.info(f"✓ Hot Reload Test: {reloader.stats}")
+
+
+def test_change_feed(tmp_path):
+    """Test Change-Feed: Deltas seit einer Version, kompletter Stand wenn zu alt"""
+    import json
+    from flask import Flask
+    from core.device_manager import DeviceManager
+    from core.energy_sources import EnergySourcesManager
+    from webui import api_energy
+    from webui.api_routes import api, init_api
+    
+    sources_file = tmp_path / "sources.json"
+    sources_file.write_text(json.dumps({'sources': [
+        {'id': 'grid', 'name': 'Netz', 'type': 'grid_power', 'provider': 'shelly', 'config': {'ip': '10.0.8.9'}}]}))
+    manager = DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    energy = EnergySourcesManager(str(sources_file))
+    with manager.transaction():
+        for i in range(4):
+            manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Plug {i}", type='shelly_plug', ip=f"10.0.8.{i}"))
+    
+    app = Flask(__name__)
+    init_api(manager, None)
+    api_energy.init_energy_api(energy)
+    app.register_blueprint(api)
+    client = app.test_client()
+    
+    try:
+        first = client.get('/api/changes').get_json()
+        assert first['devices']['full'] and len(first['devices']['changed']) == 4
+        assert [s['id'] for s in first['sources']['changed']] == ['grid']
+        since, epoch = first['version'], first['epoch']
+        
+        # Keine Aenderung -> leeres Delta
+        empty = client.get(f'/api/changes?since={since}&epoch={epoch}').get_json()
+        assert not empty['devices']['full'] and empty['devices']['changed'] == [] and empty['sources']['changed'] == []
+        
+        manager.update_device('dev_1', {'room': 'Keller'})
+        manager.remove_device('dev_3')
+        energy.update_source('grid', name='Netzanschluss')
+        delta = client.get(f'/api/changes?since={since}&epoch={epoch}').get_json()
+        assert not delta['devices']['full'] and delta['version'] > since
+        assert [(d['id'], d['room']) for d in delta['devices']['changed']] == [('dev_1', 'Keller')]
+        assert delta['devices']['removed'] == ['dev_3']
+        assert delta['sources']['changed'][0]['name'] == 'Netzanschluss'
+        
+        # Folgeabruf mit neuer Version, mehrfach geaendertes Geraet nur einmal
+        since = delta['version']
+        for room in ('Flur', 'Bad'):
+            manager.update_device('dev_0', {'room': room})
+        delta = client.get(f'/api/changes?since={since}&epoch={epoch}').get_json()
+        assert [(d['id'], d['room']) for d in delta['devices']['changed']] == [('dev_0', 'Bad')]
+        assert delta['sources']['changed'] == []
+        
+        # Client zu weit zurueck (Protokoll uebergelaufen) bzw. andere Epoche -> kompletter Stand
+        manager.devices.history = 2
+        for i in range(3):
+            manager.update_device('dev_2', {'notes': str(i)})
+        assert manager.changes_since(since).full and len(manager.changes_since(since).changed) == 3
+        assert not manager.changes_since(manager.version - 1).full
+        restarted = client.get(f'/api/changes?since={delta["version"]}&epoch=old').get_json()
+        assert restarted['devices']['full'] and restarted['sources']['full']
+    finally:
+        api_energy.init_energy_api(None)
+    logger.info(f"✓ Change Feed Test: version {manager.version}")
+
+def test_state_sweep(tmp_path):
+    """Test State-Sweep: Push-Werte aus dem Cache, gepollte Devices jeden Zyklus"""
+    import asyncio
+    from core.controllers.base import CAP_STATE
+    from core.integrations.state_cache import DeviceStateCache
+    from core.main import EMSOptimizer
+    
+    class FakeController:
+        def __init__(self, ip):
+            self.unit_key = ip
+            self.reads = 0
+        
+        def supports(self, capability):
+            return capability == CAP_STATE
+        
+        async def get_status(self, fields=()):
+            self.reads += 1
+            return {'state': 'on', 'power': 100}
+    
+    class FakeControllers:
+        def __init__(self):
+            self.by_ip = {}
+        
+        def get(self, device):
+            return self.by_ip.setdefault(device.ip, FakeController(device.ip))
+    
+    devices = [DeviceConfig(id='pushed', name='WS', type='shelly_plug', ip='10.0.9.1'),
+               DeviceConfig(id='polled', name='Gen1', type='shelly_plug', ip='10.0.9.2')]
+    
+    class Devices:
+        def get_device(self, device_id):
+            return next(d for d in devices if d.id == device_id)
+    
+    cache = DeviceStateCache()
+    controllers = FakeControllers()
+    optimizer = EMSOptimizer(Devices(), None, cycle_interval=30, power_profiles=PowerProfileManager(),
+                             settings={'grid': {}}, device_states=cache, controllers=controllers)
+    cache.update('10.0.9.1', state='off', power=0, source='websocket')
+    
+    states = asyncio.run(optimizer.sweep_device_states(devices))
+    assert states == {'pushed': 'off', 'polled': 'on'} and controllers.by_ip['10.0.9.2'].reads == 1
+    asyncio.run(optimizer.sweep_device_states(devices))  # gleicher Zyklus (z.B. vorgezogen)
+    assert controllers.by_ip['10.0.9.2'].reads == 1
+    
+    for entry in cache.entries.values():
+        entry['updated'] -= 31  # naechster Zyklus
+    asyncio.run(optimizer.sweep_device_states(devices))
+    assert controllers.by_ip['10.0.9.2'].reads == 2  # Poll-Wert aus dem Vorzyklus gilt nicht
+    assert controllers.by_ip['10.0.9.1'].reads == 0  # Push-Wert bis 2 Zyklen gueltig
+    logger.info(f"✓ State Sweep Test: {states}")
+
+def test_health_export(tmp_path):
+    """Test Health-Export: Circuit-Status des EMS-Prozesses in der Web UI, Solax-Fehler gezaehlt"""
+    import asyncio
+    import json
+    from flask import Flask
+    from core.device_manager import DeviceManager
+    from core.energy_sources import EnergySourcesManager
+    from core.utils.health import health_registry, read_health_export
+    from webui.api_routes import api, init_api
+    
+    ems_registry = HealthRegistry(failure_threshold=3)  # Registry des EMS-Prozesses
+    for _ in range(3):
+        ems_registry.get('10.0.10.1').record_failure("TimeoutError")
+    ems_registry.get('10.0.10.2').record_success(0.02)
+    health_file = tmp_path / "device_health.json"
+    ems_registry.export(health_file)
+    
+    manager = DeviceManager(str(tmp_path / "devices.yaml"), str(tmp_path / "mapping.json"))
+    for i in (1, 2):
+        manager.add_device(DeviceConfig(id=f"dev_{i}", name=f"Plug {i}", type='shelly_plug', ip=f"10.0.10.{i}"))
+    app = Flask(__name__)
+    init_api(manager, None, health_export=str(health_file))
+    app.register_blueprint(api)
+    
+    try:
+        data = app.test_client().get('/api/devices/health').get_json()
+        by_id = {d['device_id']: d['health'] for d in data['devices']}
+        assert by_id['dev_1']['state'] == 'open' and by_id['dev_1']['source'] == 'ems-core'
+        assert by_id['dev_2']['total_requests'] == 1 and data['export_age'] < 5
+        
+        stale = json.loads(health_file.read_text())
+        stale['updated'] -= 3600
+        health_file.write_text(json.dumps(stale))
+        assert read_health_export(health_file) is None
+    finally:
+        init_api(manager, None)
+    
+    # Unvollstaendige Solax-Antwort zaehlt als Fehler des Endpoints
+    energy = EnergySourcesManager(str(tmp_path / "energy_sources.json"))
+    
+    async def short_read(ip, port, unit_id, blocks, timeout):
+        return {}
+    
+    energy._read_modbus_blocks = short_read
+    assert asyncio.run(energy.read_solax_snapshot({'ip': '10.0.10.9', 'port': 1502})) is None
+    assert health_registry.get('10.0.10.9:1502').total_failures == 1
+    
+    async def implausible_read(ip, port, unit_id, blocks, timeout):
+        raw = {(kind, start + i): 0 for kind, start, count in blocks for i in range(count)}
+        raw[('holding', 0xB8)] = 250  # SOC 250 %
+        return raw
+    
+    energy._read_modbus_blocks = implausible_read
+    assert asyncio.run(energy.read_solax_snapshot({'ip': '10.0.10.9', 'port': 1502})) is None
+    assert health_registry.get('10.0.10.9:1502').total_failures == 2
+    health_registry.endpoints.pop('10.0.10.9:1502', None)
+    
+    # Refresh der Web UI: Werte aus dem Export des EMS statt eigener Modbus-Verbindung
+    from dataclasses import replace
+    from core.energy_sources import EnergySource, SourceType, SourceProvider
+    from webui.api_energy import api_energy, init_energy_api
+    
+    energy.add_source(EnergySource(id='grid', name="Netz", type=SourceType.GRID_POWER,
+                                   provider=SourceProvider.SHELLY_3EM, config={'ip': '10.0.10.3'}))
+    energy._publish_values({'grid': (energy.sources['grid'], replace(
+        energy.sources['grid'], last_value=-1200.0, last_update='2026-01-01T12:00:00'))})
+    energy.current_data['grid_power'] = -1200.0
+    ems_file = tmp_path / "ems_export.json"
+    HealthRegistry().export(ems_file, {'energy': energy.export_state})
+    
+    webui_energy = EnergySourcesManager(str(tmp_path / "energy_sources.json"))
+    local_reads = []
+    
+    async def update_all_sources():
+        local_reads.append(True)
+    
+    webui_energy.update_all_sources = update_all_sources
+    app = Flask(__name__)
+    init_energy_api(webui_energy, health_export=str(ems_file))
+    app.register_blueprint(api_energy)
+    client = app.test_client()
+    
+    refreshed = client.post('/api/energy/refresh').get_json()
+    assert refreshed['source'] == 'ems-core' and refreshed['data']['grid_power'] == -1200.0
+    assert webui_energy.sources['grid'].last_value == -1200.0 and not local_reads
+    
+    ems_file.unlink()  # EMS laeuft nicht -> selbst lesen
+    assert client.post('/api/energy/refresh').get_json()['source'] == 'webui' and local_reads
+    logger.info(f"✓ Health Export Test: {len(data['endpoints'])} endpoints")
+
 if __name__ == "__main__":
     logger.info("="*70)
     logger.info("EMS-Core v2.0 - Quick Test")
@@ -1,40 +1,33 @@
 """
 EMS-Core v2.0 - Energy Sources API
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 import logging
 
+from core.models.cached import dumps_envelope
+from core.utils.async_bridge import run_sync
+from core.utils.health import read_health_export
+
 logger = logging.getLogger(__name__)
 
 api_energy = Blueprint('api_energy', __name__, url_prefix='/api/energy')
 energy_manager = None
+ems_export = None  # Export des EMS-Prozesses (haelt die Modbus-Verbindung)
 
-def init_energy_api(manager):
-    global energy_manager
+def init_energy_api(manager, health_export=None):
+    global energy_manager, ems_export
     energy_manager = manager
+    ems_export = health_export or 'config/.device_health.json'
 
 def source_to_dict(source):
     """Convert EnergySource to dict with Enums as strings"""
-    return {
-        'id': source.id,
-        'name': source.name,
-        'type': source.type.value,
-        'provider': source.provider.value,
-        'config': source.config,
-        'enabled': source.enabled,
-        'last_value': source.last_value,
-        'last_update': source.last_update
-    }
+    return source.to_dict()
 
 @api_energy.route('/sources', methods=['GET'])
 def get_sources():
     try:
-        sources = [source_to_dict(s) for s in energy_manager.sources.values()]
-        return jsonify({
-            'success': True,
-            'sources': sources,
-            'count': len(sources)
-        })
+        body = dumps_envelope('sources', list(energy_manager.sources.values()))
+        return Response(body, mimetype='application/json')
     except Exception as e:
         logger.error(f"Failed to get sources: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -45,9 +38,17 @@ def add_source():
         from core.energy_sources import EnergySource, SourceType, SourceProvider
         import time
         
+        from core.utils.expressions import compile_expression, ExpressionError
+        
         data = request.get_json()
         source_id = f"{data['type']}_{int(time.time())}"
         
+        if data['provider'] == SourceProvider.CALCULATED.value:
+            try:
+                compile_expression(data['config'].get('expression', ''))
+            except ExpressionError as e:
+                return jsonify({'success': False, 'error': f'Invalid expression: {e}'}), 400
+        
         source = EnergySource(
             id=source_id,
             name=data['name'],
@@ -79,10 +80,9 @@ def delete_source(source_id):
 def toggle_source(source_id):
     try:
         data = request.get_json()
-        source = energy_manager.sources.get(source_id)
+        source = energy_manager.update_source(source_id, enabled=data.get('enabled', True))
         
         if source:
-            source.enabled = data.get('enabled', True)
             return jsonify({'success': True})
         return jsonify({'success': False, 'error': 'Not found'}), 404
     except Exception as e:
@@ -97,14 +97,31 @@ def get_current():
 
 @api_energy.route('/refresh', methods=['POST'])
 def refresh():
+    """
+    Aktuelle Messwerte holen
+    
+    Laeuft das EMS, kommen die Werte aus dessen Export - der Wechselrichter
+    hat oft nur einen Modbus-Slot, den das EMS dauerhaft belegt. Nur ohne
+    EMS liest die Web UI selbst und gibt die Verbindungen danach wieder frei.
+    """
     try:
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(energy_manager.update_all_sources())
+        export = read_health_export(ems_export)
+        if export and 'energy' in export:
+            energy_manager.apply_state(export['energy'])
+            source = 'ems-core'
+        else:
+            async def read_locally():
+                try:
+                    await energy_manager.update_all_sources()
+                finally:
+                    energy_manager.close()
+            
+            run_sync(read_locally(), timeout=60)
+            source = 'webui'
         
         return jsonify({
             'success': True,
+            'source': source,
             'data': energy_manager.get_current_data()
         })
     except Exception as e:
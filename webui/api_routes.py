@@ -2,13 +2,20 @@
 EMS-Core v2.0 - Web UI API Routes
 REST API fuer Device Management + Control
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import asyncio
+import json
 import logging
-from dataclasses import asdict
-
+from typing import Optional
 from core.device_manager import DeviceManager, DeviceConfig
 from core.integrations.discovery import DeviceDiscovery
-from core.controllers.shelly import get_status_sync, turn_on_sync, turn_off_sync, get_power_sync
+from core.controllers.base import CAP_STATE, CAP_POWER, CAP_SWITCH
+from core.controllers.registry import controller_registry
+from core.controllers.shelly import SYNC_TIMEOUT
+from core.models.cached import dumps_envelope, dumps_list
+from core.models.registry import EPOCH, published_version
+from core.utils.async_bridge import run_sync
+from core.utils.health import health_registry, read_health_export
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +25,15 @@ api = Blueprint('api', __name__, url_prefix='/api')
 # Global Manager (wird von app.py initialisiert)
 device_manager = None
 device_discovery = None
+health_file = None  # Export des EMS-Prozesses (pollt die Geraete)
 
 
-def init_api(manager: DeviceManager, discovery: DeviceDiscovery):
+def init_api(manager: DeviceManager, discovery: DeviceDiscovery, health_export: Optional[str] = None):
     """Initialisiere API mit Manager-Instanzen"""
-    global device_manager, device_discovery
+    global device_manager, device_discovery, health_file
     device_manager = manager
     device_discovery = discovery
+    health_file = health_export or 'config/.device_health.json'
 
 
 # ============================================================================
@@ -36,11 +45,7 @@ def get_devices():
     """Hole alle Geraete"""
     try:
         devices = device_manager.get_all_devices()
-        return jsonify({
-            'success': True,
-            'devices': [asdict(d) for d in devices],
-            'count': len(devices)
-        })
+        return Response(dumps_envelope('devices', devices), mimetype='application/json')
     except Exception as e:
         logger.error(f"Failed to get devices: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -54,7 +59,7 @@ def get_device(device_id):
         if device:
             return jsonify({
                 'success': True,
-                'device': asdict(device)
+                'device': device.to_dict()
             })
         else:
             return jsonify({'success': False, 'error': 'Device not found'}), 404
@@ -84,7 +89,7 @@ def add_device():
             return jsonify({
                 'success': True,
                 'message': 'Device added successfully',
-                'device': asdict(device)
+                'device': device.to_dict()
             })
         else:
             return jsonify({'success': False, 'error': 'Failed to add device'}), 500
@@ -107,7 +112,7 @@ def update_device(device_id):
             return jsonify({
                 'success': True,
                 'message': 'Device updated successfully',
-                'device': asdict(device)
+                'device': device.to_dict()
             })
         else:
             return jsonify({'success': False, 'error': 'Device not found'}), 404
@@ -124,6 +129,7 @@ def delete_device(device_id):
         success = device_manager.remove_device(device_id)
         
         if success:
+            controller_registry.invalidate(device_id)
             return jsonify({
                 'success': True,
                 'message': 'Device deleted successfully'
@@ -140,6 +146,14 @@ def delete_device(device_id):
 # Device Control Endpoints
 # ============================================================================
 
+def _get_controller(device: DeviceConfig, capability: str):
+    """Controller aus der Registry (None wenn Typ/Faehigkeit nicht unterstuetzt)"""
+    controller = controller_registry.get(device)
+    if controller is None or not controller.supports(capability):
+        return None
+    return controller
+
+
 @api.route('/devices/<device_id>/control', methods=['POST'])
 def control_device(device_id):
     """Steuere Geraet (ON/OFF/TOGGLE)"""
@@ -154,39 +168,37 @@ def control_device(device_id):
         if not device.can_control:
             return jsonify({'success': False, 'error': 'Device not controllable'}), 400
         
-        # Pruefe Device-Typ und rufe entsprechenden Controller auf
-        if 'shelly' in device.type:
-            ip = device.connection_params.get('ip')
-            if not ip:
-                return jsonify({'success': False, 'error': 'No IP address configured'}), 400
-            
-            # Fuehre Control-Aktion aus
-            if action == 'on':
-                success = turn_on_sync(ip, device.type)
-            elif action == 'off':
-                success = turn_off_sync(ip, device.type)
-            elif action == 'toggle':
-                # Toggle: erst Status holen, dann umschalten
-                status = get_status_sync(ip, device.type)
-                if status and status.get('state') == 'on':
-                    success = turn_off_sync(ip, device.type)
-                else:
-                    success = turn_on_sync(ip, device.type)
-            else:
-                return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 400
-            
-            if success:
-                return jsonify({
-                    'success': True,
-                    'message': f'Device {device_id} turned {action}',
-                    'device_id': device_id,
-                    'action': action
-                })
+        if not device.ip:
+            return jsonify({'success': False, 'error': 'No IP address configured'}), 400
+        
+        controller = _get_controller(device, CAP_SWITCH)
+        if controller is None:
+            return jsonify({'success': False, 'error': f'Control not implemented for device type: {device.type}'}), 501
+        
+        # Fuehre Control-Aktion aus
+        if action == 'on':
+            success = run_sync(controller.turn_on(), timeout=SYNC_TIMEOUT)
+        elif action == 'off':
+            success = run_sync(controller.turn_off(), timeout=SYNC_TIMEOUT)
+        elif action == 'toggle':
+            # Toggle: erst Status holen, dann umschalten
+            state = run_sync(controller.get_state(), timeout=SYNC_TIMEOUT)
+            if state == 'on':
+                success = run_sync(controller.turn_off(), timeout=SYNC_TIMEOUT)
             else:
-                return jsonify({'success': False, 'error': f'Failed to execute {action}'}), 500
+                success = run_sync(controller.turn_on(), timeout=SYNC_TIMEOUT)
+        else:
+            return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 400
         
+        if success:
+            return jsonify({
+                'success': True,
+                'message': f'Device {device_id} turned {action}',
+                'device_id': device_id,
+                'action': action
+            })
         else:
-            return jsonify({'success': False, 'error': f'Control not implemented for device type: {device.type}'}), 501
+            return jsonify({'success': False, 'error': f'Failed to execute {action}'}), 500
         
     except Exception as e:
         logger.error(f"Control failed: {e}")
@@ -201,32 +213,30 @@ def device_status(device_id):
         if not device:
             return jsonify({'success': False, 'error': 'Device not found'}), 404
         
-        # Pruefe Device-Typ und rufe entsprechenden Controller auf
-        if 'shelly' in device.type:
-            ip = device.connection_params.get('ip')
-            if not ip:
-                return jsonify({'success': False, 'error': 'No IP address configured'}), 400
-            
-            status = get_status_sync(ip, device.type)
-            
-            if status:
-                return jsonify({
-                    'success': True,
-                    'device_id': device_id,
-                    'status': status
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to read device status'
-                }), 500
+        if not device.ip:
+            return jsonify({'success': False, 'error': 'No IP address configured'}), 400
         
-        else:
+        controller = _get_controller(device, CAP_STATE)
+        if controller is None:
             return jsonify({
                 'success': False,
                 'error': f'Status reading not implemented for device type: {device.type}'
             }), 501
         
+        status = run_sync(controller.get_status(), timeout=SYNC_TIMEOUT)
+        
+        if status:
+            return jsonify({
+                'success': True,
+                'device_id': device_id,
+                'status': status
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to read device status'
+            }), 500
+        
     except Exception as e:
         logger.error(f"Status failed: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -240,40 +250,38 @@ def device_power(device_id):
         if not device:
             return jsonify({'success': False, 'error': 'Device not found'}), 404
         
-        # Pruefe Device-Typ
-        if 'shelly' in device.type:
-            ip = device.connection_params.get('ip')
-            if not ip:
-                return jsonify({'success': False, 'error': 'No IP address configured'}), 400
-            
-            power = get_power_sync(ip, device.type)
-            
-            if power is not None:
-                return jsonify({
-                    'success': True,
-                    'device_id': device_id,
-                    'power': power,
-                    'unit': 'W'
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to read power'
-                }), 500
+        if not device.ip:
+            return jsonify({'success': False, 'error': 'No IP address configured'}), 400
         
-        else:
+        controller = _get_controller(device, CAP_POWER)
+        if controller is None:
             return jsonify({
                 'success': False,
                 'error': f'Power reading not implemented for device type: {device.type}'
             }), 501
         
+        power = run_sync(controller.get_power(), timeout=SYNC_TIMEOUT)
+        
+        if power is not None:
+            return jsonify({
+                'success': True,
+                'device_id': device_id,
+                'power': power,
+                'unit': 'W'
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to read power'
+            }), 500
+        
     except Exception as e:
         logger.error(f"Power reading failed: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @api.route('/devices/control/batch', methods=['POST'])
-def control_devices_batch(device_id):
+def control_devices_batch():
     """Steuere mehrere Geraete gleichzeitig"""
     try:
         data = request.get_json()
@@ -283,41 +291,51 @@ def control_devices_batch(device_id):
         if not device_ids:
             return jsonify({'success': False, 'error': 'No device IDs provided'}), 400
         
+        if action not in ('on', 'off'):
+            return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 400
+        
         results = []
         errors = []
+        commands = {}
         
         for device_id in device_ids:
+            device = device_manager.get_device(device_id)
+            if not device:
+                errors.append(f'{device_id}: Not found')
+                continue
+            
+            if not device.can_control:
+                errors.append(f'{device_id}: Not controllable')
+                continue
+            
+            if not device.ip:
+                errors.append(f'{device_id}: No IP configured')
+                continue
+            
+            controller = _get_controller(device, CAP_SWITCH)
+            if controller is None:
+                errors.append(f'{device_id}: Control not implemented for {device.type}')
+                continue
+            
+            commands[device_id] = controller
+        
+        async def execute(device_id, controller):
             try:
-                device = device_manager.get_device(device_id)
-                if not device:
-                    errors.append(f'{device_id}: Not found')
-                    continue
-                
-                if not device.can_control:
-                    errors.append(f'{device_id}: Not controllable')
-                    continue
-                
-                if 'shelly' in device.type:
-                    ip = device.connection_params.get('ip')
-                    if not ip:
-                        errors.append(f'{device_id}: No IP configured')
-                        continue
-                    
-                    if action == 'on':
-                        success = turn_on_sync(ip, device.type)
-                    elif action == 'off':
-                        success = turn_off_sync(ip, device.type)
-                    else:
-                        errors.append(f'{device_id}: Unknown action')
-                        continue
-                    
-                    if success:
-                        results.append(device_id)
-                    else:
-                        errors.append(f'{device_id}: Control failed')
-                
+                return device_id, (await controller.turn_on() if action == 'on' else await controller.turn_off())
             except Exception as e:
-                errors.append(f'{device_id}: {str(e)}')
+                logger.error(f"Batch control {device_id} failed: {e}")
+                return device_id, False
+        
+        async def execute_all():
+            # Alle Geraete parallel ueber den gemeinsamen Event-Loop
+            return await asyncio.gather(*(execute(d, c) for d, c in commands.items()))
+        
+        if commands:
+            for device_id, success in run_sync(execute_all(), timeout=SYNC_TIMEOUT * 2):
+                if success:
+                    results.append(device_id)
+                else:
+                    errors.append(f'{device_id}: Control failed')
         
         return jsonify({
             'success': len(results) > 0,
@@ -354,11 +372,37 @@ def discover_devices():
             'count': len(discovered)
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Discovery failed: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@api.route('/devices/discover/stream', methods=['POST'])
+def discover_devices_stream():
+    """Device Discovery als NDJSON-Stream (eine Zeile pro gefundenem Geraet)"""
+    data = request.get_json(silent=True) or {}
+    network = data.get('network', '10.0.0.0/24')
+    if device_discovery is None:
+        return jsonify({'success': False, 'error': 'Discovery not available'}), 503
+
+    try:
+        devices = device_discovery.stream_network(network)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    def generate():
+        try:
+            for device in devices:
+                yield json.dumps(device) + '\n'
+        except Exception as e:
+            logger.error(f"Discovery stream failed: {e}")
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @api.route('/devices/import', methods=['POST'])
 def import_devices():
     """Importiere entdeckte Geraete"""
@@ -391,11 +435,7 @@ def search_devices():
         
         results = device_manager.search_devices(query)
         
-        return jsonify({
-            'success': True,
-            'results': [asdict(d) for d in results],
-            'count': len(results)
-        })
+        return Response(dumps_envelope('results', results), mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Search failed: {e}")
@@ -406,29 +446,15 @@ def search_devices():
 def filter_devices():
     """Filtere Geraete"""
     try:
-        device_type = request.args.get('type')
-        category = request.args.get('category')
-        priority = request.args.get('priority')
-        enabled = request.args.get('enabled')
-        
-        devices = device_manager.get_all_devices()
+        criteria = {field: request.args.get(field) or None
+                    for field in ('type', 'category', 'priority', 'room')}
+        for flag in ('enabled', 'can_control'):
+            value = request.args.get(flag)
+            criteria[flag] = value.lower() == 'true' if value is not None else None
         
-        # Apply filters
-        if device_type:
-            devices = [d for d in devices if d.type == device_type]
-        if category:
-            devices = [d for d in devices if d.category == category]
-        if priority:
-            devices = [d for d in devices if d.priority == priority]
-        if enabled is not None:
-            enabled_bool = enabled.lower() == 'true'
-            devices = [d for d in devices if d.enabled == enabled_bool]
+        devices = device_manager.filter_devices(**criteria)
         
-        return jsonify({
-            'success': True,
-            'devices': [asdict(d) for d in devices],
-            'count': len(devices)
-        })
+        return Response(dumps_envelope('devices', devices), mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Filter failed: {e}")
@@ -456,25 +482,127 @@ def device_statistics():
 
 
 # ============================================================================
-# Export/Import
+# Device Health
 # ============================================================================
 
-@api.route('/devices/export', methods=['GET'])
-def export_devices():
-    """Exportiere alle Geraete"""
+@api.route('/devices/health', methods=['GET'])
+def device_health():
+    """
+    Hole Erreichbarkeit, Latenzen und Circuit-Breaker-Status aller Geraete
+    
+    Gepollt wird im EMS-Prozess - dessen Export ist massgeblich, eigene
+    Requests der Web UI (Schalten, Status) ergaenzen fehlende Endpoints.
+    """
+    try:
+        export = read_health_export(health_file)
+        endpoints = {h['endpoint']: dict(h, source='webui') for h in health_registry.get_all()}
+        if export:
+            endpoints.update({name: dict(h, source='ems-core') for name, h in export['endpoints'].items()})
+        
+        devices = []
+        for device in device_manager.get_all_devices():
+            devices.append({
+                'device_id': device.id,
+                'name': device.name,
+                'ip': device.ip,
+                'health': endpoints.get(device.ip)
+            })
+        
+        return jsonify({
+            'success': True,
+            'devices': devices,
+            'endpoints': list(endpoints.values()),
+            'export_age': export['age'] if export else None
+        })
+        
+    except Exception as e:
+        logger.error(f"Failed to get device health: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@api.route('/modbus-proxy', methods=['GET'])
+def modbus_proxy_stats():
+    """
+    Hole Statistik des Modbus-Proxys (Upstream-Polls, Requests pro Client)
+    
+    Der Proxy laeuft im EMS-Prozess und liefert seine Statistik ueber den
+    Health-Export.
+    """
     try:
-        export_data = device_manager.export_to_dict()
+        export = read_health_export(health_file)
+        stats = export.get('modbus_proxy') if export else None
+        if stats is None:
+            return jsonify({'success': False, 'error': 'Modbus proxy not running'}), 404
         
         return jsonify({
             'success': True,
-            'data': export_data
+            'proxy': stats,
+            'export_age': export['age']
         })
         
+    except Exception as e:
+        logger.error(f"Failed to get modbus proxy stats: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+# ============================================================================
+# Export/Import
+# ============================================================================
+
+@api.route('/devices/export', methods=['GET'])
+def export_devices():
+    """Exportiere alle Geraete"""
+    try:
+        body = '{"success":true,"data":' + device_manager.export_to_json() + '}'
+        return Response(body, mimetype='application/json')
+        
     except Exception as e:
         logger.error(f"Export failed: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# ============================================================================
+# Change Feed
+# ============================================================================
+
+def _changes_json(changes) -> str:
+    """RegistryChanges als JSON (Eintraege aus den gecachten Fragmenten)"""
+    head = json.dumps({'full': changes.full, 'version': changes.version, 'removed': changes.removed},
+                      separators=(',', ':'))
+    return head[:-1] + ',"changed":' + dumps_list(changes.changed) + '}'
+
+
+@api.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Aenderungen an Geraeten und Energie-Quellen seit `since`
+    
+    Query: since=<version> (aus der letzten Antwort), epoch=<epoch> (optional).
+    Je Bereich kommen nur geaenderte/entfernte Eintraege - oder mit
+    `full: true` der komplette Stand, wenn `since` zu alt ist oder aus
+    einer anderen Epoche (Neustart) stammt.
+    """
+    try:
+        from webui.api_energy import energy_manager
+        
+        since = request.args.get('since', -1, type=int)
+        if request.args.get('epoch', EPOCH) != EPOCH:
+            since = -1
+        
+        # Vor den Snapshots lesen: spaetere Aenderungen kommen beim naechsten Abruf (ggf. doppelt)
+        version = published_version()
+        parts = {'devices': device_manager.changes_since(since)}
+        if energy_manager is not None:
+            parts['sources'] = energy_manager.changes_since(since)
+        
+        head = json.dumps({'success': True, 'epoch': EPOCH, 'version': version}, separators=(',', ':'))
+        body = head[:-1] + ''.join(f',"{name}":{_changes_json(changes)}' for name, changes in parts.items()) + '}'
+        return Response(body, mimetype='application/json')
+    except Exception as e:
+        logger.error(f"Failed to get changes: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============================================================================
 # Device Types & Categories
 # ============================================================================
@@ -485,8 +613,12 @@ def get_device_types():
     types = [
         {'value': 'shelly_plug', 'label': 'Shelly Plug'},
         {'value': 'shelly_1pm', 'label': 'Shelly 1PM'},
+        {'value': 'shelly_25', 'label': 'Shelly 2.5'},
         {'value': 'shelly_plus_1pm', 'label': 'Shelly Plus 1PM'},
+        {'value': 'shelly_plus_2pm', 'label': 'Shelly Plus 2PM'},
         {'value': 'shelly_pro_1pm', 'label': 'Shelly Pro 1PM'},
+        {'value': 'shelly_pro_2pm', 'label': 'Shelly Pro 2PM'},
+        {'value': 'shelly_pro_4pm', 'label': 'Shelly Pro 4PM'},
         {'value': 'shelly_pro_3em', 'label': 'Shelly Pro 3EM'},
         {'value': 'solax', 'label': 'Solax Inverter'},
         {'value': 'sdm630', 'label': 'SDM630 Meter'},
@@ -3,7 +3,11 @@
 EMS-Core v2.0 - Web UI
 Flask Application mit Device & Energy Management
 """
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from flask import Flask, render_template, jsonify
+import atexit
 import logging
 import sys
 from pathlib import Path
@@ -11,6 +15,11 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from core.device_manager import DeviceManager
+from core.device_store import open_device_store
+from core.integrations.discovery import DeviceDiscovery
+from core.utils.async_bridge import get_bridge
+from core.utils.config_snapshot import ConfigSnapshot, StartupTimer
+from core.utils.settings import load_settings
 from webui.api_routes import api, init_api
 
 logging.basicConfig(
@@ -18,27 +27,41 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+startup = StartupTimer(_IMPORT_STARTED)
+startup.mark('imports')
 
 # Flask App
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'ems-core-secret-key'
 
-# Device Manager
-device_manager = DeviceManager()
-init_api(device_manager, None)
+# Hintergrund-Event-Loop fuer alle async Aufrufe aus Flask-Requests
+async_bridge = get_bridge()
+atexit.register(async_bridge.stop)
+
+# Device Manager (gleicher Store wie der EMS-Prozess)
+snapshot = ConfigSnapshot()
+settings = load_settings(snapshot=snapshot)
+startup.mark('settings')
+device_manager = DeviceManager(store=open_device_store(settings.get('device_store'), snapshot=snapshot))
+init_api(device_manager, DeviceDiscovery(), health_export=settings.get('health_export', {}).get('file'))
 app.register_blueprint(api)
+startup.mark('devices')
 
 # Energy Sources Manager
 try:
     from core.energy_sources import EnergySourcesManager
     from webui.api_energy import api_energy, init_energy_api
     
-    energy_manager = EnergySourcesManager(config_file='/opt/ems-core/config/energy_sources.json')
-    init_energy_api(energy_manager)
+    energy_manager = EnergySourcesManager(config_file='/opt/ems-core/config/energy_sources.json',
+                                          snapshot=snapshot)
+    init_energy_api(energy_manager, health_export=settings.get('health_export', {}).get('file'))
     app.register_blueprint(api_energy)
     logger.info("✓ Energy Sources API registered")
 except Exception as e:
     logger.error(f"✗ Failed to load Energy API: {e}")
+startup.mark('energy_sources')
+snapshot.save()
+startup.report(snapshot)
 
 # Routes
 @app.route('/')